@@ -0,0 +1,238 @@
+import threading
+import time
+from commands import ROLE_ADMIN, CommandRegistry
+
+# Команды администратора: статистика, управление пользователями и сервером
+commands = CommandRegistry()
+
+@commands.command('/debug_db', role=ROLE_ADMIN)
+def debug_db(server, client_socket, user_id, username):
+    rooms_count = len(server.rooms)
+    users_count = len(server.get_online_usernames())
+    
+    total_users, total_messages, total_private = server.db.get_totals()
+    
+    with server.lock:
+        connections = list(server.clients.keys())
+    queued_bytes = sum(conn.outbound.queued_bytes for conn in connections)
+    peak_bytes = max((conn.outbound.peak_bytes for conn in connections), default=0)
+    stats = server.outbound_stats
+    auth_stats = server.auth_pool.stats
+    auth_wait, auth_hash = auth_stats.averages()
+    pool = server.db.pool
+    pool_stats = pool.stats
+    
+    info = (
+        f"Информация о базе данных:\n"
+        f"Пользователей в базе: {total_users}\n"
+        f"Пользователей онлайн: {users_count}\n"
+        f"Комнат: {rooms_count}\n"
+        f"Сообщений в чатах: {total_messages}\n"
+        f"Приватных сообщений: {total_private}\n"
+        f"В очередях отправки: {queued_bytes} байт (пик на клиента: {peak_bytes})\n"
+        f"Отброшено сообщений: {stats.dropped_messages} ({stats.dropped_bytes} байт)\n"
+        f"Отключено медленных клиентов: {stats.evicted_clients}\n"
+        f"Авторизаций в очереди: {server.auth_pool.pending}/{server.auth_pool.max_pending}, "
+        f"выполнено: {auth_stats.completed}\n"
+        f"Ожидание в очереди авторизации: {auth_wait * 1000:.1f} мс "
+        f"(макс. {auth_stats.queue_wait_max * 1000:.1f})\n"
+        f"Время хеширования: {auth_hash * 1000:.1f} мс "
+        f"(макс. {auth_stats.hash_time_max * 1000:.1f})\n"
+        f"Отказов 'сервер занят': {auth_stats.rejected}, таймаутов: {auth_stats.timeouts}\n"
+        f"Открытых подключений: {len(server.get_connections())}, отправлено ping: "
+        f"{server.reaper.stats.pings_sent}\n"
+        f"Отключено мертвых подключений: {server.reaper.stats.reaped_idle} по тишине, "
+        f"{server.reaper.stats.reaped_login} без входа\n"
+        f"Журнал базы: {pool.journal_mode}, версия схемы: {server.db.schema_version}, "
+        f"соединений на чтение: {pool.size}\n"
+        f"Чтений: {pool_stats.reads}, ждали соединения: {pool_stats.read_waits} "
+        f"(всего {pool_stats.read_wait_time * 1000:.1f} мс, макс. {pool_stats.read_wait_max * 1000:.1f})\n"
+        f"Записей: {pool_stats.writes}, ждали писателя: {pool_stats.write_waits} "
+        f"(всего {pool_stats.write_wait_time * 1000:.1f} мс, макс. {pool_stats.write_wait_max * 1000:.1f})\n"
+    )
+    cached_rooms, cached_bytes = server.history_cache.snapshot()
+    history_stats = server.history_cache.stats
+    info += (
+        f"Кеш истории: комнат {cached_rooms}, {cached_bytes} из {server.history_cache.max_bytes} байт, "
+        f"попаданий {history_stats.hits}, промахов {history_stats.misses} "
+        f"({history_stats.hit_rate() * 100:.0f}%), вытеснено {history_stats.evictions}\n"
+    )
+    user_stats = server.db.users.stats
+    info += (
+        f"Кеш пользователей: {len(server.db.users)} из {server.db.users.max_size}, "
+        f"попаданий {user_stats.hits}, промахов {user_stats.misses} "
+        f"({user_stats.hit_rate() * 100:.0f}%), вытеснено {user_stats.evictions}\n"
+    )
+    write_behind = server.db.write_behind
+    if write_behind is not None:
+        write_stats = write_behind.stats
+        info += (
+            f"Отложенная запись ({server.db.durability}): в очереди {write_behind.pending}, "
+            f"пачек {write_stats.batches}, в среднем {write_stats.average_batch():.1f} "
+            f"(макс. {write_stats.max_batch}), ошибок {write_stats.failed}, "
+            f"время commit {write_stats.commit_time * 1000:.1f} мс\n"
+        )
+    archiver_stats = server.archiver.stats
+    db_size, free_pages = server.db.file_size()
+    info += (
+        f"Архивация: проходов {archiver_stats.passes}, перенесено сообщений {archiver_stats.room_messages}, "
+        f"личных {archiver_stats.private_messages}, ошибок {archiver_stats.errors}, "
+        f"последний проход {archiver_stats.last_pass_time:.2f} с\n"
+        f"Размер базы: {db_size // 1024} КБ, свободных страниц {free_pages}, "
+        f"возвращено ОС {archiver_stats.vacuumed_pages}\n"
+    )
+    if server.compression is not None:
+        compression_stats = server.compression.stats
+        info += (
+            f"Сжато кадров: {compression_stats.compressed_frames} "
+            f"({compression_stats.bytes_in} -> {compression_stats.bytes_out} байт, "
+            f"в {compression_stats.ratio():.1f} раза), без сжатия: {compression_stats.raw_frames}\n"
+            f"Время сжатия (CPU): {compression_stats.cpu_time * 1000:.1f} мс\n"
+        )
+    client_socket.send(info.encode('utf-8'))
+
+@commands.command('/admin_stats', role=ROLE_ADMIN)
+def admin_stats(server, client_socket, user_id, username):
+    # Расширенная статистика для админа
+    room_stats = server.db.get_room_stats()
+    user_stats = server.db.get_top_users(10)
+    
+    stats = "=== РАСШИРЕННАЯ СТАТИСТИКА ===\n\n"
+    stats += "📊 Статистика по комнатам:\n"
+    for room_name, count in room_stats:
+        stats += f"  {room_name}: {count} сообщений\n"
+    
+    stats += "\n👥 Активные пользователи:\n"
+    for user, count, last_active in user_stats:
+        stats += f"  {user}: {count} сообщений (активен: {last_active})\n"
+    
+    client_socket.send(stats.encode('utf-8'))
+
+@commands.command('/admin_rebuild_stats', role=ROLE_ADMIN)
+def admin_rebuild_stats(server, client_socket, user_id, username):
+    # Пересчет счетчиков статистики по всем сообщениям (долго на большой базе)
+    start = time.perf_counter()
+    server.db.rebuild_counters()
+    elapsed = time.perf_counter() - start
+    total_users, total_messages, total_private = server.db.get_totals()
+    client_socket.send(
+        f"✅ Счетчики пересчитаны за {elapsed:.2f} с: пользователей {total_users}, "
+        f"сообщений в чатах {total_messages}, приватных {total_private}".encode('utf-8')
+    )
+
+@commands.command('/admin_connections', role=ROLE_ADMIN)
+def admin_connections(server, client_socket, user_id, username):
+    admission = server.admission.snapshot()
+    rejected = admission['rejected']
+    stats = (
+        f"Подключения:\n"
+        f"Открыто: {admission['active']} из {server.admission.max_connections}, "
+        f"очередь accept: {server.backlog}\n"
+        f"Принято: {admission['accepted']}, отклонено: {sum(rejected.values())} "
+        f"(сервер полон: {rejected['full']}, лимит на IP: {rejected['ip_limit']}, "
+        f"частота с IP: {rejected['ip_rate']})\n"
+        f"Лимиты на IP: {server.admission.max_per_ip} одновременно, "
+        f"{server.admission.ip_rate:g}/с (запас {server.admission.ip_burst})\n"
+    )
+    for ip, count in admission['top_ips']:
+        stats += f"  {ip}: {count}\n"
+    client_socket.send(stats.encode('utf-8'))
+
+@commands.command('/admin_commands', role=ROLE_ADMIN)
+def admin_commands(server, client_socket, user_id, username):
+    stats = "Команды (время выполнения, мс):\n"
+    for name, command_stats in server.commands.snapshot():
+        average = command_stats.total_time / command_stats.calls
+        stats += (
+            f"{name}: {command_stats.calls} вызовов, ошибок {command_stats.errors}, "
+            f"среднее {average * 1000:.2f}, p50 ≤ {command_stats.percentile(0.5) * 1000:.2f}, "
+            f"p99 ≤ {command_stats.percentile(0.99) * 1000:.2f}, макс {command_stats.max_time * 1000:.2f}\n"
+        )
+    client_socket.send(stats.encode('utf-8'))
+
+@commands.command('/admin_restart', role=ROLE_ADMIN)
+def admin_restart(server, client_socket, user_id, username):
+    success, message = server.restart_server()
+    prefix = "✅" if success else "❌"
+    client_socket.send(f"{prefix} {message}".encode('utf-8'))
+    if success:
+        threading.Thread(target=server.drain_and_exit, daemon=True).start()
+
+@commands.command('/admin_broadcast', min_args=1, max_args=1, rest=True, role=ROLE_ADMIN,
+                  usage="/admin_broadcast <сообщение>")
+def admin_broadcast(server, client_socket, user_id, username, message):
+    # Рассылка системного сообщения всем пользователям
+    server.broadcast_system(f"📢 АДМИНИСТРАТОР: {message}")
+    client_socket.send("✅ Системное сообщение отправлено".encode('utf-8'))
+
+@commands.command('/admin_kick', min_args=1, role=ROLE_ADMIN, usage="/admin_kick <user>")
+def admin_kick(server, client_socket, user_id, username, target_username):
+    # Отключение пользователя
+    with server.lock:
+        target_socket = server.username_to_socket.get(target_username)
+        target_data = server.clients.get(target_socket)
+    
+    if target_socket:
+        try:
+            # Иначе клиент сразу вернется по токену /resume
+            if target_data is not None:
+                server.revoke_sessions(target_data['user_id'])
+            target_socket.send("🔒 Вы были отключены администратором".encode('utf-8'))
+            server.remove_client(target_socket)
+            client_socket.send(f"✅ Пользователь {target_username} отключен".encode('utf-8'))
+        except:
+            client_socket.send(f"❌ Ошибка при отключении пользователя".encode('utf-8'))
+
+@commands.command('/admin_retention', max_args=2, role=ROLE_ADMIN, usage="/admin_retention [room] [дней|off]")
+def admin_retention(server, client_socket, user_id, username, room_name=None, keep_days=None):
+    # Просмотр и изменение сроков хранения сообщений комнат
+    if room_name is not None:
+        if room_name not in server.rooms:
+            client_socket.send(f"❌ Комната {room_name} не найдена".encode('utf-8'))
+            return
+        if keep_days is None or not (keep_days == 'off' or keep_days.isdigit() and int(keep_days) > 0):
+            client_socket.send("Использование: /admin_retention <room> <дней|off>".encode('utf-8'))
+            return
+        server.db.set_retention(server.rooms[room_name], None if keep_days == 'off' else int(keep_days))
+    
+    policies = server.db.get_retention_policies()
+    reply = "Сроки хранения сообщений:\n"
+    for room_id, days in policies:
+        reply += f"{server.get_room_name(room_id)}: {days} дн.\n"
+    if not policies:
+        reply += "Все комнаты хранятся без ограничения срока\n"
+    if server.archiver.private_keep_days is not None:
+        reply += f"Прочитанные личные сообщения: {server.archiver.private_keep_days} дн.\n"
+    client_socket.send(reply.encode('utf-8'))
+
+@commands.command('/admin_archive', role=ROLE_ADMIN)
+def admin_archive(server, client_socket, user_id, username):
+    # Внеочередной проход архивации (в фоне: на большой базе это долго)
+    def run():
+        start = time.perf_counter()
+        stats = server.archiver.stats
+        rooms_before, private_before = stats.room_messages, stats.private_messages
+        if not server.archiver.run_once():
+            client_socket.send("❌ Архивация уже выполняется".encode('utf-8'))
+            return
+        client_socket.send(
+            f"✅ Архивация завершена за {time.perf_counter() - start:.2f} с: сообщений комнат "
+            f"{stats.room_messages - rooms_before}, личных {stats.private_messages - private_before}".encode('utf-8')
+        )
+    
+    threading.Thread(target=run, daemon=True).start()
+
+@commands.command('/admin_compact', role=ROLE_ADMIN)
+def admin_compact(server, client_socket, user_id, username):
+    # Полный VACUUM: включает возврат места после архивации в базах, созданных без него
+    size_before, _ = server.db.file_size()
+    start = time.perf_counter()
+    incremental = server.db.compact()
+    size_after, _ = server.db.file_size()
+    reply = (
+        f"✅ База сжата за {time.perf_counter() - start:.2f} с: "
+        f"{size_before // 1024} КБ -> {size_after // 1024} КБ"
+    )
+    if not incremental:
+        reply += "\n❌ Не удалось включить auto_vacuum=INCREMENTAL: база занята другим процессом"
+    client_socket.send(reply.encode('utf-8'))
@@ -1,3 +1,4 @@
+import argparse
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import socket
@@ -5,19 +6,26 @@ import threading
 import json
 import time
 from datetime import datetime
+from messages import render_typed
+from protocol import ClientProtocol, connect_socket, MSG_ROOMS, MSG_USERS
 
 class AdminControlPanel:
-    def __init__(self):
+    def __init__(self, host='localhost', port=5555, socket_path=None):
         self.root = tk.Tk()
         self.root.title("Административная панель - Мессенджер")
         self.root.geometry("1000x700")
         self.root.configure(bg='#1e1e1e')
         
         # Переменные
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
         self.socket = None
+        self.protocol = None
         self.connected = False
         self.username = "admin"
         self.server_stats = {}
+        self.session_token = None
         
         # Создаем интерфейс
         self.create_login_frame()
@@ -143,6 +151,8 @@ class AdminControlPanel:
         actions = [
             ("📊 Обновить статистику", self.refresh_stats),
             ("👥 Список пользователей", self.refresh_users),
+            ("⏱ Время команд", self.refresh_command_stats),
+            ("🧮 Пересчитать счетчики", self.rebuild_stats),
             ("📢 Системное сообщение", self.send_system_message),
             ("🔄 Перезагрузить сервер", self.restart_server),
             ("🚪 Выключить сервер", self.shutdown_server)
@@ -475,8 +485,9 @@ class AdminControlPanel:
     def connect_to_server(self):
         """Подключение к серверу"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect(('localhost', 5555))
+            self.socket = connect_socket(self.host, self.port, self.socket_path)
+            self.protocol = ClientProtocol(self.socket, binary=True, compress=True)
+            self.protocol.handshake()
             self.connected = True
             self.status_label.config(text="Подключено", fg='green')
             
@@ -502,18 +513,19 @@ class AdminControlPanel:
         
         # Отправляем команду входа
         command = f"/login {self.username} {password}"
-        self.socket.send(command.encode('utf-8'))
+        self.protocol.send(command)
     
     def logout(self):
         """Выход из системы"""
         if self.socket:
             try:
-                self.socket.send("/exit".encode('utf-8'))
+                self.protocol.send("/exit")
                 self.socket.close()
             except:
                 pass
         
         self.connected = False
+        self.session_token = None
         self.stop_monitoring()
         self.show_login()
     
@@ -521,12 +533,13 @@ class AdminControlPanel:
         """Получение сообщений от сервера"""
         while self.connected:
             try:
-                data = self.socket.recv(4096).decode('utf-8')
-                if not data:
+                messages = self.protocol.receive()
+                if messages is None:
                     break
                 
-                # Обрабатываем сообщение в основном потоке
-                self.root.after(0, self.process_message, data)
+                # Обрабатываем сообщения в основном потоке
+                for message in messages:
+                    self.root.after(0, self.process_message, message)
                 
             except Exception as e:
                 if self.connected:
@@ -534,16 +547,67 @@ class AdminControlPanel:
                 break
         
         if self.connected:
-            self.root.after(0, self.logout)
+            self.root.after(0, self.reconnect)
+    
+    def reconnect(self):
+        """Возврат в сессию по токену (например, после перезапуска сервера)"""
+        if not self.session_token:
+            self.logout()
+            return
+        
+        self.connected = False
+        self.status_label.config(text="Переподключение...", fg='orange')
+        threading.Thread(target=self.resume_session, daemon=True).start()
+    
+    def resume_session(self):
+        """Попытки переподключения с нарастающей паузой (в фоновом потоке)"""
+        delay = 0.5
+        for _ in range(5):
+            try:
+                sock = connect_socket(self.host, self.port, self.socket_path)
+                protocol = ClientProtocol(sock, binary=True, compress=True)
+                protocol.handshake()
+                protocol.send(f"/resume {self.session_token}")
+            except OSError:
+                time.sleep(delay)
+                delay *= 2
+                continue
+            
+            self.root.after(0, self.on_resumed, sock, protocol)
+            return
+        
+        self.root.after(0, self.logout)
+    
+    def on_resumed(self, sock, protocol):
+        """Соединение восстановлено"""
+        self.socket = sock
+        self.protocol = protocol
+        self.connected = True
+        self.status_label.config(text="Подключено", fg='green')
+        
+        receive_thread = threading.Thread(target=self.receive_messages, daemon=True)
+        receive_thread.start()
     
     def process_message(self, message):
         """Обработка полученного сообщения"""
-        if message == "Успешный вход!":
+        if not isinstance(message, str):
+            self.process_typed(*message)
+        
+        elif message == "Успешный вход!":
             self.show_admin_panel()
             self.refresh_stats()
             self.refresh_users()
             self.refresh_rooms()
         
+        elif message.startswith("Токен сессии:"):
+            self.session_token = message.split(":", 1)[1].strip()
+        
+        elif message.startswith("Сессия восстановлена!"):
+            self.add_to_logs("[АДМИН] Соединение с сервером восстановлено")
+            self.refresh_stats()
+            self.refresh_users()
+            self.refresh_rooms()
+        
         elif message.startswith("Ошибка:"):
             messagebox.showerror("Ошибка", message)
             if self.socket:
@@ -551,9 +615,12 @@ class AdminControlPanel:
             self.connected = False
             self.status_label.config(text="Не подключено", fg='red')
         
-        elif message.startswith("Информация о базе данных:"):
+        elif message.startswith("Информация о базе данных:") or message.startswith("Команды ("):
             self.display_stats(message)
         
+        elif message.startswith("Подключения:"):
+            self.realtime_stats.config(text=message)
+        
         elif message.startswith("Пользователи онлайн:"):
             self.update_users_list(message)
         
@@ -563,6 +630,16 @@ class AdminControlPanel:
         else:
             self.add_to_logs(message)
     
+    def process_typed(self, kind, value):
+        """Обработка двоичного сообщения (протокол версии 3)"""
+        if kind == MSG_USERS and not value[0]:
+            self.set_users_list(value[1])
+        elif kind == MSG_ROOMS:
+            self.set_rooms_list(value)
+        else:
+            # Остальное (чат, ЛС, уведомления) панель только записывает в лог
+            self.add_to_logs(render_typed(kind, value))
+    
     def display_stats(self, stats):
         """Отображение статистики"""
         self.metrics_text.config(state='normal')
@@ -572,25 +649,27 @@ class AdminControlPanel:
         self.metrics_text.config(state='disabled')
     
     def update_users_list(self, message):
-        """Обновление списка пользователей"""
-        self.users_listbox.delete(0, tk.END)
-        
+        """Обновление списка пользователей из текстового ответа"""
         lines = message.split('\n')[1:]
-        for line in lines:
-            if line.startswith('- '):
-                username = line[2:].strip()
-                if username != self.username:
-                    self.users_listbox.insert(tk.END, username)
+        self.set_users_list(line[2:].strip() for line in lines if line.startswith('- '))
+    
+    def set_users_list(self, usernames):
+        """Заполнение списка пользователей"""
+        self.users_listbox.delete(0, tk.END)
+        for username in usernames:
+            if username != self.username:
+                self.users_listbox.insert(tk.END, username)
     
     def update_rooms_list(self, message):
-        """Обновление списка комнат"""
-        self.rooms_listbox.delete(0, tk.END)
-        
+        """Обновление списка комнат из текстового ответа"""
         lines = message.split('\n')[1:]
-        for line in lines:
-            if line.startswith('- '):
-                room_name = line[2:].strip()
-                self.rooms_listbox.insert(tk.END, room_name)
+        self.set_rooms_list(line[2:].strip() for line in lines if line.startswith('- '))
+    
+    def set_rooms_list(self, room_names):
+        """Заполнение списка комнат"""
+        self.rooms_listbox.delete(0, tk.END)
+        for room_name in room_names:
+            self.rooms_listbox.insert(tk.END, room_name)
     
     def add_to_logs(self, message):
         """Добавление сообщения в логи"""
@@ -603,17 +682,27 @@ class AdminControlPanel:
     def refresh_stats(self):
         """Обновление статистики"""
         if self.connected:
-            self.socket.send("/debug_db".encode('utf-8'))
+            self.protocol.send("/debug_db")
+    
+    def refresh_command_stats(self):
+        """Число вызовов и время выполнения команд сервера"""
+        if self.connected:
+            self.protocol.send("/admin_commands")
+    
+    def rebuild_stats(self):
+        """Пересчет счетчиков статистики на сервере"""
+        if self.connected:
+            self.protocol.send("/admin_rebuild_stats")
     
     def refresh_users(self):
         """Обновление списка пользователей"""
         if self.connected:
-            self.socket.send("/users".encode('utf-8'))
+            self.protocol.send("/users")
     
     def refresh_rooms(self):
         """Обновление списка комнат"""
         if self.connected:
-            self.socket.send("/rooms".encode('utf-8'))
+            self.protocol.send("/rooms")
     
     def refresh_logs(self):
         """Обновление логов (заглушка)"""
@@ -659,7 +748,7 @@ class AdminControlPanel:
         username = self.users_listbox.get(selection[0])
         message = tk.simpledialog.askstring("Сообщение пользователю", f"Сообщение для {username}:")
         if message and self.connected:
-            self.socket.send(f"/msg {username} {message}".encode('utf-8'))
+            self.protocol.send(f"/msg {username} {message}")
     
     def disconnect_user(self):
         """Отключение пользователя"""
@@ -703,7 +792,7 @@ class AdminControlPanel:
             return
         
         if self.connected:
-            self.socket.send(f"/create {room_name}".encode('utf-8'))
+            self.protocol.send(f"/create {room_name}")
             self.new_room_entry.delete(0, tk.END)
     
     def delete_room(self):
@@ -724,9 +813,13 @@ class AdminControlPanel:
     
     def restart_server(self):
         """Перезагрузка сервера"""
-        if messagebox.askyesno("Подтверждение", "Перезагрузить сервер?\nВсе пользователи будут отключены."):
+        if messagebox.askyesno(
+            "Подтверждение",
+            "Перезагрузить сервер?\nНовый процесс примет порт, пользователи переподключатся автоматически."
+        ):
             self.add_to_logs("[АДМИН] Запрос на перезагрузку сервера")
-            # Здесь должна быть реализация перезагрузки сервера
+            if self.connected:
+                self.protocol.send("/admin_restart")
     
     def shutdown_server(self):
         """Выключение сервера"""
@@ -748,6 +841,10 @@ class AdminControlPanel:
         if self.connected:
             current_time = datetime.now().strftime('%H:%M:%S')
             self.server_info_label.config(text=f"Сервер: Подключено | Время: {current_time}")
+            
+            # Допуск подключений (принято/отклонено, лимиты) раз в 5 секунд
+            if datetime.now().second % 5 == 0:
+                self.protocol.send("/admin_connections")
         
         # Планируем следующее обновление через 1 секунду
         self.monitor_job = self.root.after(1000, self.update_server_info)
@@ -757,5 +854,11 @@ class AdminControlPanel:
         self.root.mainloop()
 
 if __name__ == "__main__":
-    admin_panel = AdminControlPanel()
+    parser = argparse.ArgumentParser(description="Административная панель мессенджера")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--socket', metavar='PATH', help="подключаться через Unix-сокет сервера")
+    args = parser.parse_args()
+    
+    admin_panel = AdminControlPanel(args.host, args.port, args.socket)
     admin_panel.run()
\ No newline at end of file
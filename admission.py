@@ -0,0 +1,107 @@
+import threading
+import time
+
+DEFAULT_BACKLOG = 128
+DEFAULT_MAX_CONNECTIONS = 10000
+DEFAULT_MAX_PER_IP = 50
+DEFAULT_IP_RATE = 5.0
+DEFAULT_IP_BURST = 20
+
+# Адрес подключений через Unix-сокет: учитываются в общем лимите, но без лимитов на IP
+LOCAL_PEER = 'unix'
+
+# Короткий ответ при отказе: отправляется без очереди и без потока-обработчика
+REJECT_REPLIES = {
+    'full': "Сервер перегружен, попробуйте позже\n",
+    'ip_limit': "Слишком много подключений с вашего адреса\n",
+    'ip_rate': "Слишком частые подключения, попробуйте позже\n",
+}
+
+class AdmissionController:
+    """Допуск новых подключений до запуска обработчика.
+    
+    Ограничивает общее число подключений, число одновременных подключений
+    с одного IP и частоту новых подключений с одного IP (token bucket:
+    ip_rate в секунду, запас ip_burst).
+    """
+    
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, max_per_ip=DEFAULT_MAX_PER_IP,
+                 ip_rate=DEFAULT_IP_RATE, ip_burst=DEFAULT_IP_BURST):
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.lock = threading.Lock()
+        self.active = 0
+        self.per_ip = {}
+        self.buckets = {}
+        self.accepted = 0
+        self.rejected = {reason: 0 for reason in REJECT_REPLIES}
+    
+    def admit(self, ip):
+        """Попытка занять место под подключение. Возвращает (True, None) или (False, причина)"""
+        now = time.monotonic()
+        with self.lock:
+            if self.active >= self.max_connections:
+                return self._reject('full')
+            if ip == LOCAL_PEER:
+                self.active += 1
+                self.accepted += 1
+                return True, None
+            if self.per_ip.get(ip, 0) >= self.max_per_ip:
+                return self._reject('ip_limit')
+            if not self._take_token(ip, now):
+                return self._reject('ip_rate')
+            
+            self.active += 1
+            self.per_ip[ip] = self.per_ip.get(ip, 0) + 1
+            self.accepted += 1
+            return True, None
+    
+    def release(self, ip):
+        """Освобождение места после закрытия подключения"""
+        with self.lock:
+            self.active = max(0, self.active - 1)
+            if ip == LOCAL_PEER:
+                return
+            count = self.per_ip.get(ip, 0) - 1
+            if count > 0:
+                self.per_ip[ip] = count
+            else:
+                self.per_ip.pop(ip, None)
+    
+    def _take_token(self, ip, now):
+        """Token bucket на IP (вызывать под self.lock)"""
+        tokens, updated = self.buckets.get(ip, (self.ip_burst, now))
+        tokens = min(self.ip_burst, tokens + (now - updated) * self.ip_rate)
+        if tokens < 1:
+            self.buckets[ip] = (tokens, now)
+            return False
+        self.buckets[ip] = (tokens - 1, now)
+        
+        # Полные корзины ничего не помнят - не даем словарю расти бесконечно
+        if len(self.buckets) > 4 * self.max_connections:
+            self._prune_buckets(now)
+        return True
+    
+    def _prune_buckets(self, now):
+        refill_time = self.ip_burst / self.ip_rate if self.ip_rate else 0
+        self.buckets = {
+            ip: (tokens, updated) for ip, (tokens, updated) in self.buckets.items()
+            if now - updated < refill_time
+        }
+    
+    def _reject(self, reason):
+        self.rejected[reason] += 1
+        return False, reason
+    
+    def snapshot(self):
+        """Текущее состояние для статистики"""
+        with self.lock:
+            top_ips = sorted(self.per_ip.items(), key=lambda item: item[1], reverse=True)[:5]
+            return {
+                'active': self.active,
+                'accepted': self.accepted,
+                'rejected': dict(self.rejected),
+                'top_ips': top_ips,
+            }
@@ -0,0 +1,261 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from admission import LOCAL_PEER, REJECT_REPLIES
+from connection import CLOSE_FLUSH_TIMEOUT, ClientConnection
+from outbound import DEFAULT_MAX_QUEUE_BYTES, POLICY_EVICT
+from server import AuthChatServer
+
+class AsyncClientConnection(ClientConnection):
+    """Подключение asyncio с интерфейсом сокета (send/close) для обработчиков сервера.
+    
+    Очередь отправки разбирает корутина-писатель; send() можно вызывать из любого потока.
+    """
+    
+    def __init__(self, loop, reader, writer, max_queue_bytes=DEFAULT_MAX_QUEUE_BYTES,
+                 overflow_policy=POLICY_EVICT, stats=None, compression=None, address=None):
+        super().__init__(
+            address or writer.get_extra_info('peername'), max_queue_bytes, overflow_policy, stats,
+            compression
+        )
+        self.loop = loop
+        self.reader = reader
+        self.writer = writer
+        self.wakeup = asyncio.Event()
+        self.writer_task = loop.create_task(self._writer_loop())
+    
+    async def _writer_loop(self):
+        """Отправка очереди клиенту с учетом буфера транспорта (drain)"""
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                
+                batch = self.outbound.get_batch(block=False)
+                if batch:
+                    size = sum(len(buffer) for buffer in batch)
+                    self.writer.writelines(batch)
+                    await self.writer.drain()
+                    self.outbound.mark_sent(size)
+                
+                if self.outbound.closed and not self.outbound.buffers:
+                    break
+        except (ConnectionError, OSError):
+            self.outbound.close(discard=True)
+        finally:
+            self.writer.close()
+    
+    def wake_writer(self):
+        if self._in_loop_thread():
+            self.wakeup.set()
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+    
+    async def receive(self, bufsize=4096):
+        """Чтение из потока. Возвращает список сообщений или None при закрытии"""
+        raw_data = await self.reader.read(bufsize)
+        if not raw_data:
+            return None
+        return self.parse(raw_data)
+    
+    def close(self):
+        """Закрытие подключения после отправки очереди"""
+        if self.closed:
+            return
+        self.closed = True
+        self.outbound.close()
+        self.wake_writer()
+        
+        if self.outbound.queued_bytes and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.call_later, CLOSE_FLUSH_TIMEOUT, self.abort)
+    
+    def abort(self):
+        """Обрыв подключения"""
+        self.closed = True
+        self.outbound.close(discard=True)
+        if self.loop.is_closed():
+            return
+        if self._in_loop_thread():
+            self.writer.transport.abort()
+        else:
+            self.loop.call_soon_threadsafe(self.writer.transport.abort)
+    
+    def _in_loop_thread(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+class AsyncChatServer(AuthChatServer):
+    """Сервер на цикле событий asyncio: одна корутина на подключение вместо потока.
+    
+    Команды и работа с Database/Validator те же, что у AuthChatServer;
+    блокирующие вызовы (SQLite, bcrypt) выполняются в пуле потоков.
+    """
+    
+    def __init__(self, host='localhost', port=5555, max_workers=32, backlog=1024, **kwargs):
+        super().__init__(host, port, backlog=backlog, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chat-worker')
+        self.loop = None
+        self.async_server = None
+        self.unix_server = None
+    
+    def start_server(self):
+        """Запуск сервера"""
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            print(f"Ошибка сервера: {e}")
+        finally:
+            self.stop_server()
+    
+    async def serve(self):
+        """Основной цикл асинхронного сервера"""
+        self.loop = asyncio.get_running_loop()
+        self.raise_fd_limit()
+        
+        if self.takeover:
+            self.take_over_listener()
+            self.async_server = await asyncio.start_server(self.handle_connection, sock=self.server_socket)
+        else:
+            self.async_server = await asyncio.start_server(
+                self.handle_connection, self.host, self.port, backlog=self.backlog,
+                reuse_port=self.reuse_port or None
+            )
+        if self.unix_path:
+            if self.unix_socket is None:
+                self.unix_socket = self.open_unix_listener()
+            self.unix_server = await asyncio.start_unix_server(self.handle_connection, sock=self.unix_socket)
+        print(f"Сервер (asyncio) запущен на {self.host}:{self.port}")
+        if self.unix_server is not None:
+            print(f"Локальные подключения: {self.unix_path}")
+        print("Ожидание подключений...")
+        self.reaper.start()
+        self.archiver.start()
+        
+        try:
+            async with self.async_server:
+                await self.async_server.serve_forever()
+        except asyncio.CancelledError:
+            if self.handoff is None:
+                raise
+            # Порт передан новому процессу: цикл событий нужен до выхода из drain_and_exit
+            await asyncio.Event().wait()
+        finally:
+            # Пока цикл событий жив, уведомление об остановке еще дойдет до клиентов;
+            # повторный вызов из start_server() уже ничего не сделает
+            self.stop_server()
+    
+    def raise_fd_limit(self):
+        """Поднятие лимита открытых файлов до максимума, чтобы держать тысячи подключений"""
+        if resource is None:
+            return
+        try:
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            if soft < hard:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+    
+    def run_blocking(self, func, *args):
+        """Выполнение блокирующего вызова (БД, bcrypt) в пуле потоков"""
+        return self.loop.run_in_executor(self.executor, func, *args)
+    
+    def get_listening_sockets(self):
+        sockets = [self.async_server.sockets[0]]
+        if self.unix_server is not None:
+            sockets.append(self.unix_server.sockets[0])
+        return sockets
+    
+    def drain_and_exit(self):
+        # Закрытие своих копий слушающих сокетов: очереди accept остаются у нового процесса
+        self.loop.call_soon_threadsafe(self.async_server.close)
+        if self.unix_server is not None:
+            self.loop.call_soon_threadsafe(self.unix_server.close)
+        super().drain_and_exit()
+    
+    def adopt_connection(self, client_socket, address):
+        """Подключение, принятое старым процессом уже после передачи порта"""
+        asyncio.run_coroutine_threadsafe(self.adopt(client_socket), self.loop)
+    
+    async def adopt(self, client_socket):
+        reader, writer = await asyncio.open_connection(sock=client_socket)
+        await self.handle_connection(reader, writer)
+    
+    async def handle_connection(self, reader, writer):
+        """Обработка подключения: аутентификация и сообщения"""
+        # У подключений через Unix-сокет peername пустой
+        address = writer.get_extra_info('peername') or (LOCAL_PEER, self.unix_path)
+        allowed, reason = self.admission.admit(address[0])
+        if not allowed:
+            # Дешевый отказ: без очереди отправки и без задач в пуле
+            writer.write(REJECT_REPLIES[reason].encode('utf-8'))
+            writer.close()
+            return
+        
+        client_socket = self.track_connection(AsyncClientConnection(
+            self.loop, reader, writer, self.max_queue_bytes, self.overflow_policy, self.outbound_stats,
+            self.compression, address
+        ))
+        print(f"Новое подключение: {client_socket.address}")
+        
+        try:
+            user_id = None
+            username = None
+            messages = []
+            
+            self.send_auth_menu(client_socket)
+            while user_id is None:
+                messages = await client_socket.receive()
+                if messages is None:
+                    return
+                
+                while messages and user_id is None:
+                    data = messages.pop(0).strip()
+                    
+                    if data == '/exit':
+                        return
+                    
+                    result = await self.run_blocking(self.process_auth_command, client_socket, data)
+                    if result:
+                        user_id, username, room_id = result
+                    else:
+                        self.send_auth_menu(client_socket)
+            
+            await self.run_blocking(self.register_client, client_socket, user_id, username, room_id)
+            self.send_command_help(client_socket)
+            
+            while messages is not None:
+                for data in messages:
+                    data = data.strip()
+                    if data:
+                        await self.run_blocking(
+                            self.process_client_message, client_socket, user_id, username, data
+                        )
+                
+                messages = await client_socket.receive()
+        
+        except asyncio.CancelledError:
+            # asyncio.run() отменяет задачи подключений при остановке сервера
+            pass
+        except Exception as e:
+            if not client_socket.closed:
+                print(f"Ошибка обработки подключения: {e}")
+        finally:
+            # После stop_server() клиентов уже нет, а пул потоков закрыт
+            if not self.stopped:
+                await self.run_blocking(self.remove_client, client_socket)
+    
+    def stop_server(self):
+        """Остановка сервера"""
+        if self.async_server is not None:
+            self.async_server.close()
+        if self.unix_server is not None:
+            self.unix_server.close()
+        super().stop_server()
+        self.executor.shutdown(wait=False)
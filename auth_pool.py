@@ -0,0 +1,136 @@
+import multiprocessing
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+
+DEFAULT_AUTH_WORKERS = 2
+DEFAULT_AUTH_QUEUE_LIMIT = 64
+DEFAULT_AUTH_TIMEOUT = 10.0
+
+class AuthBusyError(Exception):
+    """Очередь проверки паролей заполнена"""
+
+class AuthTimeoutError(Exception):
+    """Проверка пароля не уложилась в отведенное время"""
+
+def _ignore_sigint():
+    """Выполняется в процессе пула при запуске: Ctrl+C обрабатывает только сервер"""
+    # Сигнал терминала получает вся группа процессов; воркеры завершит shutdown()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _hash_password(password):
+    """Выполняется в процессе пула: хеширование пароля"""
+    start = time.perf_counter()
+    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return password_hash, time.perf_counter() - start
+
+def _check_password(password, password_hash):
+    """Выполняется в процессе пула: сверка пароля с хешем"""
+    start = time.perf_counter()
+    if isinstance(password_hash, str):
+        password_hash = password_hash.encode('utf-8')
+    matches = bcrypt.checkpw(password.encode('utf-8'), password_hash)
+    return matches, time.perf_counter() - start
+
+class AuthStats:
+    """Счетчики пула авторизации: ожидание в очереди и время хеширования"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.hash_time_total = 0.0
+        self.hash_time_max = 0.0
+    
+    def record(self, queue_wait, hash_time):
+        with self.lock:
+            self.completed += 1
+            self.queue_wait_total += queue_wait
+            self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+            self.hash_time_total += hash_time
+            self.hash_time_max = max(self.hash_time_max, hash_time)
+    
+    def record_reject(self):
+        with self.lock:
+            self.rejected += 1
+    
+    def record_timeout(self):
+        with self.lock:
+            self.timeouts += 1
+    
+    def averages(self):
+        """Среднее ожидание в очереди и среднее время хеширования, секунды"""
+        with self.lock:
+            if not self.completed:
+                return 0.0, 0.0
+            return self.queue_wait_total / self.completed, self.hash_time_total / self.completed
+
+class AuthPool:
+    """Ограниченный пул процессов для bcrypt.
+    
+    Хеширование не занимает потоки обработки сообщений и не может
+    загрузить больше workers ядер. Если в очереди уже max_pending
+    запросов, новый сразу отклоняется с AuthBusyError.
+    """
+    
+    def __init__(self, workers=DEFAULT_AUTH_WORKERS, max_pending=DEFAULT_AUTH_QUEUE_LIMIT,
+                 timeout=DEFAULT_AUTH_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.stats = AuthStats()
+        self.lock = threading.Lock()
+        self.pending = 0
+        # spawn: форк процесса с потоками сервера небезопасен
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_ignore_sigint
+        )
+    
+    def hash_password(self, password):
+        """Хеш пароля для нового пользователя"""
+        password_hash, _ = self._run(_hash_password, password)
+        return password_hash
+    
+    def check_password(self, password, password_hash):
+        """True, если пароль совпадает с хешем"""
+        matches, _ = self._run(_check_password, password, password_hash)
+        return matches
+    
+    def _run(self, func, *args):
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.stats.record_reject()
+                raise AuthBusyError("Очередь авторизации заполнена")
+            self.pending += 1
+        
+        submitted = time.perf_counter()
+        try:
+            future = self.executor.submit(func, *args)
+        except Exception:
+            self._release(None)
+            raise
+        # Слот освобождается по завершении задачи, даже если клиент уже не ждет
+        future.add_done_callback(self._release)
+        
+        try:
+            result, hash_time = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            self.stats.record_timeout()
+            raise AuthTimeoutError("Превышено время проверки пароля")
+        
+        total = time.perf_counter() - submitted
+        self.stats.record(max(0.0, total - hash_time), hash_time)
+        return result, hash_time
+    
+    def _release(self, future):
+        with self.lock:
+            self.pending -= 1
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
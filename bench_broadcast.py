@@ -0,0 +1,82 @@
+import time
+import tracemalloc
+
+from connection import ClientConnection
+from protocol import EncodedMessage, encode_frame
+
+ROOM_SIZES = [10, 100, 1000]
+ROUNDS = 20
+MESSAGE = "alice: " + "Привет всем в комнате! " * 8
+
+class BenchConnection(ClientConnection):
+    """Подключение без сокета: данные только копятся в очереди"""
+    
+    def close(self):
+        self.closed = True
+    
+    def abort(self):
+        self.closed = True
+
+def make_room(size, framed):
+    room = []
+    for i in range(size):
+        conn = BenchConnection(address=('bench', i), max_queue_bytes=1024 ** 3)
+        conn.framed = framed
+        room.append(conn)
+    return room
+
+def drain(room):
+    for conn in room:
+        conn.outbound.get_batch(block=False)
+        conn.outbound.queued_bytes = 0
+
+def broadcast_per_recipient(room, message):
+    """Старый путь: кодирование (и упаковка в кадр) для каждого получателя"""
+    for conn in room:
+        data = message.encode('utf-8')
+        if conn.framed:
+            data = encode_frame(data)
+        conn.outbound.put((data,))
+
+def broadcast_encode_once(room, message):
+    """Новый путь: одно кодирование, общие буферы в очередях всех получателей"""
+    encoded = EncodedMessage(message)
+    for conn in room:
+        conn.send(encoded)
+
+def measure(broadcast, room):
+    """Байты, выделенные и удерживаемые очередями за одну рассылку, и время рассылки"""
+    drain(room)
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        broadcast(room, MESSAGE)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    drain(room)
+    return current / ROUNDS, elapsed / ROUNDS
+
+def run_benchmark():
+    print("=" * 72)
+    print("РАССЫЛКА В КОМНАТУ: БАЙТЫ НА ОДНУ РАССЫЛКУ")
+    print(f"Сообщение: {len(MESSAGE.encode('utf-8'))} байт, раундов: {ROUNDS}")
+    print("=" * 72)
+    print(f"{'Режим':<8}{'Участников':>11}{'Старый путь':>16}{'Кодирование 1 раз':>20}{'Время, мкс':>17}")
+    
+    for framed in (False, True):
+        mode = "кадры" if framed else "текст"
+        for size in ROOM_SIZES:
+            room = make_room(size, framed)
+            old_bytes, old_time = measure(broadcast_per_recipient, room)
+            new_bytes, new_time = measure(broadcast_encode_once, room)
+            print(
+                f"{mode:<8}{size:>11}{old_bytes:>14.0f} Б{new_bytes:>18.0f} Б"
+                f"{old_time * 1e6:>8.0f} -> {new_time * 1e6:.0f}"
+            )
+    
+    print("\nНовый путь хранит в очереди получателя только ссылки на общие")
+    print("буферы; в сокет они уходят одним вызовом sendmsg без склейки.")
+
+if __name__ == "__main__":
+    run_benchmark()
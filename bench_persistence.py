@@ -0,0 +1,63 @@
+import os
+import tempfile
+import threading
+import time
+
+from database import Database
+from write_behind import DURABILITY_ASYNC, DURABILITY_DIRECT, DURABILITY_GROUP
+
+SENDERS = [1, 8, 32]
+MESSAGES_PER_SENDER = 500
+MESSAGE = "Привет всем в комнате! " * 4
+
+def run_senders(db, senders):
+    """Сообщений в секунду: senders потоков шлют сообщения в одну комнату"""
+    def send(user_id):
+        for _ in range(MESSAGES_PER_SENDER):
+            db.save_message(user_id, 1, MESSAGE)
+    
+    threads = [threading.Thread(target=send, args=(i + 1,)) for i in range(senders)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Для async считаем и время дописывания очереди
+    db.flush()
+    elapsed = time.perf_counter() - start
+    return senders * MESSAGES_PER_SENDER / elapsed
+
+def measure(durability, senders, synchronous):
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'bench.db'), durability=durability)
+        db.pool.writer.execute(f"PRAGMA synchronous={synchronous}")
+        rate = run_senders(db, senders)
+        with db.pool.read() as conn:
+            saved = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        stats = db.write_behind.stats if db.write_behind is not None else None
+        db.close()
+    assert saved == senders * MESSAGES_PER_SENDER, f"сохранено {saved}"
+    return rate, stats
+
+def run_benchmark():
+    print("=" * 72)
+    print("СОХРАНЕНИЕ СООБЩЕНИЙ: СООБЩЕНИЙ В СЕКУНДУ")
+    print(f"Сообщений на отправителя: {MESSAGES_PER_SENDER}")
+    print("=" * 72)
+    
+    for synchronous in ('FULL', 'NORMAL'):
+        print(f"\nPRAGMA synchronous={synchronous}")
+        print(f"{'Отправителей':>13}{'direct':>10}{'group':>10}{'async':>10}{'Пачка group/async':>20}")
+        for senders in SENDERS:
+            direct_rate, _ = measure(DURABILITY_DIRECT, senders, synchronous)
+            group_rate, group_stats = measure(DURABILITY_GROUP, senders, synchronous)
+            async_rate, async_stats = measure(DURABILITY_ASYNC, senders, synchronous)
+            batches = f"{group_stats.average_batch():.1f} / {async_stats.average_batch():.1f}"
+            print(f"{senders:>13}{direct_rate:>10.0f}{group_rate:>10.0f}{async_rate:>10.0f}{batches:>20}")
+    
+    print("\ndirect - INSERT и commit на каждое сообщение в потоке отправителя;")
+    print("group - один commit на пачку, отправитель ждет свою пачку;")
+    print("async - один commit на пачку, отправитель не ждет записи.")
+
+if __name__ == "__main__":
+    run_benchmark()
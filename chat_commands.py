@@ -0,0 +1,285 @@
+from commands import CommandRegistry
+from messages import private_message, rooms_message, users_message
+from search_index import SEARCH_PAGE
+
+# Команды пользователей чата. Обработчики получают сервер первым аргументом.
+commands = CommandRegistry()
+
+# Размер страницы /history и /chat
+DEFAULT_HISTORY_PAGE = 20
+MAX_HISTORY_PAGE = 100
+
+def parse_page(args):
+    """(before_id, размер страницы) из аргументов [before_id] [n]; None - если это не числа"""
+    if not all(arg.isdigit() for arg in args):
+        return None
+    before_id = int(args[0]) if args else 0
+    limit = int(args[1]) if len(args) > 1 else DEFAULT_HISTORY_PAGE
+    return before_id or None, max(1, min(limit, MAX_HISTORY_PAGE))
+
+def page_footer(rows, limit, more_command):
+    """Подсказка для следующей страницы: курсор - id самого старого сообщения страницы"""
+    if len(rows) < limit:
+        return "Это начало истории\n"
+    return f"Ранее: {more_command} {rows[0][0]} {limit}\n"
+
+def search_lines(server, results):
+    """Строки результатов поиска: где найдено, кто написал и фрагмент"""
+    lines = ""
+    for msg_id, found_room_id, sender, recipient, fragment, timestamp in results:
+        if found_room_id is None:
+            place = f"ЛС {sender} → {recipient}"
+        else:
+            place = f"#{server.get_room_name(found_room_id)} {sender}"
+        lines += f"[{timestamp[:16]}] {place}: {fragment}\n"
+    return lines
+
+@commands.command('/rooms', '/get_rooms')
+def list_rooms(server, client_socket, user_id, username):
+    client_socket.send(rooms_message(server.rooms))
+
+@commands.command('/join', min_args=1, usage="/join <room>")
+def join_room(server, client_socket, user_id, username, room_name):
+    if room_name not in server.rooms:
+        # Комнату могли создать в другом процессе сервера
+        server.load_rooms()
+    if room_name in server.rooms:
+        server.move_to_room(client_socket, server.rooms[room_name])
+        client_socket.send(f"Вы присоединились к комнате {room_name}".encode('utf-8'))
+        server.send_message_history(client_socket, server.rooms[room_name])
+    else:
+        client_socket.send(f"Комната {room_name} не найдена".encode('utf-8'))
+
+@commands.command('/create', min_args=1, usage="/create <room>")
+def create_room(server, client_socket, user_id, username, room_name):
+    valid_room, msg = server.validator.validate_room_name(room_name)
+    if not valid_room:
+        client_socket.send(f"Ошибка: {msg}".encode('utf-8'))
+        return
+    
+    success, message = server.db.create_room(room_name, user_id)
+    if success:
+        server.room_created(room_name)
+        client_socket.send(f"Комната {room_name} создана".encode('utf-8'))
+    else:
+        client_socket.send(f"Ошибка: {message}".encode('utf-8'))
+
+@commands.command('/users', max_args=1)
+def list_users(server, client_socket, user_id, username, room_name=None):
+    if room_name is None:
+        client_socket.send(users_message(server.get_online_usernames()))
+        return
+    
+    if room_name not in server.rooms:
+        client_socket.send(f"Комната {room_name} не найдена".encode('utf-8'))
+        return
+    
+    room_users = server.get_room_usernames(server.rooms[room_name])
+    client_socket.send(users_message(room_users, room_name))
+
+@commands.command('/msg', '/pm', min_args=2, rest=True, usage="/msg <user> <message>")
+def send_private(server, client_socket, user_id, username, target_username, message):
+    valid_msg, msg_text = server.validator.validate_message(message)
+    if not valid_msg:
+        client_socket.send(f"Ошибка: {msg_text}".encode('utf-8'))
+        return
+    
+    if target_username == username:
+        client_socket.send("Нельзя отправить сообщение самому себе".encode('utf-8'))
+        return
+    
+    spam_detected, spam_reason = server.validator.detect_spam_patterns(
+        message, user_id, server.user_message_history.get(user_id, [])
+    )
+    if spam_detected:
+        client_socket.send(f"Сообщение отклонено: {spam_reason}".encode('utf-8'))
+        return
+    
+    target_user_id = server.find_online_user(target_username)
+    
+    if target_user_id is not None:
+        server.db.save_private_message(user_id, target_user_id, message)
+        
+        server._update_message_history(user_id, message)
+        
+        server.deliver_private_message(target_username, private_message(True, username, message))
+        client_socket.send(private_message(False, target_username, message))
+        
+        server.db.mark_messages_as_read(target_user_id, user_id)
+    else:
+        client_socket.send(f"Пользователь {target_username} не в сети".encode('utf-8'))
+
+@commands.command('/inbox')
+def show_inbox(server, client_socket, user_id, username):
+    conversations = server.db.get_conversations(user_id)
+    if not conversations:
+        client_socket.send("Нет входящих сообщений".encode('utf-8'))
+    else:
+        inbox = "Последние сообщения:\n"
+        for partner, msg_id, from_me, preview, timestamp, unread in conversations:
+            status = f"✗{unread}" if unread else "✓"
+            time_str = timestamp.split(' ')[1][:5]
+            direction = "→" if from_me else "←"
+            inbox += f"[{time_str}] {status} {direction} {partner}: {preview}\n"
+        inbox += "Вся переписка: /chat <user>\n"
+        client_socket.send(inbox.encode('utf-8'))
+
+@commands.command('/chat', min_args=1, max_args=3, usage="/chat <user> [before_id] [n]")
+def show_chat(server, client_socket, user_id, username, target_username, *page_args):
+    page = parse_page(page_args)
+    if page is None:
+        client_socket.send("Использование: /chat <user> [before_id] [n]".encode('utf-8'))
+        return
+    before_id, limit = page
+    
+    target_user = server.db.get_user_by_username(target_username)
+    if not target_user:
+        client_socket.send(f"Пользователь {target_username} не найден".encode('utf-8'))
+        return
+    
+    target_user_id, _ = target_user
+    messages = server.db.get_private_messages(user_id, target_user_id, limit, before_id)
+    
+    if not messages:
+        client_socket.send(f"Нет сообщений с {target_username}".encode('utf-8'))
+    else:
+        history = f"История чата с {target_username}:\n"
+        for msg_id, from_user, to_user, content, timestamp, is_read in messages:
+            time_str = timestamp.split(' ')[1][:5]
+            arrow = "→" if from_user == username else "←"
+            history += f"[{time_str}] {arrow} {content}\n"
+        history += page_footer(messages, limit, f"/chat {target_username}")
+        client_socket.send(history.encode('utf-8'))
+        if before_id is None:
+            server.db.mark_messages_as_read(user_id, target_user_id)
+
+@commands.command('/history', max_args=3, usage="/history [room] [before_id] [n]")
+def show_history(server, client_socket, user_id, username, *args):
+    args = list(args)
+    if args and (args[0] in server.rooms or not args[0].isdigit()):
+        room_name = args.pop(0)
+        if room_name not in server.rooms:
+            server.load_rooms()
+        if room_name not in server.rooms:
+            client_socket.send(f"Комната {room_name} не найдена".encode('utf-8'))
+            return
+        room_id = server.rooms[room_name]
+    else:
+        with server.lock:
+            room_id = server.clients[client_socket]['current_room']
+        room_name = server.get_room_name(room_id)
+    
+    page = parse_page(args)
+    if page is None:
+        client_socket.send("Использование: /history [room] [before_id] [n]".encode('utf-8'))
+        return
+    before_id, limit = page
+    
+    messages = server.db.get_message_history(room_id, limit, before_id)
+    if not messages:
+        client_socket.send(f"Нет более ранних сообщений в комнате {room_name}".encode('utf-8'))
+        return
+    
+    history = f"История комнаты {room_name}:\n"
+    for msg_id, sender, content, timestamp in messages:
+        history += f"[{timestamp[:16]}] {sender}: {content}\n"
+    history += page_footer(messages, limit, f"/history {room_name}")
+    client_socket.send(history.encode('utf-8'))
+
+@commands.command('/search', min_args=1, max_args=1, rest=True, usage="/search <запрос> [room] [страница]")
+def search_messages(server, client_socket, user_id, username, text):
+    if not server.db.search_enabled:
+        client_socket.send("Поиск недоступен: SQLite собран без FTS5".encode('utf-8'))
+        return
+    
+    # Необязательные комната и номер страницы - последние слова запроса
+    words = text.split()
+    page = 1
+    if len(words) > 1 and words[-1].isdigit():
+        page = max(1, int(words.pop()))
+    room_name = None
+    if len(words) > 1 and words[-1] in server.rooms:
+        room_name = words.pop()
+    query = ' '.join(words)
+    
+    room_id = server.rooms[room_name] if room_name else None
+    results = server.db.search(user_id, query, room_id, SEARCH_PAGE, (page - 1) * SEARCH_PAGE)
+    if not results:
+        client_socket.send(f"Ничего не найдено: {query}".encode('utf-8'))
+        return
+    
+    reply = f"Результаты поиска «{query}», страница {page}:\n"
+    reply += search_lines(server, results)
+    if len(results) == SEARCH_PAGE:
+        reply += f"Еще: /search {' '.join(filter(None, [query, room_name]))} {page + 1}\n"
+    client_socket.send(reply.encode('utf-8'))
+
+@commands.command('/search_archive', min_args=1, max_args=1, rest=True, usage="/search_archive <запрос> [room]")
+def search_archive(server, client_socket, user_id, username, text):
+    if not server.db.search_enabled:
+        client_socket.send("Поиск недоступен: SQLite собран без FTS5".encode('utf-8'))
+        return
+    
+    words = text.split()
+    room_name = None
+    if len(words) > 1 and words[-1] in server.rooms:
+        room_name = words.pop()
+    query = ' '.join(words)
+    
+    room_id = server.rooms[room_name] if room_name else None
+    results = server.db.search_archives(user_id, query, room_id)
+    if not results:
+        client_socket.send(f"В архиве ничего не найдено: {query}".encode('utf-8'))
+        return
+    
+    reply = f"Результаты поиска в архиве «{query}»:\n"
+    reply += search_lines(server, results)
+    client_socket.send(reply.encode('utf-8'))
+
+@commands.command('/myinfo')
+def show_my_info(server, client_socket, user_id, username):
+    with server.lock:
+        current_room_id = server.clients[client_socket]['current_room']
+    
+    current_room_name = server.get_room_name(current_room_id)
+    
+    public_msgs, sent_private, received_private = server.db.get_user_stats(user_id)
+    
+    info = (
+        f"Ваша информация:\n"
+        f"Имя: {username}\n"
+        f"ID: {user_id}\n"
+        f"Текущая комната: {current_room_name}\n"
+        f"Статистика:\n"
+        f"  - Сообщений в чатах: {public_msgs}\n"
+        f"  - Отправлено ЛС: {sent_private}\n"
+        f"  - Получено ЛС: {received_private}\n"
+    )
+    client_socket.send(info.encode('utf-8'))
+
+@commands.command('/help')
+def show_help(server, client_socket, user_id, username):
+    help_text = (
+        "Доступные команды:\n"
+        "/rooms - список комнат\n"
+        "/join <room> - присоединиться к комнате\n"
+        "/create <room> - создать комнату\n"
+        "/users - список пользователей онлайн\n"
+        "/users <room> - кто сейчас в комнате\n"
+        "/msg <user> <message> - приватное сообщение\n"
+        "/pm <user> <message> - приватное сообщение (алиас)\n"
+        "/inbox - входящие сообщения\n"
+        "/chat <user> [before_id] [n] - чат с пользователем, страницами\n"
+        "/history [room] [before_id] [n] - история комнаты, страницами\n"
+        "/search <запрос> [room] [страница] - поиск по сообщениям\n"
+        "/search_archive <запрос> [room] - поиск по архиву старых сообщений\n"
+        "/myinfo - ваша информация\n"
+        "/help - эта справка\n"
+        "/exit - выход\n"
+    )
+    client_socket.send(help_text.encode('utf-8'))
+
+@commands.command('/exit')
+def exit_chat(server, client_socket, user_id, username):
+    client_socket.send("До свидания!".encode('utf-8'))
+    raise Exception("Выход по команде")
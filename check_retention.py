@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import sys
+import tempfile
+
+from database import Database
+from history_cache import HistoryCache
+from retention import AUTO_VACUUM_INCREMENTAL, Archiver
+from write_behind import DURABILITY_DIRECT
+
+OLD_MESSAGES = 3000
+OLD_PRIVATE = 200
+OLD_DATE = '2024-01-15 12:00:00'
+CONTENT = "старое сообщение для архива " * 10
+
+def fill(db):
+    """Старые сообщения комнаты и прочитанные ЛС, плюс свежие, которые должны остаться"""
+    for username in ('user1', 'user2', 'user3'):
+        db.register_user(username, None, b'x')
+    with db.pool.write() as conn:
+        conn.executemany(
+            "INSERT INTO messages (user_id, room_id, content, created_at) VALUES (?, 1, ?, ?)",
+            [(i % 2 + 1, CONTENT, OLD_DATE) for i in range(OLD_MESSAGES)]
+        )
+        conn.executemany(
+            "INSERT INTO private_messages (from_user_id, to_user_id, content, is_read, created_at) "
+            "VALUES (1, 2, ?, TRUE, ?)",
+            [(CONTENT, OLD_DATE) for _ in range(OLD_PRIVATE)]
+        )
+    db.save_message(1, 1, "свежее сообщение")
+    db.save_private_message(1, 3, "свежее личное")
+    db.rebuild_counters()
+
+def counters(db):
+    with db.pool.read() as conn:
+        db.counters.load(conn)
+    conversations = sorted((partner, preview) for partner, _, _, preview, _, _ in db.get_conversations(1))
+    return db.get_totals(), db.get_user_stats(1), db.get_room_stats(), conversations
+
+def check(results, name, ok, detail=""):
+    print(f"{'✅' if ok else '❌'} {name}{': ' + detail if detail else ''}")
+    results.append(ok)
+
+def check_archive_pass(directory, results):
+    db = Database(os.path.join(directory, 'retention.db'), durability=DURABILITY_DIRECT)
+    fill(db)
+    before = counters(db)
+    size_before, _ = db.file_size()
+    
+    db.set_retention(1, 30)
+    archiver = Archiver(db, HistoryCache(), interval=None, private_keep_days=30)
+    archiver.run_once()
+    stats = archiver.stats
+    size_after, free_after = db.file_size()
+    
+    check(results, "перенесены старые сообщения комнаты", stats.room_messages == OLD_MESSAGES,
+          f"{stats.room_messages} из {OLD_MESSAGES}")
+    check(results, "перенесены прочитанные ЛС", stats.private_messages == OLD_PRIVATE,
+          f"{stats.private_messages} из {OLD_PRIVATE}")
+    check(results, "incremental_vacuum вернул страницы ОС", stats.vacuumed_pages > 0 and free_after == 0,
+          f"возвращено {stats.vacuumed_pages}, свободных осталось {free_after}")
+    check(results, "файл базы уменьшился", size_after < size_before,
+          f"{size_before // 1024} КБ -> {size_after // 1024} КБ")
+    check(results, "архив находится поиском", len(db.search_archives(1, 'архива', 1)) > 0)
+    
+    db.rebuild_counters()
+    check(results, "пересчет счетчиков учитывает архив", counters(db) == before)
+    db.close()
+
+def check_compact(directory, results):
+    path = os.path.join(directory, 'legacy.db')
+    legacy = sqlite3.connect(path)
+    legacy.execute("CREATE TABLE legacy (x)")
+    legacy.close()
+    
+    db = Database(path, durability=DURABILITY_DIRECT)
+    compacted = db.compact()
+    auto_vacuum = db.pool.writer.execute('PRAGMA auto_vacuum').fetchone()[0]
+    journal_mode = db.pool.writer.execute('PRAGMA journal_mode').fetchone()[0]
+    db.close()
+    check(results, "/admin_compact включает auto_vacuum=INCREMENTAL",
+          compacted and auto_vacuum == AUTO_VACUUM_INCREMENTAL and journal_mode == 'wal',
+          f"auto_vacuum={auto_vacuum}, журнал {journal_mode}")
+
+def run_check():
+    print("=" * 72)
+    print("АРХИВАЦИЯ И ВОЗВРАТ МЕСТА")
+    print("=" * 72)
+    
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        check_archive_pass(directory, results)
+        check_compact(directory, results)
+    
+    if not all(results):
+        print(f"\nПроверок не пройдено: {results.count(False)}")
+        return 1
+    print("\nВсе проверки пройдены")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run_check())
@@ -1,19 +1,22 @@
-import socket
+import argparse
 import threading
-import sys
+from protocol import ClientProtocol, connect_socket
 
 class TestAuthClient:
-    def __init__(self, host='localhost', port=5555):
+    def __init__(self, host='localhost', port=5555, socket_path=None):
         self.host = host
         self.port = port
+        self.socket_path = socket_path
         self.socket = None
+        self.protocol = None
         self.running = False
     
     def connect(self):
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
-            print(f"Подключились к {self.host}:{self.port}")
+            self.socket = connect_socket(self.host, self.port, self.socket_path)
+            self.protocol = ClientProtocol(self.socket)
+            self.protocol.handshake()
+            print(f"Подключились к {self.socket_path or f'{self.host}:{self.port}'}")
             return True
         except Exception as e:
             print(f"Ошибка подключения: {e}")
@@ -22,12 +25,12 @@ class TestAuthClient:
     def receive_messages(self):
         while self.running:
             try:
-                data = self.socket.recv(1024).decode('utf-8')
-                if data:
-                    print(f"\n{data}")
-                    print("> ", end="", flush=True)
-                else:
+                messages = self.protocol.receive()
+                if messages is None:
                     break
+                for data in messages:
+                    print(f"\n{data}")
+                print("> ", end="", flush=True)
             except:
                 break
     
@@ -46,7 +49,7 @@ class TestAuthClient:
                 if message.lower() == '/exit':
                     self.running = False
                     break
-                self.socket.send(message.encode('utf-8'))
+                self.protocol.send(message)
         except KeyboardInterrupt:
             print("\nВыход...")
         finally:
@@ -55,5 +58,11 @@ class TestAuthClient:
                 self.socket.close()
 
 if __name__ == "__main__":
-    client = TestAuthClient()
+    parser = argparse.ArgumentParser(description="Консольный клиент мессенджера")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--socket', metavar='PATH', help="подключаться через Unix-сокет сервера")
+    args = parser.parse_args()
+    
+    client = TestAuthClient(args.host, args.port, args.socket)
     client.start()
\ No newline at end of file
@@ -0,0 +1,399 @@
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import socket
+import threading
+
+from async_server import AsyncChatServer
+from protocol import MSG_CHAT, EncodedMessage, FrameDecoder, ProtocolError, decode_typed, encode_frame
+from server import AuthChatServer, add_server_arguments, server_options
+from sessions import SESSION_SECRET_ENV
+
+DEFAULT_BUS_PATH = '/tmp/messenger-bus.sock'
+
+def encode_event(event):
+    return encode_frame(json.dumps(event, ensure_ascii=False).encode('utf-8'))
+
+def message_fields(encoded):
+    """Поля события шины для готового сообщения: текст и двоичное представление"""
+    fields = {'message': encoded.payload.decode('utf-8')}
+    if len(encoded.typed) == 1:
+        fields['typed'] = base64.b64encode(encoded.typed[0]).decode('ascii')
+    return fields
+
+def message_from_event(event):
+    typed = event.get('typed')
+    return EncodedMessage(event['message'], base64.b64decode(typed) if typed else None)
+
+def chat_fields(message):
+    """(отправитель, текст) для сообщения в комнате, для прочих рассылок - None"""
+    if len(message.typed) != 1 or message.typed[0][0] != MSG_CHAT:
+        return None
+    _, chat = decode_typed(message.typed[0])
+    return chat
+
+class BusHub:
+    """Шина событий между процессами-воркерами на Unix-сокете.
+    
+    Каждое событие, полученное от воркера, пересылается всем остальным.
+    Когда воркер отключается, остальные получают событие worker_down.
+    """
+    
+    def __init__(self, path=DEFAULT_BUS_PATH):
+        self.path = path
+        self.workers = {}
+        self.send_locks = {}
+        self.lock = threading.Lock()
+        self.server_socket = None
+    
+    def start(self):
+        """Запуск шины в фоновом потоке"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(self.path)
+        self.server_socket.listen(64)
+        
+        accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        accept_thread.start()
+    
+    def _accept_loop(self):
+        while True:
+            try:
+                worker_socket, _ = self.server_socket.accept()
+            except OSError:
+                break
+            
+            with self.lock:
+                self.workers[worker_socket] = None
+            threading.Thread(target=self._serve_worker, args=(worker_socket,), daemon=True).start()
+    
+    def _serve_worker(self, worker_socket):
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = worker_socket.recv(65536)
+                if not data:
+                    break
+                
+                for frame in decoder.feed(data):
+                    event = json.loads(frame)
+                    if event.get('type') == 'hello':
+                        with self.lock:
+                            self.workers[worker_socket] = event.get('worker')
+                    self.relay(encode_frame(frame), worker_socket)
+        except (OSError, ValueError, ProtocolError) as e:
+            print(f"Ошибка шины: {e}")
+        finally:
+            with self.lock:
+                worker_id = self.workers.pop(worker_socket, None)
+                self.send_locks.pop(worker_socket, None)
+            worker_socket.close()
+            if worker_id is not None:
+                self.relay(encode_event({'type': 'worker_down', 'worker': worker_id}))
+    
+    def relay(self, data, source=None):
+        """Пересылка события всем воркерам, кроме отправителя"""
+        with self.lock:
+            targets = [(sock, self.send_locks.setdefault(sock, threading.Lock()))
+                       for sock in self.workers if sock is not source]
+        
+        for sock, send_lock in targets:
+            with send_lock:
+                try:
+                    sock.sendall(data)
+                except OSError:
+                    pass
+    
+    def stop(self):
+        if self.server_socket is not None:
+            self.server_socket.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+class BusClient:
+    """Подключение воркера к шине событий"""
+    
+    def __init__(self, path, worker_id, handler):
+        self.path = path
+        self.worker_id = worker_id
+        self.handler = handler
+        self.sock = None
+        self.send_lock = threading.Lock()
+    
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+        threading.Thread(target=self._reader_loop, daemon=True).start()
+        self.publish({'type': 'hello'})
+    
+    def publish(self, event):
+        """Отправка события остальным воркерам"""
+        event['worker'] = self.worker_id
+        data = encode_event(event)
+        with self.send_lock:
+            self.sock.sendall(data)
+    
+    def _reader_loop(self):
+        decoder = FrameDecoder()
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            
+            try:
+                frames = decoder.feed(data)
+            except ProtocolError as e:
+                print(f"Ошибка шины: {e}")
+                break
+            for frame in frames:
+                try:
+                    self.handler(json.loads(frame))
+                except Exception as e:
+                    print(f"Ошибка обработки события шины: {e}")
+        print("Соединение с шиной потеряно")
+
+class ClusterMixin:
+    """Поведение воркера кластера поверх AuthChatServer / AsyncChatServer.
+    
+    Рассылки в комнаты и системные сообщения дублируются в шину, личные
+    сообщения уходят в воркер получателя, а список онлайн собирается из
+    локальных клиентов и присутствия, о котором сообщили другие воркеры.
+    """
+    
+    def attach_bus(self, bus):
+        self.bus = bus
+        self.bus_active = True
+        self.remote_users = {}
+        self.bus.connect()
+    
+    def publish(self, event):
+        """Отправка события в шину (после остановки воркера - ничего)"""
+        if not self.bus_active:
+            return
+        try:
+            self.bus.publish(event)
+        except OSError as e:
+            print(f"Ошибка отправки в шину: {e}")
+    
+    def handle_bus_event(self, event):
+        """Обработка события от другого воркера (вызывается в потоке шины)"""
+        event_type = event.get('type')
+        
+        if event_type == 'room':
+            message = message_from_event(event)
+            super().broadcast_to_room(message, event['room_id'])
+            chat = chat_fields(message)
+            if chat is not None:
+                # Сообщение из другого воркера тоже попадает в историю комнаты
+                self.history_cache.append(event['room_id'], None, *chat)
+        
+        elif event_type == 'system':
+            super().broadcast_system(event['message'])
+        
+        elif event_type == 'private':
+            super().deliver_private_message(event['username'], message_from_event(event))
+        
+        elif event_type == 'online':
+            with self.lock:
+                self.remote_users[event['username']] = {
+                    'user_id': event['user_id'],
+                    'room_id': event['room_id'],
+                    'worker': event['worker'],
+                }
+        
+        elif event_type == 'offline':
+            with self.lock:
+                remote = self.remote_users.get(event['username'])
+                if remote and remote['worker'] == event['worker']:
+                    del self.remote_users[event['username']]
+                # Переподключение по /resume может попасть в этот воркер
+                self.last_rooms[event['user_id']] = event['room_id']
+        
+        elif event_type == 'rooms':
+            self.load_rooms()
+        
+        elif event_type == 'revoke':
+            self.sessions.revoke(event['user_id'], event['revoked_at'])
+        
+        elif event_type == 'hello':
+            # Новый воркер: сообщаем ему о своих клиентах
+            with self.lock:
+                local = [(data['username'], data['user_id'], data['current_room'])
+                         for data in self.clients.values()]
+            for username, user_id, room_id in local:
+                self.publish_presence(username, user_id, room_id)
+        
+        elif event_type == 'worker_down':
+            with self.lock:
+                for username in [name for name, remote in self.remote_users.items()
+                                 if remote['worker'] == event['worker']]:
+                    del self.remote_users[username]
+    
+    def publish_presence(self, username, user_id, room_id):
+        self.publish({
+            'type': 'online', 'username': username, 'user_id': user_id, 'room_id': room_id
+        })
+    
+    def broadcast_to_room(self, message, room_id, sender_socket=None):
+        if not isinstance(message, EncodedMessage):
+            message = EncodedMessage(message)
+        super().broadcast_to_room(message, room_id, sender_socket)
+        self.publish({'type': 'room', 'room_id': room_id, **message_fields(message)})
+    
+    def broadcast_system(self, message):
+        super().broadcast_system(message)
+        self.publish({'type': 'system', 'message': message})
+    
+    def register_client(self, client_socket, user_id, username, room_id=1):
+        self.publish_presence(username, user_id, room_id)
+        super().register_client(client_socket, user_id, username, room_id)
+    
+    def remove_client(self, client_socket):
+        with self.lock:
+            client_data = self.clients.get(client_socket)
+        if client_data is not None:
+            self.publish_offline(client_data)
+        super().remove_client(client_socket)
+    
+    def reap_connections(self, connections):
+        with self.lock:
+            gone = [self.clients[conn] for conn in connections if conn in self.clients]
+        for client_data in gone:
+            self.publish_offline(client_data)
+        super().reap_connections(connections)
+    
+    def publish_offline(self, client_data):
+        self.publish({
+            'type': 'offline', 'username': client_data['username'],
+            'user_id': client_data['user_id'], 'room_id': client_data['current_room'],
+        })
+    
+    def move_to_room(self, client_socket, room_id):
+        super().move_to_room(client_socket, room_id)
+        with self.lock:
+            client_data = self.clients.get(client_socket)
+        if client_data is not None:
+            self.publish_presence(client_data['username'], client_data['user_id'], room_id)
+    
+    def revoke_sessions(self, user_id):
+        # Токен /resume проверяет тот воркер, к которому попадет переподключение
+        revoked_at = super().revoke_sessions(user_id)
+        self.publish({'type': 'revoke', 'user_id': user_id, 'revoked_at': revoked_at})
+        return revoked_at
+    
+    def room_created(self, room_name):
+        super().room_created(room_name)
+        self.publish({'type': 'rooms'})
+    
+    def stop_server(self):
+        # Остановка одного воркера не касается клиентов остальных
+        self.bus_active = False
+        super().stop_server()
+    
+    def get_online_usernames(self):
+        local = super().get_online_usernames()
+        with self.lock:
+            remote = [name for name in self.remote_users if name not in local]
+        return local + remote
+    
+    def get_room_usernames(self, room_id):
+        local = super().get_room_usernames(room_id)
+        with self.lock:
+            remote = [name for name, data in self.remote_users.items()
+                      if data['room_id'] == room_id and name not in local]
+        return sorted(local + remote)
+    
+    def get_last_room(self, user_id, username):
+        with self.lock:
+            remote = self.remote_users.get(username)
+        if remote is not None:
+            return remote['room_id']
+        return super().get_last_room(user_id, username)
+    
+    def find_online_user(self, username):
+        user_id = super().find_online_user(username)
+        if user_id is not None:
+            return user_id
+        with self.lock:
+            remote = self.remote_users.get(username)
+        return remote['user_id'] if remote else None
+    
+    def deliver_private_message(self, username, message):
+        with self.lock:
+            is_local = username in self.username_to_socket
+        if is_local:
+            super().deliver_private_message(username, message)
+        else:
+            self.publish({'type': 'private', 'username': username, **message_fields(message)})
+
+class ClusterChatServer(ClusterMixin, AuthChatServer):
+    """Воркер кластера в режиме поток-на-подключение"""
+
+class AsyncClusterChatServer(ClusterMixin, AsyncChatServer):
+    """Воркер кластера на asyncio"""
+
+def run_worker(worker_id, bus_path, host, port, mode, options):
+    """Точка входа процесса-воркера"""
+    if worker_id != 0:
+        # База общая: старые сообщения архивирует один воркер
+        options = dict(options, retention_interval=None)
+    if mode == 'async':
+        server = AsyncClusterChatServer(host, port, reuse_port=True, **options)
+    else:
+        server = ClusterChatServer(host, port, reuse_port=True, **options)
+    
+    server.attach_bus(BusClient(bus_path, worker_id, server.handle_bus_event))
+    print(f"Воркер {worker_id} (pid {os.getpid()}) запущен")
+    
+    try:
+        server.start_server()
+    except KeyboardInterrupt:
+        # Воркер уже остановлен в finally у start_server()
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Запуск сервера мессенджера на нескольких ядрах")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--mode', choices=['threads', 'async'], default='threads')
+    parser.add_argument('--bus-path', default=DEFAULT_BUS_PATH)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    
+    if not hasattr(socket, 'SO_REUSEPORT') or not hasattr(socket, 'AF_UNIX'):
+        raise SystemExit("Кластерный режим требует SO_REUSEPORT и Unix-сокетов (Linux/BSD/macOS)")
+    
+    options = server_options(args)
+    # Общий секрет: токен /resume действует в любом воркере
+    options['session_secret'] = os.environ.get(SESSION_SECRET_ENV) or os.urandom(32).hex()
+    
+    hub = BusHub(args.bus_path)
+    hub.start()
+    print(f"Шина событий: {args.bus_path}, воркеров: {args.workers}")
+    
+    processes = []
+    for worker_id in range(args.workers):
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(worker_id, args.bus_path, args.host, args.port, args.mode, options)
+        )
+        process.start()
+        processes.append(process)
+    
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("Получен сигнал прерывания")
+        for process in processes:
+            process.terminate()
+    finally:
+        hub.stop()
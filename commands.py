@@ -0,0 +1,127 @@
+import bisect
+import threading
+import time
+
+ROLE_USER = 'user'
+ROLE_ADMIN = 'admin'
+
+# Верхние границы корзин гистограммы времени выполнения, секунд
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+class CommandStats:
+    """Число вызовов и гистограмма времени выполнения одной команды"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+    
+    def record(self, elapsed, failed=False):
+        with self.lock:
+            self.calls += 1
+            if failed:
+                self.errors += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+            self.buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+    
+    def percentile(self, fraction):
+        """Оценка сверху: граница корзины, в которую попадает доля fraction вызовов"""
+        with self.lock:
+            target = self.calls * fraction
+            seen = 0
+            for index, count in enumerate(self.buckets):
+                seen += count
+                if count and seen >= target:
+                    if index < len(LATENCY_BUCKETS):
+                        return min(LATENCY_BUCKETS[index], self.max_time)
+                    return self.max_time
+        return 0.0
+
+class Command:
+    """Описание команды: обработчик, разбор аргументов и требуемая роль.
+    
+    Обработчик вызывается как handler(server, client_socket, user_id, username, *args).
+    Аргументы разделяются пробелом; при rest=True последний забирает остаток строки.
+    """
+    
+    def __init__(self, name, handler, min_args=0, max_args=0, rest=False, role=ROLE_USER, usage=None):
+        self.name = name
+        self.handler = handler
+        self.min_args = min_args
+        self.max_args = max(max_args, min_args)
+        self.rest = rest
+        self.role = role
+        self.usage = usage or name
+    
+    def parse_args(self, tail):
+        """Аргументы из строки после имени команды; лишние отбрасываются"""
+        if not tail or not self.max_args:
+            return []
+        if self.rest:
+            return tail.split(' ', self.max_args - 1)
+        return tail.split(' ')[:self.max_args]
+
+class CommandRegistry:
+    """Таблица команд: имя -> Command, со счетчиками времени по каждой команде.
+    
+    Модули с командами заводят свой реестр и регистрируют обработчики декоратором
+    command(); сервер собирает их в один реестр через include().
+    """
+    
+    def __init__(self):
+        self.commands = {}
+        self.stats = {}
+    
+    def register(self, name, handler, aliases=(), **options):
+        command = Command(name, handler, **options)
+        for command_name in (name,) + tuple(aliases):
+            self.commands[command_name] = command
+        self.stats.setdefault(name, CommandStats())
+        return command
+    
+    def command(self, name, *aliases, **options):
+        """Декоратор регистрации обработчика"""
+        def decorator(handler):
+            self.register(name, handler, aliases, **options)
+            return handler
+        return decorator
+    
+    def include(self, other):
+        """Добавление команд другого реестра (счетчики у каждого реестра свои)"""
+        for command_name, command in other.commands.items():
+            self.commands[command_name] = command
+            self.stats.setdefault(command.name, CommandStats())
+    
+    def dispatch(self, server, client_socket, user_id, username, line):
+        """Выполнение строки-команды клиента"""
+        name, _, tail = line.partition(' ')
+        command = self.commands.get(name)
+        if command is None:
+            client_socket.send("Неизвестная команда".encode('utf-8'))
+            return
+        
+        if command.role == ROLE_ADMIN and not server.is_admin(username):
+            client_socket.send("❌ Недостаточно прав".encode('utf-8'))
+            return
+        
+        args = command.parse_args(tail)
+        if len(args) < command.min_args:
+            client_socket.send(f"Использование: {command.usage}".encode('utf-8'))
+            return
+        
+        failed = True
+        start = time.perf_counter()
+        try:
+            command.handler(server, client_socket, user_id, username, *args)
+            failed = False
+        finally:
+            self.stats[command.name].record(time.perf_counter() - start, failed)
+    
+    def snapshot(self):
+        """[(имя, CommandStats)] вызывавшихся команд, самые затратные первыми"""
+        used = [(name, stats) for name, stats in self.stats.items() if stats.calls]
+        return sorted(used, key=lambda item: item[1].total_time, reverse=True)
@@ -0,0 +1,78 @@
+import threading
+import time
+import zlib
+from protocol import FRAME_COMPRESSED, FRAME_HEADER
+
+DEFAULT_COMPRESS_THRESHOLD = 512
+DEFAULT_COMPRESS_LEVEL = 6
+
+class CompressionStats:
+    """Общие счетчики сжатия по всему серверу"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.compressed_frames = 0
+        self.raw_frames = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_time = 0.0
+    
+    def record(self, bytes_in, bytes_out, cpu_time):
+        with self.lock:
+            self.compressed_frames += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.cpu_time += cpu_time
+    
+    def record_raw(self):
+        with self.lock:
+            self.raw_frames += 1
+    
+    def ratio(self):
+        """Во сколько раз уменьшились сжатые кадры"""
+        with self.lock:
+            if not self.bytes_out:
+                return 1.0
+            return self.bytes_in / self.bytes_out
+
+class CompressionSettings:
+    """Настройки сжатия сервера: порог, уровень и счетчики для всех подключений"""
+    
+    def __init__(self, threshold=DEFAULT_COMPRESS_THRESHOLD, level=DEFAULT_COMPRESS_LEVEL):
+        self.threshold = threshold
+        self.level = level
+        self.stats = CompressionStats()
+    
+    def create_compressor(self):
+        return FrameCompressor(self.threshold, self.level, self.stats)
+
+class FrameCompressor:
+    """Сжатие кадров одного подключения общим потоком zlib.
+    
+    Кадры меньше порога уходят как есть. Крупные сжимаются с Z_SYNC_FLUSH:
+    клиент распаковывает каждый кадр сразу, а словарь потока переиспользуется
+    между кадрами (повторяющиеся имена и фразы истории сжимаются лучше).
+    Порядок сжатия должен совпадать с порядком в очереди, поэтому сжатие
+    и постановку в очередь выполняют под self.lock.
+    """
+    
+    def __init__(self, threshold=DEFAULT_COMPRESS_THRESHOLD, level=DEFAULT_COMPRESS_LEVEL, stats=None):
+        self.threshold = threshold
+        self.stats = stats
+        self.compressobj = zlib.compressobj(level)
+        self.lock = threading.Lock()
+    
+    def compress(self, buffers):
+        """Буферы кадра (заголовок, нагрузка...) -> сжатый кадр или исходные буферы"""
+        payload_size = sum(len(buffer) for buffer in buffers[1:])
+        if payload_size < self.threshold:
+            if self.stats:
+                self.stats.record_raw()
+            return buffers
+        
+        start = time.thread_time()
+        data = self.compressobj.compress(b''.join(buffers[1:]))
+        data += self.compressobj.flush(zlib.Z_SYNC_FLUSH)
+        if self.stats:
+            self.stats.record(payload_size, len(data), time.thread_time() - start)
+        return (FRAME_HEADER.pack(len(data) | FRAME_COMPRESSED), data)
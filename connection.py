@@ -0,0 +1,207 @@
+import socket
+import threading
+import time
+
+from outbound import (
+    DEFAULT_MAX_QUEUE_BYTES, POLICY_EVICT, OutboundQueue, SlowConsumerError, send_buffers
+)
+from protocol import (
+    BINARY_VERSION, EXTENSION_ZLIB, EncodedMessage, FrameDecoder, HANDSHAKE_PREFIX, PONG_MESSAGE,
+    SUPPORTED_VERSIONS, handshake_ack, parse_handshake
+)
+
+# Сколько ждать отправки хвоста очереди при закрытии, прежде чем оборвать соединение
+CLOSE_FLUSH_TIMEOUT = 5.0
+
+class ClientConnection:
+    """Серверная сторона подключения: режим протокола, разбор входящего потока
+    и ограниченная очередь отправки.
+    
+    Обработчики сервера работают с подключением как с сокетом: send(bytes)
+    ставит одно сообщение в очередь (в кадровом режиме - с заголовком кадра),
+    отдельный писатель отправляет очередь клиенту. Так медленный клиент
+    не задерживает поток, который делает рассылку.
+    Подклассы реализуют писателя, close() и abort() для своего транспорта.
+    compression - CompressionSettings сервера или None, если сжатие запрещено.
+    """
+    
+    def __init__(self, address=None, max_queue_bytes=DEFAULT_MAX_QUEUE_BYTES,
+                 overflow_policy=POLICY_EVICT, stats=None, compression=None):
+        self.address = address
+        self.compression = compression
+        self.compressor = None
+        self.framed = False
+        self.binary = False
+        self.protocol_version = 1
+        self.decoder = FrameDecoder()
+        self.outbound = OutboundQueue(max_queue_bytes, overflow_policy, stats)
+        self.closed = False
+        # Для проверки живости (heartbeat.Reaper)
+        self.authenticated = False
+        self.connected_at = time.monotonic()
+        self.last_activity = self.connected_at
+        self.last_ping = 0.0
+    
+    def send(self, data):
+        """Отправка одного сообщения (bytes или общий EncodedMessage)"""
+        self.write(self.encode(data))
+        return len(data)
+    
+    def encode(self, data):
+        """Буферы сообщения для текущего режима протокола"""
+        if not isinstance(data, EncodedMessage):
+            data = EncodedMessage(data)
+        return data.buffers(self.framed, self.binary)
+    
+    def write(self, buffers):
+        """Постановка буферов в очередь отправки"""
+        if self.closed:
+            raise ConnectionError("Соединение закрыто")
+        
+        if self.compressor is not None:
+            queued = self._write_compressed(buffers)
+        else:
+            queued = self.outbound.put(buffers)
+        
+        if not queued:
+            if self.outbound.policy == POLICY_EVICT:
+                self.abort()
+                raise SlowConsumerError(f"Клиент {self.address} не успевает получать данные")
+            return
+        
+        self.wake_writer()
+    
+    def _write_compressed(self, buffers):
+        """Сжатие и постановка в очередь в одном порядке для всех потоков"""
+        with self.compressor.lock:
+            size = sum(len(buffer) for buffer in buffers)
+            if not self.outbound.has_room(size):
+                # Не сжимаем то, что не попадет в очередь: поток zlib не должен уйти вперед
+                return self.outbound.put(buffers)
+            
+            compressed = self.compressor.compress(buffers)
+            queued = self.outbound.put(compressed)
+            if queued or compressed is buffers:
+                return queued
+        
+        # Сжатый кадр потерян - клиент больше не сможет распаковать поток
+        self.abort()
+        raise ConnectionError(f"Поток сжатия клиента {self.address} нарушен")
+    
+    def parse(self, raw_data):
+        """Разбор полученных байтов в список сообщений"""
+        self.last_activity = time.monotonic()
+        if self.framed:
+            frames = [frame.decode('utf-8') for frame in self.decoder.feed(raw_data)]
+            return [message for message in frames if message != PONG_MESSAGE]
+        
+        if raw_data.startswith(HANDSHAKE_PREFIX):
+            line, _, rest = raw_data.partition(b'\n')
+            if self.negotiate(line):
+                return self.parse(rest) if rest else []
+            return []
+        
+        # Текстовый режим: одно чтение из сокета считается одним сообщением
+        message = raw_data.decode('utf-8')
+        return [] if message.strip() == PONG_MESSAGE else [message]
+    
+    def negotiate(self, line):
+        """Обработка запроса на переход в кадровый режим"""
+        version, extensions = parse_handshake(line)
+        if version is not None and version > max(SUPPORTED_VERSIONS):
+            # Клиент новее сервера: договариваемся о нашей старшей версии
+            version = max(SUPPORTED_VERSIONS)
+        if version not in SUPPORTED_VERSIONS:
+            self.write((f"Ошибка: неподдерживаемая версия протокола {version}".encode('utf-8'),))
+            return False
+        
+        accepted = ()
+        if EXTENSION_ZLIB in extensions and self.compression is not None:
+            accepted = (EXTENSION_ZLIB,)
+        
+        self.write((handshake_ack(version, accepted),))
+        if accepted:
+            self.compressor = self.compression.create_compressor()
+        self.framed = True
+        self.binary = version >= BINARY_VERSION
+        self.protocol_version = version
+        return True
+    
+    def wake_writer(self):
+        """Разбудить писателя после постановки данных в очередь"""
+    
+    def close(self):
+        """Закрытие после отправки уже поставленных в очередь данных"""
+        raise NotImplementedError
+    
+    def abort(self):
+        """Немедленный обрыв соединения без отправки очереди"""
+        raise NotImplementedError
+
+class SocketConnection(ClientConnection):
+    """Подключение на блокирующем сокете (режим поток-на-подключение).
+    
+    Очередь отправки разбирает отдельный поток-писатель.
+    """
+    
+    def __init__(self, sock, address=None, max_queue_bytes=DEFAULT_MAX_QUEUE_BYTES,
+                 overflow_policy=POLICY_EVICT, stats=None, compression=None):
+        super().__init__(address, max_queue_bytes, overflow_policy, stats, compression)
+        self.sock = sock
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+    
+    def _writer_loop(self):
+        """Отправка очереди клиенту, пока подключение не закрыто"""
+        while True:
+            batch = self.outbound.get_batch()
+            if not batch:
+                break
+            
+            size = sum(len(buffer) for buffer in batch)
+            try:
+                send_buffers(self.sock, batch)
+            except OSError:
+                self.outbound.close(discard=True)
+                break
+            self.outbound.mark_sent(size)
+        
+        self._shutdown_socket()
+    
+    def receive(self, bufsize=4096):
+        """Чтение из сокета. Возвращает список сообщений или None при закрытии"""
+        raw_data = self.sock.recv(bufsize)
+        if not raw_data:
+            return None
+        return self.parse(raw_data)
+    
+    def close(self):
+        """Закрытие подключения"""
+        if self.closed:
+            return
+        self.closed = True
+        self.outbound.close()
+        
+        # Будим поток чтения, если он ждет в recv
+        try:
+            self.sock.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+        
+        if self.outbound.queued_bytes:
+            timer = threading.Timer(CLOSE_FLUSH_TIMEOUT, self.abort)
+            timer.daemon = True
+            timer.start()
+    
+    def abort(self):
+        """Обрыв подключения"""
+        self.closed = True
+        self.outbound.close(discard=True)
+        self._shutdown_socket()
+    
+    def _shutdown_socket(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
@@ -0,0 +1,61 @@
+PREVIEW_LENGTH = 60  # символов последнего сообщения в /inbox
+INBOX_PAGE = 10  # диалогов в /inbox
+
+# Строка диалога на каждого участника: отправителю без непрочитанных,
+# получателю +1 к непрочитанным. Выполняется в транзакции вставки сообщения.
+CONVERSATION_SQL = '''
+    INSERT INTO conversations (user_id, partner_id, last_message_id, last_from_user_id, preview, last_at, unread)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
+    ON CONFLICT (user_id, partner_id) DO UPDATE SET
+        last_message_id = excluded.last_message_id,
+        last_from_user_id = excluded.last_from_user_id,
+        preview = excluded.preview,
+        last_at = excluded.last_at,
+        unread = unread + excluded.unread
+'''
+
+def create_conversations_table(cursor):
+    """Сводка диалогов: собеседник, последнее сообщение и число непрочитанных"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            user_id INTEGER NOT NULL,
+            partner_id INTEGER NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            last_from_user_id INTEGER NOT NULL,
+            preview TEXT NOT NULL,
+            last_at TIMESTAMP,
+            unread INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, partner_id)
+        ) WITHOUT ROWID
+    ''')
+    # /inbox: диалоги пользователя, начиная с самого свежего
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_recent
+        ON conversations (user_id, last_message_id)
+    ''')
+
+def rebuild_conversations(cursor):
+    """Пересчет сводки диалогов с нуля по приватным сообщениям"""
+    cursor.execute('DELETE FROM conversations')
+    cursor.execute(f'''
+        WITH sides AS (
+            SELECT from_user_id AS user_id, to_user_id AS partner_id, id, 0 AS unread
+            FROM private_messages
+            UNION ALL
+            SELECT to_user_id, from_user_id, id, NOT is_read
+            FROM private_messages
+        ),
+        latest AS (
+            SELECT user_id, partner_id, MAX(id) AS last_message_id, SUM(unread) AS unread
+            FROM sides GROUP BY user_id, partner_id
+        )
+        INSERT INTO conversations (user_id, partner_id, last_message_id, last_from_user_id, preview, last_at, unread)
+        SELECT latest.user_id, latest.partner_id, latest.last_message_id, pm.from_user_id,
+               substr(pm.content, 1, {PREVIEW_LENGTH}), pm.created_at, latest.unread
+        FROM latest
+        JOIN private_messages pm ON pm.id = latest.last_message_id
+    ''')
+
+def preview(content):
+    """Начало сообщения для сводки диалога"""
+    return content[:PREVIEW_LENGTH]
@@ -1,226 +1,570 @@
+import os
 import sqlite3
 import bcrypt
 from datetime import datetime
+from conversations import CONVERSATION_SQL, INBOX_PAGE, preview, rebuild_conversations
+from db_pool import DEFAULT_BUSY_TIMEOUT, DEFAULT_DB_READERS, ConnectionPool
+from migrations import apply_migrations
+from retention import (
+    ARCHIVE_BATCH, AUTO_VACUUM_INCREMENTAL, MESSAGE_COLUMNS, PRIVATE_COLUMNS, add_archived_totals, archivable,
+    archive_files, archive_path, create_archive_schema, record_archived,
+)
+from search_index import SEARCH_PAGE, SNIPPET_TOKENS, ensure_search_index, match_query
+from stats_counters import (
+    PRIVATE_RECEIVED_SQL, PRIVATE_SENT_SQL, ROOM_MESSAGE_SQL, USER_MESSAGE_SQL, StatsCounters,
+    rebuild_stats,
+)
+from user_cache import DEFAULT_USER_CACHE_SIZE, UserCache
+from write_behind import (
+    DEFAULT_BATCH_DELAY, DEFAULT_BATCH_SIZE, DURABILITY_ASYNC, DURABILITY_DIRECT, DURABILITY_GROUP,
+    WriteBehindQueue,
+)
+
+MAX_MESSAGE_ID = 2 ** 63 - 1  # граница страницы "с самого нового сообщения"
 
 class Database:
-    def __init__(self, db_name='messenger.db'):
-        self.conn = sqlite3.connect(db_name, check_same_thread=False)
+    def __init__(self, db_name='messenger.db', readers=DEFAULT_DB_READERS, busy_timeout=DEFAULT_BUSY_TIMEOUT,
+                 durability=DURABILITY_ASYNC, batch_size=DEFAULT_BATCH_SIZE, batch_delay=DEFAULT_BATCH_DELAY,
+                 user_cache_size=DEFAULT_USER_CACHE_SIZE):
+        # Страницы, освобожденные архивацией, возвращаются ОС без полного VACUUM
+        self.pool = ConnectionPool(db_name, readers, busy_timeout, AUTO_VACUUM_INCREMENTAL)
+        self.users = UserCache(user_cache_size)
+        self.counters = StatsCounters()
+        self.archive_schemas = set()  # файлы архивов, схема которых проверена
         self.create_tables()
+        self.load_counters()
+        self.durability = durability
+        self.write_behind = None
+        if durability == DURABILITY_GROUP:
+            # Отправитель ждет commit, поэтому пачку не задерживаем: в нее попадают
+            # те, кто успел встать в очередь, пока шел предыдущий commit
+            self.write_behind = WriteBehindQueue(self.pool, batch_size, 0.0)
+        elif durability == DURABILITY_ASYNC:
+            self.write_behind = WriteBehindQueue(self.pool, batch_size, batch_delay)
     
     def create_tables(self):
-        """Создание таблиц пользователей, комнат и сообщений"""
-        cursor = self.conn.cursor()
-        
-        # Таблица пользователей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица комнат
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS rooms (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL,
-                created_by INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (created_by) REFERENCES users (id)
-            )
-        ''')
-        
-        # Таблица сообщений
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                room_id INTEGER NOT NULL,
-                content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (room_id) REFERENCES rooms (id)
-            )
-        ''')
-       
-       # Таблица приватных сообщений
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS private_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                from_user_id INTEGER NOT NULL,
-                to_user_id INTEGER NOT NULL,
-                content TEXT NOT NULL,
-                is_read BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (from_user_id) REFERENCES users (id),
-                FOREIGN KEY (to_user_id) REFERENCES users (id)
-            )
-        ''')
-
+        """Создание таблиц и применение новых миграций схемы"""
+        with self.pool.write() as conn:
+            self.schema_version = apply_migrations(conn)
+            self.search_enabled = ensure_search_index(conn)
+    
+    def _write_message(self, operation):
+        """Запись сообщения в зависимости от режима durability.
         
-        # Создаем дефолтную комнату
-        cursor.execute('''
-            INSERT OR IGNORE INTO rooms (name, created_by) 
-            VALUES (?, ?)
-        ''', ('general', 1))
+        direct и group возвращают результат операции, async - Future с ним.
+        """
+        if self.write_behind is None:
+            with self.pool.write() as conn:
+                return operation(conn)
         
-        self.conn.commit()
-
+        future = self.write_behind.submit(operation)
+        if self.durability == DURABILITY_GROUP:
+            return future.result()
+        return future
+    
     def save_private_message(self, from_user_id, to_user_id, content):
         """Сохранение приватного сообщения"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO private_messages (from_user_id, to_user_id, content)
-            VALUES (?, ?, ?)
-        ''', (from_user_id, to_user_id, content))
-        self.conn.commit()
-        return cursor.lastrowid
-    
-    def get_private_messages(self, user_id, other_user_id=None, limit=50):
-        """Получение приватных сообщений между пользователями"""
-        cursor = self.conn.cursor()
-        
-        if other_user_id:
-            # Сообщения с конкретным пользователем
-            cursor.execute('''
-                SELECT pm.id, u1.username as from_user, u2.username as to_user, 
-                       pm.content, pm.created_at, pm.is_read
-                FROM private_messages pm
-                JOIN users u1 ON pm.from_user_id = u1.id
-                JOIN users u2 ON pm.to_user_id = u2.id
-                WHERE (pm.from_user_id = ? AND pm.to_user_id = ?) 
-                   OR (pm.from_user_id = ? AND pm.to_user_id = ?)
-                ORDER BY pm.created_at ASC
-                LIMIT ?
-            ''', (user_id, other_user_id, other_user_id, user_id, limit))
-        else:
-            # Все приватные сообщения пользователя
-            cursor.execute('''
-                SELECT pm.id, u1.username as from_user, u2.username as to_user, 
-                       pm.content, pm.created_at, pm.is_read
-                FROM private_messages pm
-                JOIN users u1 ON pm.from_user_id = u1.id
-                JOIN users u2 ON pm.to_user_id = u2.id
-                WHERE pm.from_user_id = ? OR pm.to_user_id = ?
-                ORDER BY pm.created_at DESC
-                LIMIT ?
-            ''', (user_id, user_id, limit))
+        short = preview(content)
+        
+        def operation(conn):
+            cursor = conn.execute('''
+                INSERT INTO private_messages (from_user_id, to_user_id, content)
+                VALUES (?, ?, ?)
+            ''', (from_user_id, to_user_id, content))
+            message_id = cursor.lastrowid
+            conn.execute(PRIVATE_SENT_SQL, (from_user_id,))
+            conn.execute(PRIVATE_RECEIVED_SQL, (to_user_id,))
+            conn.execute(CONVERSATION_SQL, (from_user_id, to_user_id, message_id, from_user_id, short, 0))
+            conn.execute(CONVERSATION_SQL, (to_user_id, from_user_id, message_id, from_user_id, short, 1))
+            return message_id
+        
+        self.counters.private_saved(from_user_id, to_user_id)
+        return self._write_message(operation)
+    
+    def get_private_messages(self, user_id, other_user_id=None, limit=50, before_id=None):
+        """Получение приватных сообщений между пользователями.
+        
+        Переписка с other_user_id - страница из limit сообщений с id меньше
+        before_id (без него - последние), от старых к новым.
+        """
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            
+            if other_user_id:
+                # Каждое направление берем отдельно по индексу (from, to, id):
+                # страница стоит одинаково при любой длине переписки
+                before_id = before_id or MAX_MESSAGE_ID
+                cursor.execute('''
+                    SELECT pm.id, pm.from_user_id, pm.to_user_id, pm.content, pm.created_at, pm.is_read
+                    FROM (
+                        SELECT id FROM (
+                            SELECT id FROM private_messages
+                            WHERE from_user_id = ? AND to_user_id = ? AND id < ?
+                            ORDER BY id DESC LIMIT ?
+                        )
+                        UNION ALL
+                        SELECT id FROM (
+                            SELECT id FROM private_messages
+                            WHERE from_user_id = ? AND to_user_id = ? AND id < ?
+                            ORDER BY id DESC LIMIT ?
+                        )
+                    ) page
+                    JOIN private_messages pm ON pm.id = page.id
+                    ORDER BY pm.id DESC
+                    LIMIT ?
+                ''', (user_id, other_user_id, before_id, limit,
+                      other_user_id, user_id, before_id, limit, limit))
+                rows = cursor.fetchall()[::-1]
+            else:
+                # Все приватные сообщения пользователя
+                cursor.execute('''
+                    SELECT id, from_user_id, to_user_id, content, created_at, is_read
+                    FROM private_messages
+                    WHERE from_user_id = ? OR to_user_id = ?
+                    ORDER BY id DESC
+                    LIMIT ?
+                ''', (user_id, user_id, limit))
+                rows = cursor.fetchall()
+            
+            # Имена вместо JOIN users: почти всегда из кеша
+            names = self._usernames(conn, [row[1] for row in rows] + [row[2] for row in rows])
+        return [(msg_id, names[from_id], names[to_id], content, created_at, is_read)
+                for msg_id, from_id, to_id, content, created_at, is_read in rows
+                if from_id in names and to_id in names]
+    
+    def get_conversations(self, user_id, limit=INBOX_PAGE):
+        """Диалоги пользователя, начиная с самого свежего.
         
-        return cursor.fetchall()
+        Строки: (собеседник, id последнего сообщения, последнее сообщение свое,
+        начало последнего сообщения, время, непрочитанных).
+        """
+        with self.pool.read() as conn:
+            rows = conn.execute('''
+                SELECT partner_id, last_message_id, last_from_user_id, preview, last_at, unread
+                FROM conversations
+                WHERE user_id = ?
+                ORDER BY last_message_id DESC
+                LIMIT ?
+            ''', (user_id, limit)).fetchall()
+            names = self._usernames(conn, [row[0] for row in rows])
+        return [(names[partner_id], message_id, from_id == user_id, text, last_at, unread)
+                for partner_id, message_id, from_id, text, last_at, unread in rows
+                if partner_id in names]
+    
+    def get_unread_count(self, user_id):
+        """(непрочитанных сообщений, диалогов с ними)"""
+        with self.pool.read() as conn:
+            return conn.execute('''
+                SELECT COALESCE(SUM(unread), 0), COUNT(*)
+                FROM conversations
+                WHERE user_id = ? AND unread > 0
+            ''', (user_id,)).fetchone()
     
     def get_conversation_partners(self, user_id):
         """Получение списка пользователей, с которыми есть приватные сообщения"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT DISTINCT u.id, u.username
-            FROM users u
-            WHERE u.id IN (
-                SELECT from_user_id FROM private_messages WHERE to_user_id = ?
-                UNION
-                SELECT to_user_id FROM private_messages WHERE from_user_id = ?
-            )
-        ''', (user_id, user_id))
-        return cursor.fetchall()
+        with self.pool.read() as conn:
+            partner_ids = [row[0] for row in conn.execute(
+                'SELECT partner_id FROM conversations WHERE user_id = ?', (user_id,)
+            )]
+            names = self._usernames(conn, partner_ids)
+        return [(partner_id, names[partner_id]) for partner_id in partner_ids if partner_id in names]
     
     def mark_messages_as_read(self, user_id, from_user_id):
         """Пометить сообщения как прочитанные"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            UPDATE private_messages 
-            SET is_read = TRUE 
-            WHERE to_user_id = ? AND from_user_id = ? AND is_read = FALSE
-        ''', (user_id, from_user_id))
-        self.conn.commit()
-        return cursor.rowcount
+        def operation(conn):
+            # Счетчик диалога - поиск по первичному ключу; если читать нечего,
+            # сами сообщения не трогаем
+            if not conn.execute('''
+                UPDATE conversations SET unread = 0
+                WHERE user_id = ? AND partner_id = ? AND unread > 0
+            ''', (user_id, from_user_id)).rowcount:
+                return 0
+            return conn.execute('''
+                UPDATE private_messages 
+                SET is_read = TRUE 
+                WHERE to_user_id = ? AND from_user_id = ? AND is_read = FALSE
+            ''', (user_id, from_user_id)).rowcount
+        
+        # Через ту же очередь, чтобы не обогнать еще не записанные сообщения
+        return self._write_message(operation)
     
     def get_user_by_username(self, username):
         """Получение пользователя по имени"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, username FROM users WHERE username = ?', (username,))
-        return cursor.fetchone()    
+        user_id = self.users.get_id(username)
+        if user_id is not None:
+            return user_id, username
+        
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, username FROM users WHERE username = ?', (username,))
+            user = cursor.fetchone()
+        if user is not None:
+            self.users.put(*user)
+        return user
     
-    def register_user(self, username, password):
-        """Регистрация нового пользователя"""
+    def register_user(self, username, password, password_hash=None):
+        """Регистрация нового пользователя (хеш можно посчитать заранее, вне потока сервера)"""
         try:
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT INTO users (username, password_hash)
-                VALUES (?, ?)
-            ''', (username, password_hash))
-            self.conn.commit()
+            if password_hash is None:
+                password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+            with self.pool.write() as conn:
+                conn.execute('''
+                    INSERT INTO users (username, password_hash)
+                    VALUES (?, ?)
+                ''', (username, password_hash))
+            self.users.invalidate(username=username)
+            self.counters.user_registered()
             return True, "Регистрация успешна"
         except sqlite3.IntegrityError:
             return False, "Пользователь уже существует"
         except Exception as e:
             return False, f"Ошибка регистрации: {str(e)}"
     
+    def get_password_hash(self, username):
+        """(user_id, password_hash) пользователя или None"""
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, password_hash FROM users WHERE username = ?
+            ''', (username,))
+            record = cursor.fetchone()
+        if record is not None:
+            # Вошедший пользователь скоро понадобится в истории и /msg
+            self.users.put(record[0], username)
+        return record
+    
     def verify_user(self, username, password):
         """Проверка логина и пароля"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT id, password_hash FROM users WHERE username = ?
-        ''', (username,))
-        
-        result = cursor.fetchone()
+        result = self.get_password_hash(username)
         if result and bcrypt.checkpw(password.encode('utf-8'), result[1]):
             return True, result[0]  # user_id
         return False, "Неверный логин или пароль"
     
     def get_user_by_id(self, user_id):
         """Получение пользователя по ID"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, username FROM users WHERE id = ?', (user_id,))
-        return cursor.fetchone()
+        username = self.users.get_name(user_id)
+        if username is not None:
+            return user_id, username
+        
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, username FROM users WHERE id = ?', (user_id,))
+            user = cursor.fetchone()
+        if user is not None:
+            self.users.put(*user)
+        return user
+    
+    def _usernames(self, conn, user_ids):
+        """{id: имя} для user_ids: из кеша, недостающие - одним запросом"""
+        names, missing = self.users.get_names(user_ids)
+        if missing:
+            missing = list(missing)
+            placeholders = ','.join('?' * len(missing))
+            for user_id, username in conn.execute(
+                f'SELECT id, username FROM users WHERE id IN ({placeholders})', missing
+            ):
+                names[user_id] = username
+                self.users.put(user_id, username)
+        return names
     
     def create_room(self, room_name, created_by):
         """Создание новой комнаты"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT INTO rooms (name, created_by)
-                VALUES (?, ?)
-            ''', (room_name, created_by))
-            self.conn.commit()
+            with self.pool.write() as conn:
+                conn.execute('''
+                    INSERT INTO rooms (name, created_by)
+                    VALUES (?, ?)
+                ''', (room_name, created_by))
             return True, "Комната создана"
         except sqlite3.IntegrityError:
             return False, "Комната уже существует"
     
     def get_rooms(self):
         """Получение списка всех комнат"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT r.id, r.name, u.username 
-            FROM rooms r 
-            LEFT JOIN users u ON r.created_by = u.id
-        ''')
-        return cursor.fetchall()
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT r.id, r.name, u.username 
+                FROM rooms r 
+                LEFT JOIN users u ON r.created_by = u.id
+            ''')
+            return cursor.fetchall()
     
     def save_message(self, user_id, room_id, content):
         """Сохранение сообщения в базу"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO messages (user_id, room_id, content)
-            VALUES (?, ?, ?)
-        ''', (user_id, room_id, content))
-        self.conn.commit()
-        return cursor.lastrowid
-    
-    def get_message_history(self, room_id, limit=50):
-        """Получение истории сообщений комнаты"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT m.id, u.username, m.content, m.created_at
-            FROM messages m
-            JOIN users u ON m.user_id = u.id
-            WHERE m.room_id = ?
-            ORDER BY m.created_at DESC
-            LIMIT ?
-        ''', (room_id, limit))
-        return cursor.fetchall()[::-1]  # Переворачиваем чтобы новые были в конце
+        def operation(conn):
+            cursor = conn.execute('''
+                INSERT INTO messages (user_id, room_id, content)
+                VALUES (?, ?, ?)
+            ''', (user_id, room_id, content))
+            conn.execute(USER_MESSAGE_SQL, (user_id,))
+            conn.execute(ROOM_MESSAGE_SQL, (room_id,))
+            return cursor.lastrowid
+        
+        self.counters.message_saved(user_id, room_id)
+        return self._write_message(operation)
+    
+    def get_message_history(self, room_id, limit=50, before_id=None):
+        """Получение истории сообщений комнаты: limit сообщений с id меньше before_id
+        (без него - последние). Постраничный обход по id, без OFFSET."""
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, content, created_at
+                FROM messages
+                WHERE room_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (room_id, before_id or MAX_MESSAGE_ID, limit))
+            rows = cursor.fetchall()[::-1]  # Переворачиваем чтобы новые были в конце
+            names = self._usernames(conn, [row[1] for row in rows])
+        return [(msg_id, names[user_id], content, created_at)
+                for msg_id, user_id, content, created_at in rows if user_id in names]
 
+    def search(self, user_id, text, room_id=None, limit=SEARCH_PAGE, offset=0):
+        """Поиск по сообщениям комнат и личным сообщениям пользователя, лучшие совпадения первыми.
+        
+        Строки: (id, room_id или None для ЛС, отправитель, получатель ЛС или None,
+        фрагмент с совпадением, время). С room_id ищет только в этой комнате.
+        """
+        query = match_query(text)
+        if not query:
+            return []
+        
+        with self.pool.read() as conn:
+            rows = self._search_rows(conn, 'main', query, user_id, room_id, limit, offset)
+            return self._search_results(conn, rows)
+    
+    def search_archives(self, user_id, text, room_id=None, limit=SEARCH_PAGE):
+        """Поиск по архивам: сначала самые свежие месяцы, строки как у search()"""
+        query = match_query(text)
+        if not query:
+            return []
+        
+        rows = []
+        with self.pool.read() as conn:
+            for path in archive_files(self.pool.path):
+                conn.execute('ATTACH DATABASE ? AS archive', (path,))
+                try:
+                    if conn.execute(
+                        "SELECT 1 FROM archive.sqlite_master WHERE name = 'messages_fts'"
+                    ).fetchone() is not None:
+                        rows += self._search_rows(conn, 'archive', query, user_id, room_id, limit - len(rows), 0)
+                finally:
+                    conn.execute('DETACH DATABASE archive')
+                if len(rows) >= limit:
+                    break
+            return self._search_results(conn, rows)
+    
+    def _search_rows(self, conn, schema, query, user_id, room_id, limit, offset):
+        """Совпадения в основной базе (schema='main') или подключенном архиве"""
+        # Фрагменты: совпадения в [скобках]; bm25 - чем меньше, тем точнее
+        room_sql = f'''
+            SELECT m.id, m.room_id, m.user_id, NULL,
+                   snippet(messages_fts, 0, '[', ']', '…', {SNIPPET_TOKENS}), m.created_at,
+                   bm25(messages_fts) AS rank
+            FROM {schema}.messages_fts
+            JOIN {schema}.messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ?
+        '''
+        if room_id is not None:
+            sql = room_sql + ' AND m.room_id = ? ORDER BY rank LIMIT ? OFFSET ?'
+            params = (query, room_id, limit, offset)
+        else:
+            # Личные сообщения - только свои: отправленные или полученные
+            sql = room_sql + f'''
+                UNION ALL
+                SELECT pm.id, NULL, pm.from_user_id, pm.to_user_id,
+                       snippet(private_messages_fts, 0, '[', ']', '…', {SNIPPET_TOKENS}), pm.created_at,
+                       bm25(private_messages_fts) AS rank
+                FROM {schema}.private_messages_fts
+                JOIN {schema}.private_messages pm ON pm.id = private_messages_fts.rowid
+                WHERE private_messages_fts MATCH ? AND (pm.from_user_id = ? OR pm.to_user_id = ?)
+                ORDER BY rank LIMIT ? OFFSET ?
+            '''
+            params = (query, query, user_id, user_id, limit, offset)
+        return conn.execute(sql, params).fetchall()
+    
+    def _search_results(self, conn, rows):
+        """Строки поиска с именами вместо id пользователей"""
+        user_ids = [row[2] for row in rows] + [row[3] for row in rows if row[3] is not None]
+        names = self._usernames(conn, user_ids)
+        return [(msg_id, found_room_id, names.get(sender_id, '?'),
+                 names.get(recipient_id, '?') if recipient_id is not None else None, fragment, created_at)
+                for msg_id, found_room_id, sender_id, recipient_id, fragment, created_at, _ in rows]
+    
+    def get_retention_policies(self):
+        """[(room_id, хранить дней)] комнат со сроком хранения"""
+        with self.pool.read() as conn:
+            return conn.execute('SELECT room_id, keep_days FROM room_retention ORDER BY room_id').fetchall()
+    
+    def set_retention(self, room_id, keep_days):
+        """Срок хранения сообщений комнаты в днях; None - хранить всегда"""
+        with self.pool.write() as conn:
+            if keep_days is None:
+                conn.execute('DELETE FROM room_retention WHERE room_id = ?', (room_id,))
+            else:
+                conn.execute('''
+                    INSERT INTO room_retention (room_id, keep_days) VALUES (?, ?)
+                    ON CONFLICT (room_id) DO UPDATE SET keep_days = excluded.keep_days
+                ''', (room_id, keep_days))
+    
+    def archive_room_messages(self, room_id, border, limit=ARCHIVE_BATCH):
+        """Перенос в архив до limit самых старых сообщений комнаты старше border; сколько перенесено"""
+        with self.pool.read() as conn:
+            rows = conn.execute('''
+                SELECT id, created_at FROM messages WHERE room_id = ? ORDER BY id LIMIT ?
+            ''', (room_id, limit)).fetchall()
+        batch = archivable(rows, border)
+        if batch:
+            self._move_to_archive('messages', MESSAGE_COLUMNS, [row[0] for row in batch], batch[0][1])
+        return len(batch)
+    
+    def archive_private_messages(self, border, after_id=0, limit=ARCHIVE_BATCH):
+        """Перенос в архив прочитанных ЛС старше border с id больше after_id.
+        
+        Возвращает (перенесено, id последнего просмотренного): непрочитанные
+        пропускаются, поэтому следующая пачка начинается после просмотренных.
+        """
+        with self.pool.read() as conn:
+            rows = conn.execute('''
+                SELECT id, created_at, is_read FROM private_messages WHERE id > ? ORDER BY id LIMIT ?
+            ''', (after_id, limit)).fetchall()
+        batch = archivable(rows, border)
+        if not batch:
+            return 0, after_id
+        ids = [row[0] for row in batch if row[2]]
+        if ids:
+            self._move_to_archive('private_messages', PRIVATE_COLUMNS, ids, batch[0][1])
+        return len(ids), batch[-1][0]
+    
+    def _move_to_archive(self, table, columns, ids, created_at):
+        """Копирование строк в архив месяца created_at и удаление из основной базы.
+        
+        Транзакция с подключенной базой атомарна только в пределах каждого
+        файла, поэтому копия делается через INSERT OR IGNORE: пачку,
+        прерванную между двумя файлами, можно просто перенести повторно.
+        """
+        path = archive_path(self.pool.path, created_at)
+        if path not in self.archive_schemas:
+            # Архив мог быть создан на SQLite без FTS5: индекс добавится сейчас
+            create_archive_schema(path)
+            self.archive_schemas.add(path)
+        
+        column_list = ', '.join(columns)
+        placeholders = ','.join('?' * len(ids))
+        with self.pool.write() as conn:
+            conn.execute('ATTACH DATABASE ? AS archive', (path,))
+            try:
+                conn.execute(f'''
+                    INSERT OR IGNORE INTO archive.{table} ({column_list})
+                    SELECT {column_list} FROM main.{table} WHERE id IN ({placeholders})
+                ''', ids)
+                record_archived(conn, table, ids)
+                # Триггеры удаления убирают сообщения и из полнотекстового индекса
+                conn.execute(f'DELETE FROM main.{table} WHERE id IN ({placeholders})', ids)
+                conn.commit()
+            except:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute('DETACH DATABASE archive')
+    
+    def incremental_vacuum(self, pages):
+        """Возврат ОС до pages свободных страниц; сколько возвращено"""
+        with self.pool.write() as conn:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+                return 0
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            # executescript выполняет прагму до конца, execute - только первый шаг
+            conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+            return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+    
+    def compact(self):
+        """Полный VACUUM с включением auto_vacuum=INCREMENTAL (для баз, созданных без него).
+        
+        В WAL VACUUM не меняет auto_vacuum, поэтому на время сжатия база
+        переводится в обычный журнал. Переписывает весь файл и держит
+        базу до конца. Возвращает, включен ли теперь incremental_vacuum.
+        """
+        self.flush()
+        with self.pool.exclusive() as conn:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            try:
+                journal_mode = conn.execute('PRAGMA journal_mode=DELETE').fetchone()[0]
+            except sqlite3.OperationalError:
+                # Базу держат другие процессы (воркеры кластера): из WAL не выйти
+                return False
+            try:
+                conn.execute(f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}')
+                conn.executescript('VACUUM')
+            finally:
+                if journal_mode != self.pool.journal_mode:
+                    conn.execute(f'PRAGMA journal_mode={self.pool.journal_mode}')
+            return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+    
+    def file_size(self):
+        """(размер файла базы в байтах, свободных страниц)"""
+        with self.pool.read() as conn:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return page_size * page_count, free_pages
+    
+    def load_counters(self):
+        """Перечитывание счетчиков из таблиц статистики"""
+        with self.pool.read() as conn:
+            self.counters.load(conn)
+    
+    def _fresh_counters(self):
+        """Счетчики в памяти, перечитанные, если устарели"""
+        if self.counters.stale():
+            # Сначала дописываем очередь, иначе свежие сообщения пропадут из счетчиков
+            self.flush()
+            self.load_counters()
+        return self.counters
+    
+    def rebuild_counters(self):
+        """Пересчет таблиц статистики и сводки диалогов с нуля по сообщениям и итогам архива"""
+        self.flush()
+        with self.pool.write() as conn:
+            rebuild_stats(conn.cursor())
+            rebuild_conversations(conn.cursor())
+            add_archived_totals(conn.cursor())
+        self.load_counters()
+    
+    def get_totals(self):
+        """(пользователей, сообщений в чатах, приватных сообщений)"""
+        return self._fresh_counters().totals()
+    
+    def get_user_stats(self, user_id):
+        """(сообщений в чатах, отправлено ЛС, получено ЛС) пользователя"""
+        return self._fresh_counters().user(user_id)
+    
+    def get_room_stats(self):
+        """[(комната, число сообщений)]"""
+        counts = self._fresh_counters().room_counts()
+        return [(room_name, counts.get(room_id, 0)) for room_id, room_name, _ in self.get_rooms()]
+    
+    def get_top_users(self, limit=10):
+        """[(имя, число сообщений, время последнего сообщения)] самых активных пользователей"""
+        top = self._fresh_counters().top_users(limit)
+        with self.pool.read() as conn:
+            names = self._usernames(conn, [user_id for user_id, _, _ in top])
+        return [(names[user_id], count, last_active) for user_id, count, last_active in top
+                if user_id in names]
+    
+    def flush(self):
+        """Ожидание записи сообщений из очереди"""
+        if self.write_behind is not None:
+            self.write_behind.flush()
+    
+    def checkpoint(self):
+        """Перенос журнала WAL в основной файл базы"""
+        self.pool.checkpoint()
+    
     def close(self):
-        """Закрытие соединения с БД"""
-        self.conn.close()
\ No newline at end of file
+        """Закрытие соединений с БД"""
+        if self.write_behind is not None:
+            self.write_behind.close()
+        self.pool.close()
\ No newline at end of file
@@ -0,0 +1,139 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_DB_READERS = 4
+DEFAULT_BUSY_TIMEOUT = 5000  # мс
+
+class PoolStats:
+    """Счетчики ожидания соединений пула"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.read_waits = 0
+        self.read_wait_time = 0.0
+        self.read_wait_max = 0.0
+        self.writes = 0
+        self.write_waits = 0
+        self.write_wait_time = 0.0
+        self.write_wait_max = 0.0
+    
+    def record_read(self, waited, wait_time):
+        with self.lock:
+            self.reads += 1
+            if waited:
+                self.read_waits += 1
+                self.read_wait_time += wait_time
+                self.read_wait_max = max(self.read_wait_max, wait_time)
+    
+    def record_write(self, waited, wait_time):
+        with self.lock:
+            self.writes += 1
+            if waited:
+                self.write_waits += 1
+                self.write_wait_time += wait_time
+                self.write_wait_max = max(self.write_wait_max, wait_time)
+
+class ConnectionPool:
+    """Соединения SQLite в режиме WAL: одно на запись и несколько на чтение.
+    
+    В WAL читатели не блокируются писателем и друг другом, поэтому чтение
+    истории идет параллельно с записью сообщений. Записи выполняются по одной
+    через общий замок (SQLite все равно допускает одного писателя), каждая
+    в своей транзакции: commit при успехе, rollback при исключении.
+    """
+    
+    def __init__(self, path, readers=DEFAULT_DB_READERS, busy_timeout=DEFAULT_BUSY_TIMEOUT, auto_vacuum=None):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.stats = PoolStats()
+        self.writer = self._connect()
+        if auto_vacuum is not None and self.writer.execute('SELECT 1 FROM sqlite_master').fetchone() is None:
+            # Режим auto_vacuum новой базы задается до первой таблицы и до
+            # перехода в WAL: потом его меняет только VACUUM вне WAL
+            self.writer.execute(f"PRAGMA auto_vacuum={int(auto_vacuum)}")
+        self.journal_mode = self.writer.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        self.writer_lock = threading.Lock()
+        self.size = readers
+        self.readers = queue.Queue()
+        for _ in range(readers):
+            self.readers.put(self._connect_reader())
+    
+    def _connect_reader(self):
+        reader = self._connect()
+        reader.execute("PRAGMA query_only=ON")
+        return reader
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        # В WAL synchronous=NORMAL не теряет целостность, fsync только при checkpoint
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    @contextmanager
+    def read(self):
+        """Соединение для чтения на время блока with"""
+        try:
+            conn = self.readers.get_nowait()
+            self.stats.record_read(False, 0.0)
+        except queue.Empty:
+            start = time.monotonic()
+            conn = self.readers.get()
+            self.stats.record_read(True, time.monotonic() - start)
+        try:
+            yield conn
+        finally:
+            self.readers.put(conn)
+    
+    @contextmanager
+    def write(self):
+        """Соединение для записи на время блока with, с транзакцией"""
+        if self.writer_lock.acquire(blocking=False):
+            self.stats.record_write(False, 0.0)
+        else:
+            start = time.monotonic()
+            self.writer_lock.acquire()
+            self.stats.record_write(True, time.monotonic() - start)
+        try:
+            yield self.writer
+            self.writer.commit()
+        except:
+            self.writer.rollback()
+            raise
+        finally:
+            self.writer_lock.release()
+    
+    @contextmanager
+    def exclusive(self):
+        """Соединение для записи, пока других соединений пула нет.
+        
+        Нужно для операций, которым мешают даже простаивающие соединения:
+        выход из WAL и VACUUM. Читатели закрываются и после блока открываются
+        заново. Транзакциями внутри блока управляет вызывающий.
+        """
+        with self.writer_lock:
+            for _ in range(self.size):
+                self.readers.get().close()
+            try:
+                yield self.writer
+            finally:
+                for _ in range(self.size):
+                    self.readers.put(self._connect_reader())
+    
+    def checkpoint(self):
+        """Перенос WAL в основной файл базы"""
+        with self.writer_lock:
+            self.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    
+    def close(self):
+        with self.writer_lock:
+            self.writer.close()
+        for _ in range(self.size):
+            try:
+                self.readers.get(timeout=self.busy_timeout / 1000).close()
+            except queue.Empty:
+                break
@@ -0,0 +1,134 @@
+import os
+import re
+import sys
+import tempfile
+
+from conversations import rebuild_conversations
+from database import Database
+from write_behind import DURABILITY_DIRECT
+
+# Таблицы, которые растут без ограничений: полный проход по ним на горячем пути - ошибка
+LARGE_TABLES = ('messages', 'private_messages')
+RANGE_ON_ROWID = re.compile(r'USING INTEGER PRIMARY KEY \(rowid[<>]=?\?\)$')
+USERS = 20
+ROOMS = 5
+MESSAGES = 2000
+
+def find_user(db):
+    """Поиск пользователя мимо кеша: иначе до базы запрос не доходит"""
+    db.users.invalidate(username='user1')
+    return db.get_user_by_username('user1')
+
+# Горячие запросы сервера: (название, вызов методов Database)
+HOT_PATHS = [
+    ("история комнаты", lambda db: db.get_message_history(2, 20)),
+    ("история комнаты, страница", lambda db: db.get_message_history(2, 20, before_id=1000)),
+    ("переписка /chat", lambda db: db.get_private_messages(1, 2, limit=20)),
+    ("переписка /chat, страница", lambda db: db.get_private_messages(1, 2, limit=20, before_id=1000)),
+    ("входящие /inbox", lambda db: db.get_conversations(1)),
+    ("непрочитанные при входе", lambda db: db.get_unread_count(1)),
+    ("собеседники", lambda db: db.get_conversation_partners(1)),
+    ("пометка прочитанными", lambda db: db.mark_messages_as_read(2, 1)),
+    ("поиск пользователя", find_user),
+    ("вход", lambda db: db.get_password_hash('user1')),
+    ("поиск /search", lambda db: db.search(1, 'текст')),
+    ("поиск /search в комнате", lambda db: db.search(1, 'текст', 2)),
+]
+
+def fill(db):
+    with db.pool.write() as conn:
+        conn.executemany(
+            "INSERT INTO users (username, password_hash) VALUES (?, 'x')",
+            [(f"user{i}",) for i in range(1, USERS + 1)]
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO rooms (name, created_by) VALUES (?, 1)",
+            [(f"room{i}",) for i in range(1, ROOMS + 1)]
+        )
+        conn.executemany(
+            "INSERT INTO messages (user_id, room_id, content) VALUES (?, ?, 'текст')",
+            [(i % USERS + 1, i % ROOMS + 1) for i in range(MESSAGES)]
+        )
+        conn.executemany(
+            "INSERT INTO private_messages (from_user_id, to_user_id, content) VALUES (?, ?, 'текст')",
+            [(i % USERS + 1, (i * 7 + 1) % USERS + 1) for i in range(MESSAGES)]
+        )
+        rebuild_conversations(conn.cursor())
+
+def capture_statements(db, call):
+    """SQL, который выполняет call(db), с подставленными параметрами"""
+    statements = []
+    connections = [db.pool.writer] + list(db.pool.readers.queue)
+    for conn in connections:
+        conn.set_trace_callback(statements.append)
+    try:
+        call(db)
+    finally:
+        for conn in connections:
+            conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))]
+
+def table_aliases(sql):
+    """Псевдоним -> таблица для FROM и JOIN запроса (план показывает псевдонимы)"""
+    aliases = {}
+    for table, alias in re.findall(r'(?:FROM|JOIN|UPDATE)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.I):
+        aliases[table] = table
+        if alias and alias.upper() not in ('WHERE', 'JOIN', 'LEFT', 'ON', 'SET', 'ORDER', 'GROUP', 'LIMIT'):
+            aliases[alias] = table
+    return aliases
+
+def full_scans(sql, plan):
+    """Шаги плана с полным проходом по большой таблице"""
+    aliases = table_aliases(sql)
+    scans = []
+    for _, _, _, detail in plan:
+        words = detail.split()
+        if len(words) < 2 or aliases.get(words[1]) not in LARGE_TABLES:
+            continue
+        # Диапазон только по rowid (id < before_id) без индекса по условию - тот же полный проход
+        if words[0] == 'SCAN' and 'USING' not in words or RANGE_ON_ROWID.search(detail):
+            scans.append(detail)
+    return scans
+
+def query_plans(db, call):
+    """[(sql, план)] для каждого запроса, который выполняет call(db)"""
+    return [
+        (sql, db.pool.writer.execute("EXPLAIN QUERY PLAN " + sql).fetchall())
+        for sql in capture_statements(db, call)
+    ]
+
+def explain(path):
+    """Планы горячих запросов; возвращает число запросов с полным проходом"""
+    db = Database(path, durability=DURABILITY_DIRECT)
+    fill(db)
+    failures = 0
+    
+    print(f"Версия схемы: {db.schema_version}")
+    for name, call in HOT_PATHS:
+        for sql, plan in query_plans(db, call):
+            scans = full_scans(sql, plan)
+            status = "❌" if scans else "✅"
+            failures += bool(scans)
+            print(f"\n{status} {name}: {' '.join(sql.split())[:100]}")
+            for _, _, _, detail in plan:
+                print(f"    {detail}")
+    
+    db.close()
+    return failures
+
+def run_check():
+    print("=" * 72)
+    print("ПЛАНЫ ГОРЯЧИХ ЗАПРОСОВ (EXPLAIN QUERY PLAN)")
+    print("=" * 72)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        failures = explain(os.path.join(directory, 'explain.db'))
+    
+    if failures:
+        print(f"\nЗапросов с полным проходом по большим таблицам: {failures}")
+        return 1
+    print("\nВсе горячие запросы используют индексы")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run_check())
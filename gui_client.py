@@ -1,23 +1,36 @@
+import argparse
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import socket
 import threading
 import json
+import random
 import time
+from messages import render_typed
+from protocol import (
+    ClientProtocol, connect_socket, MSG_HISTORY, MSG_PRIVATE, MSG_ROOMS, MSG_SYSTEM, MSG_USERS
+)
+
+RESUME_JITTER = 2.0
 
 class ChatClientGUI:
-    def __init__(self):
+    def __init__(self, host='localhost', port=5555, socket_path=None):
         self.root = tk.Tk()
         self.root.title("Мессенджер")
         self.root.geometry("800x600")
         self.root.configure(bg='#2b2b2b')
         
         # Переменные
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
         self.socket = None
+        self.protocol = None
         self.connected = False
         self.username = None
         self.user_id = None
         self.current_room = "general"
+        self.session_token = None
         
         # Создаем интерфейс
         self.create_login_frame()
@@ -310,8 +323,9 @@ class ChatClientGUI:
     def connect_to_server(self):
         """Подключение к серверу"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect(('localhost', 5555))
+            self.socket = connect_socket(self.host, self.port, self.socket_path)
+            self.protocol = ClientProtocol(self.socket, binary=True, compress=True)
+            self.protocol.handshake()
             self.connected = True
             self.status_label.config(text="Подключено", fg='green')
             
@@ -338,7 +352,7 @@ class ChatClientGUI:
         
         # Отправляем команду входа
         command = f"/login {username} {password}"
-        self.socket.send(command.encode('utf-8'))
+        self.protocol.send(command)
     
     def register(self):
         """Регистрация нового пользователя"""
@@ -358,13 +372,13 @@ class ChatClientGUI:
         
         # Отправляем команду регистрации
         command = f"/register {username} {password}"
-        self.socket.send(command.encode('utf-8'))
+        self.protocol.send(command)
     
     def logout(self):
         """Выход из системы"""
         if self.socket:
             try:
-                self.socket.send("/exit".encode('utf-8'))
+                self.protocol.send("/exit")
                 self.socket.close()
             except:
                 pass
@@ -373,6 +387,7 @@ class ChatClientGUI:
         self.username = None
         self.user_id = None
         self.current_room = "general"
+        self.session_token = None
         
         # Очищаем интерфейс
         self.messages_text.config(state='normal')
@@ -388,12 +403,13 @@ class ChatClientGUI:
         """Получение сообщений от сервера"""
         while self.connected:
             try:
-                data = self.socket.recv(1024).decode('utf-8')
-                if not data:
+                messages = self.protocol.receive()
+                if messages is None:
                     break
                 
-                # Обрабатываем сообщение в основном потоке
-                self.root.after(0, self.process_message, data)
+                # Обрабатываем сообщения в основном потоке
+                for message in messages:
+                    self.root.after(0, self.process_message, message)
                 
             except Exception as e:
                 if self.connected:
@@ -401,17 +417,80 @@ class ChatClientGUI:
                 break
         
         if self.connected:
-            self.root.after(0, self.logout)
+            self.root.after(0, self.reconnect)
+    
+    def reconnect(self):
+        """Возврат в сессию по токену после обрыва связи, без повторного ввода пароля"""
+        if not self.session_token:
+            self.logout()
+            return
+        
+        self.connected = False
+        self.status_label.config(text="Переподключение...", fg='orange')
+        threading.Thread(target=self.resume_session, daemon=True).start()
+    
+    def resume_session(self):
+        """Попытки переподключения с нарастающей паузой (в фоновом потоке)"""
+        # Случайная пауза: после перезапуска сервера клиенты возвращаются не все разом
+        time.sleep(random.uniform(0, RESUME_JITTER))
+        delay = 0.5
+        for _ in range(5):
+            try:
+                sock = connect_socket(self.host, self.port, self.socket_path)
+                protocol = ClientProtocol(sock, binary=True, compress=True)
+                protocol.handshake()
+                protocol.send(f"/resume {self.session_token}")
+            except OSError:
+                time.sleep(delay)
+                delay *= 2
+                continue
+            
+            self.root.after(0, self.on_resumed, sock, protocol)
+            return
+        
+        self.root.after(0, self.logout)
+    
+    def on_resumed(self, sock, protocol):
+        """Соединение восстановлено, ответ на /resume придет в receive_messages"""
+        self.socket = sock
+        self.protocol = protocol
+        self.connected = True
+        self.status_label.config(text="Подключено", fg='green')
+        
+        receive_thread = threading.Thread(target=self.receive_messages, daemon=True)
+        receive_thread.start()
     
     def process_message(self, message):
         """Обработка полученного сообщения"""
-        if message == "Успешный вход!":
+        if not isinstance(message, str):
+            self.process_typed(*message)
+        
+        elif message == "Успешный вход!":
             self.username = self.username_entry.get().strip()
             self.user_info_label.config(text=f"Пользователь: {self.username} | Комната: {self.current_room}")
             self.show_chat()
             self.refresh_rooms()
             self.refresh_users()
         
+        elif message.startswith("Токен сессии:"):
+            self.session_token = message.split(":", 1)[1].strip()
+        
+        elif message.startswith("Сессия восстановлена!"):
+            self.current_room = message.split("Комната:", 1)[1].strip()
+            self.user_info_label.config(text=f"Пользователь: {self.username} | Комната: {self.current_room}")
+            self.display_system_message("Соединение восстановлено")
+            self.refresh_rooms()
+            self.refresh_users()
+        
+        elif message.startswith("🔒 Вы были отключены"):
+            # Не обрыв связи: без токена reconnect() не пошлет /resume и выйдет к окну входа
+            self.session_token = None
+            messagebox.showwarning("Отключение", message)
+        
+        elif message.startswith("Ошибка: Сессия"):
+            messagebox.showerror("Ошибка", message)
+            self.logout()
+        
         elif message.startswith("Ошибка:"):
             messagebox.showerror("Ошибка", message)
             self.socket.close()
@@ -432,26 +511,45 @@ class ChatClientGUI:
         elif message.startswith("Пользователи онлайн:"):
             self.update_users_list(message)
         
-        elif message.startswith("История сообщений:") or message.startswith("История чата с") or message.startswith("Последние сообщения:") or message.startswith("Ваша информация:") or message.startswith("Информация о базе данных:"):
+        elif message.startswith("История сообщений:") or message.startswith("История чата с") or message.startswith("История комнаты") or message.startswith("Результаты поиска") or message.startswith("Последние сообщения:") or message.startswith("Непрочитанных личных сообщений") or message.startswith("Ваша информация:") or message.startswith("Информация о базе данных:"):
             self.display_system_message(message)
         
         else:
             self.display_message(message)
     
-    def display_message(self, message):
+    def process_typed(self, kind, value):
+        """Обработка двоичного сообщения (протокол версии 3): разбирать текст не нужно"""
+        if kind == MSG_ROOMS:
+            self.set_rooms_list(value)
+        
+        elif kind == MSG_USERS and not value[0]:
+            self.set_users_list(value[1])
+        
+        elif kind in (MSG_USERS, MSG_HISTORY):
+            self.display_system_message(render_typed(kind, value))
+        
+        elif kind == MSG_PRIVATE:
+            self.display_message(render_typed(kind, value), "private")
+        
+        elif kind == MSG_SYSTEM:
+            self.display_message(render_typed(kind, value), "system")
+        
+        else:
+            self.display_message(render_typed(kind, value), "normal")
+    
+    def display_message(self, message, tag=None):
         """Отображение сообщения в чате"""
         self.messages_text.config(state='normal')
         
         # Определяем цвет сообщения
-        if message.startswith('[ЛС от') or message.startswith('[ЛС для'):
-            tag = "private"
-            color = "#FF9800"  # оранжевый
-        elif message.startswith('[СИСТЕМА]'):
-            tag = "system"
-            color = "#f44336"  # красный
-        else:
-            tag = "normal"
-            color = "white"
+        if tag is None:
+            if message.startswith('[ЛС от') or message.startswith('[ЛС для'):
+                tag = "private"
+            elif message.startswith('[СИСТЕМА]'):
+                tag = "system"
+            else:
+                tag = "normal"
+        color = {"private": "#FF9800", "system": "#f44336"}.get(tag, "white")  # оранжевый / красный
         
         # Создаем тег для цвета
         self.messages_text.tag_config(tag, foreground=color)
@@ -471,25 +569,27 @@ class ChatClientGUI:
         self.messages_text.config(state='disabled')
     
     def update_rooms_list(self, message):
-        """Обновление списка комнат"""
-        self.rooms_listbox.delete(0, tk.END)
-        
+        """Обновление списка комнат из текстового ответа"""
         lines = message.split('\n')[1:]  # Пропускаем первую строку "Доступные комнаты:"
-        for line in lines:
-            if line.startswith('- '):
-                room_name = line[2:].strip()
-                self.rooms_listbox.insert(tk.END, room_name)
+        self.set_rooms_list(line[2:].strip() for line in lines if line.startswith('- '))
+    
+    def set_rooms_list(self, room_names):
+        """Заполнение списка комнат"""
+        self.rooms_listbox.delete(0, tk.END)
+        for room_name in room_names:
+            self.rooms_listbox.insert(tk.END, room_name)
     
     def update_users_list(self, message):
-        """Обновление списка пользователей"""
-        self.users_listbox.delete(0, tk.END)
-        
+        """Обновление списка пользователей из текстового ответа"""
         lines = message.split('\n')[1:]  # Пропускаем первую строку "Пользователи онлайн:"
-        for line in lines:
-            if line.startswith('- '):
-                username = line[2:].strip()
-                if username != self.username:  # Не показываем себя в списке
-                    self.users_listbox.insert(tk.END, username)
+        self.set_users_list(line[2:].strip() for line in lines if line.startswith('- '))
+    
+    def set_users_list(self, usernames):
+        """Заполнение списка пользователей"""
+        self.users_listbox.delete(0, tk.END)
+        for username in usernames:
+            if username != self.username:  # Не показываем себя в списке
+                self.users_listbox.insert(tk.END, username)
     
     def send_message(self, event=None):
         """Отправка сообщения"""
@@ -502,7 +602,7 @@ class ChatClientGUI:
             return
         
         try:
-            self.socket.send(message.encode('utf-8'))
+            self.protocol.send(message)
             self.message_entry.delete(0, tk.END)
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось отправить сообщение: {e}")
@@ -513,7 +613,7 @@ class ChatClientGUI:
         if selection:
             room_name = self.rooms_listbox.get(selection[0])
             if room_name != self.current_room:
-                self.socket.send(f"/join {room_name}".encode('utf-8'))
+                self.protocol.send(f"/join {room_name}")
                 self.current_room = room_name
                 self.user_info_label.config(text=f"Пользователь: {self.username} | Комната: {self.current_room}")
     
@@ -524,17 +624,17 @@ class ChatClientGUI:
             username = self.users_listbox.get(selection[0])
             message = tk.simpledialog.askstring("Приватное сообщение", f"Сообщение для {username}:")
             if message:
-                self.socket.send(f"/msg {username} {message}".encode('utf-8'))
+                self.protocol.send(f"/msg {username} {message}")
     
     def refresh_rooms(self):
         """Обновление списка комнат"""
         if self.connected:
-            self.socket.send("/rooms".encode('utf-8'))
+            self.protocol.send("/rooms")
     
     def refresh_users(self):
         """Обновление списка пользователей"""
         if self.connected:
-            self.socket.send("/users".encode('utf-8'))
+            self.protocol.send("/users")
     
     def create_room(self):
         """Создание новой комнаты"""
@@ -544,18 +644,18 @@ class ChatClientGUI:
             return
         
         if self.connected:
-            self.socket.send(f"/create {room_name}".encode('utf-8'))
+            self.protocol.send(f"/create {room_name}")
             self.new_room_entry.delete(0, tk.END)
     
     def show_inbox(self):
         """Показать входящие сообщения"""
         if self.connected:
-            self.socket.send("/inbox".encode('utf-8'))
+            self.protocol.send("/inbox")
     
     def show_myinfo(self):
         """Показать информацию о пользователе"""
         if self.connected:
-            self.socket.send("/myinfo".encode('utf-8'))
+            self.protocol.send("/myinfo")
     
     def show_help(self):
         """Показать справку"""
@@ -585,5 +685,11 @@ Enter - отправить сообщение
         self.root.mainloop()
 
 if __name__ == "__main__":
-    client = ChatClientGUI()
+    parser = argparse.ArgumentParser(description="Клиент мессенджера")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--socket', metavar='PATH', help="подключаться через Unix-сокет сервера")
+    args = parser.parse_args()
+    
+    client = ChatClientGUI(args.host, args.port, args.socket)
     client.run()
\ No newline at end of file
@@ -0,0 +1,184 @@
+import json
+import os
+import socket
+import threading
+import time
+from protocol import FRAME_HEADER
+
+DEFAULT_HANDOFF_PATH = '/tmp/messenger-handoff.sock'
+HANDOFF_TIMEOUT = 15.0
+
+# Сообщения канала передачи: тип (1 байт), длина, данные; дескриптор - в SCM_RIGHTS
+MSG_LISTENER = b'L'
+MSG_READY = b'R'
+MSG_CLIENT = b'C'
+HEADER_SIZE = 1 + FRAME_HEADER.size
+MAX_LISTENERS = 4
+
+class HandoffError(Exception):
+    """Передача слушающего сокета новому процессу не удалась"""
+    pass
+
+def _send(sock, kind, data=b'', fds=()):
+    message = kind + FRAME_HEADER.pack(len(data)) + data
+    if not fds:
+        sock.sendall(message)
+        return
+    sent = socket.send_fds(sock, [message], list(fds))
+    if sent < len(message):
+        sock.sendall(message[sent:])
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+def _recv(sock, max_fds=1):
+    """(тип, данные, список дескрипторов) или None при закрытии канала"""
+    header, fds, _, _ = socket.recv_fds(sock, HEADER_SIZE, max_fds)
+    if not header:
+        return None
+    if len(header) < HEADER_SIZE:
+        rest = _recv_exact(sock, HEADER_SIZE - len(header))
+        if rest is None:
+            return None
+        header += rest
+    
+    (length,) = FRAME_HEADER.unpack(header[1:])
+    data = _recv_exact(sock, length) if length else b''
+    if data is None:
+        return None
+    return header[:1], data, fds
+
+class HandoffServer:
+    """Сторона старого процесса: отдает слушающие сокеты и состояние новому.
+    
+    Новый процесс подключается к Unix-сокету path, получает дескрипторы
+    слушающих сокетов (SCM_RIGHTS) и состояние в JSON, начинает принимать
+    подключения и отвечает READY. Ядро держит очередь accept общей для обоих
+    процессов, поэтому порт не закрывается ни на миг. Подключения, которые
+    старый процесс успел принять после READY, пересылаются новому тем же каналом.
+    """
+    
+    def __init__(self, path=DEFAULT_HANDOFF_PATH, timeout=HANDOFF_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.channel = None
+        self.ready = False
+        self.lock = threading.Lock()
+        self.forwarded = 0
+    
+    def hand_over(self, listen_sockets, state):
+        """Ожидание нового процесса и передача ему сокетов. Бросает HandoffError"""
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            listener.bind(self.path)
+            listener.listen(1)
+            listener.settimeout(self.timeout)
+            
+            self.channel, _ = listener.accept()
+            self.channel.settimeout(self.timeout)
+            payload = json.dumps(state).encode('utf-8')
+            _send(self.channel, MSG_LISTENER, payload, [sock.fileno() for sock in listen_sockets])
+            
+            reply = _recv(self.channel)
+            if reply is None or reply[0] != MSG_READY:
+                raise HandoffError("новый процесс не подтвердил запуск")
+            self.channel.settimeout(None)
+        except OSError as e:
+            self.close()
+            raise HandoffError(str(e)) from e
+        except HandoffError:
+            self.close()
+            raise
+        finally:
+            listener.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        
+        self.ready = True
+    
+    def forward(self, client_socket, address):
+        """Пересылка принятого подключения новому процессу. False, если передача еще не завершена"""
+        if not self.ready:
+            return False
+        
+        payload = json.dumps(list(address)).encode('utf-8')
+        with self.lock:
+            try:
+                _send(self.channel, MSG_CLIENT, payload, [client_socket.fileno()])
+                self.forwarded += 1
+            except OSError:
+                pass
+        client_socket.close()
+        return True
+    
+    def close(self):
+        if self.channel is not None:
+            self.channel.close()
+
+class HandoffClient:
+    """Сторона нового процесса: получает слушающие сокеты, состояние и пересланные подключения"""
+    
+    def __init__(self, path=DEFAULT_HANDOFF_PATH, timeout=HANDOFF_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.channel = None
+    
+    def take_over(self):
+        """([слушающие сокеты], состояние). Бросает HandoffError"""
+        self.channel = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.channel.settimeout(self.timeout)
+        try:
+            self._connect()
+            message = _recv(self.channel, MAX_LISTENERS)
+        except OSError as e:
+            self.channel.close()
+            raise HandoffError(str(e)) from e
+        
+        if message is None or message[0] != MSG_LISTENER or not message[2]:
+            self.channel.close()
+            raise HandoffError("старый процесс не передал слушающий сокет")
+        
+        _, payload, fds = message
+        return [socket.socket(fileno=fd) for fd in fds], json.loads(payload)
+    
+    def _connect(self):
+        """Старый процесс открывает канал чуть позже запуска нового - ждем его"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                self.channel.connect(self.path)
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+    
+    def confirm(self):
+        """Сообщение старому процессу, что новый принимает подключения"""
+        _send(self.channel, MSG_READY)
+        self.channel.settimeout(None)
+    
+    def receive_forwarded(self, handler):
+        """Прием пересланных подключений, пока старый процесс не завершится (в отдельном потоке)"""
+        try:
+            while True:
+                message = _recv(self.channel)
+                if message is None:
+                    break
+                kind, payload, fds = message
+                if kind == MSG_CLIENT and fds:
+                    handler(socket.socket(fileno=fds[0]), tuple(json.loads(payload)))
+        except OSError:
+            pass
+        finally:
+            self.channel.close()
@@ -0,0 +1,98 @@
+import threading
+import time
+from protocol import PING_MESSAGE
+
+DEFAULT_PING_INTERVAL = 30.0
+DEFAULT_IDLE_TIMEOUT = 90.0
+# Текстовым клиентам (telnet, старые скрипты) ping не шлется, поэтому тишина
+# у них - обычное чтение чата; отключаются только совсем заброшенные
+DEFAULT_TEXT_IDLE_TIMEOUT = 3600.0
+DEFAULT_LOGIN_TIMEOUT = 60.0
+REAP_INTERVAL = 5.0
+
+class HeartbeatStats:
+    """Счетчики проверки живости подключений"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pings_sent = 0
+        self.reaped_idle = 0
+        self.reaped_login = 0
+        self.reap_passes = 0
+    
+    def record_pass(self, pings, idle, login):
+        with self.lock:
+            self.reap_passes += 1
+            self.pings_sent += pings
+            self.reaped_idle += idle
+            self.reaped_login += login
+
+class Reaper:
+    """Фоновая проверка подключений: ping молчащим клиентам и отключение мертвых.
+    
+    Клиенты с кадровым протоколом получают PING после ping_interval тишины и
+    отвечают PONG автоматически (ClientProtocol). Подключение, от которого
+    ничего не приходило idle_timeout секунд (текстовое без кадров -
+    text_idle_timeout), или не вошедшее за login_timeout, считается мертвым.
+    Мертвые подключения за один проход отдаются серверу пачкой, чтобы он
+    разослал одно уведомление вместо уведомления на каждого.
+    """
+    
+    def __init__(self, server, ping_interval=DEFAULT_PING_INTERVAL, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 login_timeout=DEFAULT_LOGIN_TIMEOUT, interval=REAP_INTERVAL,
+                 text_idle_timeout=DEFAULT_TEXT_IDLE_TIMEOUT):
+        self.server = server
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.text_idle_timeout = text_idle_timeout
+        self.login_timeout = login_timeout
+        self.interval = min(interval, ping_interval)
+        self.stats = HeartbeatStats()
+        self.stopped = threading.Event()
+        self.thread = None
+    
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.stopped.set()
+    
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check(self.server.get_connections())
+            except Exception as e:
+                print(f"Ошибка проверки подключений: {e}")
+    
+    def check(self, connections, now=None):
+        """Один проход по подключениям. Возвращает список отключенных"""
+        if now is None:
+            now = time.monotonic()
+        
+        dead = []
+        pings = idle = login = 0
+        for conn in connections:
+            if conn.closed:
+                continue
+            
+            silence = now - conn.last_activity
+            idle_timeout = self.idle_timeout if conn.framed else self.text_idle_timeout
+            if not conn.authenticated and now - conn.connected_at > self.login_timeout:
+                dead.append(conn)
+                login += 1
+            elif silence > idle_timeout:
+                dead.append(conn)
+                idle += 1
+            elif conn.framed and silence > self.ping_interval and now - conn.last_ping > self.ping_interval:
+                conn.last_ping = now
+                try:
+                    conn.send(PING_MESSAGE.encode('utf-8'))
+                    pings += 1
+                except ConnectionError:
+                    pass
+        
+        self.stats.record_pass(pings, idle, login)
+        if dead:
+            self.server.reap_connections(dead)
+        return dead
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from messages import history_message
+
+DEFAULT_HISTORY_ROOM_SIZE = 50  # последних сообщений на комнату
+DEFAULT_HISTORY_CACHE_BYTES = 16 * 1024 * 1024  # на все комнаты
+ROW_OVERHEAD = 120  # примерная цена кортежа и строк сверх их содержимого, байт
+
+def row_size(row):
+    msg_id, sender, content, timestamp = row
+    return ROW_OVERHEAD + len(sender) + len(content) * 2 + len(timestamp)
+
+class HistoryCacheStats:
+    """Попадания и промахи кеша истории"""
+    
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class RoomHistory:
+    """Последние сообщения одной комнаты и готовая к отправке история"""
+    
+    def __init__(self, rows, size):
+        self.rows = deque(rows, maxlen=size)
+        self.bytes = sum(row_size(row) for row in self.rows)
+        self.encoded = {}  # limit -> EncodedMessage, сбрасывается новым сообщением
+    
+    def append(self, row):
+        if len(self.rows) == self.rows.maxlen:
+            self.bytes -= row_size(self.rows[0])
+        self.rows.append(row)
+        self.bytes += row_size(row)
+        self.encoded.clear()
+
+class HistoryCache:
+    """Кольцевые буферы последних сообщений комнат для истории при входе и /join.
+    
+    Комната попадает в кеш при первом промахе (читается из базы) и дальше
+    пополняется новыми сообщениями без обращений к SQLite. Общий объем
+    ограничен max_bytes: сверх него вытесняются давно не читавшиеся комнаты.
+    """
+    
+    def __init__(self, room_size=DEFAULT_HISTORY_ROOM_SIZE, max_bytes=DEFAULT_HISTORY_CACHE_BYTES):
+        self.room_size = room_size
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.rooms = OrderedDict()
+        self.generations = {}
+        self.bytes = 0
+        self.stats = HistoryCacheStats()
+    
+    def get(self, room_id, limit):
+        """(попадание, EncodedMessage или None для пустой истории)"""
+        with self.lock:
+            room = self.rooms.get(room_id)
+            if room is None or limit > self.room_size:
+                self.stats.misses += 1
+                return False, None
+            
+            self.stats.hits += 1
+            self.rooms.move_to_end(room_id)
+            return True, self._encode(room, limit)
+    
+    def generation(self, room_id):
+        """Метка для fill(): запоминается до чтения истории из базы"""
+        with self.lock:
+            return self.generations.get(room_id, 0)
+    
+    def fill(self, room_id, rows, generation):
+        """Заполнение комнаты строками из базы (не более room_size последних).
+        
+        Если с момента generation() в комнату пришло сообщение, строки могли
+        его не застать: такие строки в кеш не кладутся.
+        """
+        with self.lock:
+            if room_id in self.rooms or self.generations.get(room_id, 0) != generation:
+                return
+            room = RoomHistory(rows, self.room_size)
+            self.rooms[room_id] = room
+            self.bytes += room.bytes
+            self._evict()
+    
+    def append(self, room_id, message_id, sender, content):
+        """Новое сообщение комнаты; некешированные комнаты не заводятся"""
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        with self.lock:
+            self.generations[room_id] = self.generations.get(room_id, 0) + 1
+            room = self.rooms.get(room_id)
+            if room is None:
+                return
+            self.bytes -= room.bytes
+            room.append((message_id, sender, content, timestamp))
+            self.bytes += room.bytes
+            self._evict()
+    
+    def invalidate(self, room_id=None):
+        """Сброс одной комнаты или всего кеша"""
+        with self.lock:
+            room_ids = list(self.rooms) if room_id is None else [room_id]
+            for key in room_ids:
+                self.generations[key] = self.generations.get(key, 0) + 1
+                room = self.rooms.pop(key, None)
+                if room is not None:
+                    self.bytes -= room.bytes
+    
+    def snapshot(self):
+        with self.lock:
+            return len(self.rooms), self.bytes
+    
+    def _encode(self, room, limit):
+        """Готовое сообщение с историей (вызывать под self.lock)"""
+        if not room.rows:
+            return None
+        encoded = room.encoded.get(limit)
+        if encoded is None:
+            rows = list(room.rows)[-limit:]
+            encoded = room.encoded[limit] = history_message(rows)
+        return encoded
+    
+    def _evict(self):
+        """Вытеснение самых давних комнат сверх max_bytes (вызывать под self.lock)"""
+        while self.bytes > self.max_bytes and len(self.rooms) > 1:
+            _, room = self.rooms.popitem(last=False)
+            self.bytes -= room.bytes
+            self.stats.evictions += 1
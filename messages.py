@@ -0,0 +1,73 @@
+from protocol import (
+    EncodedMessage, MSG_CHAT, MSG_HISTORY, MSG_PRIVATE, MSG_ROOMS, MSG_SYSTEM, MSG_TEXT, MSG_USERS,
+    encode_typed
+)
+
+# Сообщения сервера сразу в двух видах: текст для старых клиентов и версии 2,
+# двоичный для версии 3. Оба кодируются один раз на сообщение, а не на получателя.
+
+def chat_message(sender, text):
+    """Сообщение пользователя в комнате"""
+    return EncodedMessage(f"{sender}: {text}", encode_typed(MSG_CHAT, (sender, text)))
+
+def private_message(incoming, peer, text):
+    """Личное сообщение: входящее от peer или подтверждение отправки для peer"""
+    prefix = "ЛС от" if incoming else "ЛС для"
+    return EncodedMessage(f"[{prefix} {peer}] {text}", encode_typed(MSG_PRIVATE, (incoming, peer, text)))
+
+def system_message(text):
+    """Системное уведомление"""
+    return EncodedMessage(f"[СИСТЕМА] {text}", encode_typed(MSG_SYSTEM, text))
+
+def rooms_message(room_names):
+    """Список комнат"""
+    room_names = list(room_names)
+    text = "Доступные комнаты:\n" + "".join(f"- {name}\n" for name in room_names)
+    return EncodedMessage(text, encode_typed(MSG_ROOMS, room_names))
+
+def users_message(usernames, room_name=None):
+    """Пользователи онлайн или пользователи одной комнаты"""
+    usernames = list(usernames)
+    title = f"Пользователи в комнате {room_name}:\n" if room_name else "Пользователи онлайн:\n"
+    text = title + "".join(f"- {name}\n" for name in usernames)
+    return EncodedMessage(text, encode_typed(MSG_USERS, (room_name or "", usernames)))
+
+def history_message(rows):
+    """История комнаты из строк (id, отправитель, текст, время 'YYYY-MM-DD HH:MM:SS')"""
+    entries = []
+    lines = ["История сообщений:\n"]
+    for msg_id, sender, content, timestamp in rows:
+        time_str = timestamp.split(' ')[1][:5]
+        hours, minutes = time_str.split(':')
+        entries.append((int(hours) * 60 + int(minutes), sender, content))
+        lines.append(f"[{time_str}] {sender}: {content}\n")
+    return EncodedMessage("".join(lines), encode_typed(MSG_HISTORY, entries))
+
+def format_history_time(minutes):
+    """Минуты от полуночи -> 'HH:MM'"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def render_typed(kind, value):
+    """Текст двоичного сообщения в том же виде, в каком его получают текстовые клиенты"""
+    if kind == MSG_CHAT:
+        sender, text = value
+        return f"{sender}: {text}"
+    if kind == MSG_PRIVATE:
+        incoming, peer, text = value
+        prefix = "ЛС от" if incoming else "ЛС для"
+        return f"[{prefix} {peer}] {text}"
+    if kind == MSG_SYSTEM:
+        return f"[СИСТЕМА] {value}"
+    if kind == MSG_ROOMS:
+        return "Доступные комнаты:\n" + "\n".join(f"- {name}" for name in value)
+    if kind == MSG_USERS:
+        room_name, usernames = value
+        title = f"Пользователи в комнате {room_name}:" if room_name else "Пользователи онлайн:"
+        return title + "".join(f"\n- {name}" for name in usernames)
+    if kind == MSG_HISTORY:
+        return "История сообщений:" + "".join(
+            f"\n[{format_history_time(minutes)}] {sender}: {text}" for minutes, sender, text in value
+        )
+    if kind == MSG_TEXT:
+        return value
+    return str(value)
@@ -0,0 +1,148 @@
+# Версионированные миграции схемы messenger.db.
+#
+# Номер примененной миграции хранится в PRAGMA user_version. При старте
+# сервер применяет все миграции с большим номером, каждую в своей
+# транзакции. Новое изменение схемы - новая функция в конце MIGRATIONS;
+# уже выпущенные миграции не меняются.
+
+from conversations import create_conversations_table, rebuild_conversations
+from retention import create_archived_totals, create_retention_table
+from search_index import create_search_index, fts5_available
+from stats_counters import create_stats_tables, rebuild_stats
+
+def initial_schema(cursor):
+    """Таблицы пользователей, комнат и сообщений"""
+    # Таблица пользователей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Таблица комнат
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rooms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+    ''')
+    
+    # Таблица сообщений
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            room_id INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (room_id) REFERENCES rooms (id)
+        )
+    ''')
+    
+    # Таблица приватных сообщений
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS private_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_user_id INTEGER NOT NULL,
+            to_user_id INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            is_read BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (from_user_id) REFERENCES users (id),
+            FOREIGN KEY (to_user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Создаем дефолтную комнату
+    cursor.execute('''
+        INSERT OR IGNORE INTO rooms (name, created_by)
+        VALUES (?, ?)
+    ''', ('general', 1))
+
+def message_indexes(cursor):
+    """Индексы для истории комнат, переписки и счетчиков /myinfo"""
+    # История комнаты: WHERE room_id ORDER BY id (rowid входит в индекс сам)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_room ON messages (room_id)')
+    # COUNT сообщений пользователя и JOIN по автору
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id)')
+    # Отправленные: переписка с одним собеседником и все исходящие
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_private_from_to
+        ON private_messages (from_user_id, to_user_id)
+    ''')
+    # Входящие и пометка прочитанными (WHERE to AND from AND is_read)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_private_to_from
+        ON private_messages (to_user_id, from_user_id, is_read)
+    ''')
+
+def stats_tables(cursor):
+    """Счетчики сообщений пользователей и комнат, заполненные по текущим данным"""
+    create_stats_tables(cursor)
+    rebuild_stats(cursor)
+
+def search_index(cursor):
+    """Полнотекстовый индекс сообщений (если SQLite собран с FTS5)"""
+    if not fts5_available(cursor):
+        # Индекс создаст ensure_search_index при запуске с FTS5
+        print("SQLite собран без FTS5: поиск /search будет недоступен")
+        return
+    create_search_index(cursor)
+
+def conversations_table(cursor):
+    """Сводка диалогов для /inbox, заполненная по текущим приватным сообщениям"""
+    create_conversations_table(cursor)
+    rebuild_conversations(cursor)
+
+def retention_table(cursor):
+    """Сроки хранения сообщений комнат для архивации"""
+    create_retention_table(cursor)
+
+def archived_totals(cursor):
+    """Итоги архива для пересчета счетчиков и диалогов"""
+    create_archived_totals(cursor)
+
+# (версия, описание, функция); версии идут подряд с 1
+MIGRATIONS = [
+    (1, "начальная схема", initial_schema),
+    (2, "индексы сообщений", message_indexes),
+    (3, "счетчики сообщений", stats_tables),
+    (4, "полнотекстовый поиск", search_index),
+    (5, "сводка диалогов", conversations_table),
+    (6, "сроки хранения сообщений", retention_table),
+    (7, "итоги архива", archived_totals),
+]
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def apply_migrations(conn, migrations=MIGRATIONS):
+    """Применение недостающих миграций; возвращает итоговую версию схемы.
+    
+    BEGIN IMMEDIATE сразу берет блокировку записи, поэтому несколько
+    процессов кластера, стартующих одновременно, применят миграцию один раз.
+    """
+    for version, description, migration in migrations:
+        if schema_version(conn) >= version:
+            continue
+        
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Версию перечитываем под блокировкой: ее мог поднять другой процесс
+            if schema_version(conn) < version:
+                migration(conn.cursor())
+                conn.execute(f'PRAGMA user_version = {int(version)}')
+                print(f"Миграция базы {version}: {description}")
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+    
+    return schema_version(conn)
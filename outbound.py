@@ -0,0 +1,124 @@
+import threading
+from collections import deque
+
+# Что делать, когда клиент не успевает забирать данные и очередь переполнена
+POLICY_DROP = 'drop'    # отбрасывать новые сообщения этому клиенту
+POLICY_EVICT = 'evict'  # отключать медленного клиента
+OVERFLOW_POLICIES = (POLICY_DROP, POLICY_EVICT)
+
+DEFAULT_MAX_QUEUE_BYTES = 1024 * 1024
+
+# Ограничение числа буферов в одном вызове sendmsg (IOV_MAX в Linux)
+MAX_IOVEC = 1024
+
+class SlowConsumerError(ConnectionError):
+    """Клиент отключен: очередь отправки переполнена"""
+
+class OutboundStats:
+    """Общие счетчики очередей отправки по всему серверу"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dropped_messages = 0
+        self.dropped_bytes = 0
+        self.evicted_clients = 0
+    
+    def record_drop(self, size):
+        with self.lock:
+            self.dropped_messages += 1
+            self.dropped_bytes += size
+    
+    def record_evict(self):
+        with self.lock:
+            self.evicted_clients += 1
+
+class OutboundQueue:
+    """Ограниченная очередь исходящих данных одного подключения"""
+    
+    def __init__(self, max_bytes=DEFAULT_MAX_QUEUE_BYTES, policy=POLICY_EVICT, stats=None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {policy}")
+        
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.stats = stats
+        self.cond = threading.Condition()
+        self.buffers = deque()
+        self.queued_bytes = 0
+        self.sent_bytes = 0
+        self.peak_bytes = 0
+        self.closed = False
+    
+    def put(self, buffers):
+        """Добавление буферов одного сообщения в очередь. Возвращает False, если лимит превышен"""
+        size = sum(len(buffer) for buffer in buffers)
+        with self.cond:
+            if self.closed:
+                return False
+            
+            if self.queued_bytes and self.queued_bytes + size > self.max_bytes:
+                if self.stats:
+                    if self.policy == POLICY_DROP:
+                        self.stats.record_drop(size)
+                    else:
+                        self.stats.record_evict()
+                return False
+            
+            self.buffers.extend(buffers)
+            self.queued_bytes += size
+            self.peak_bytes = max(self.peak_bytes, self.queued_bytes)
+            self.cond.notify()
+        return True
+    
+    def has_room(self, size):
+        """Поместится ли сообщение размером size (без постановки в очередь)"""
+        with self.cond:
+            return not self.queued_bytes or self.queued_bytes + size <= self.max_bytes
+    
+    def get_batch(self, block=True):
+        """Забрать все накопленные буферы. При block=True ждет данных или закрытия"""
+        with self.cond:
+            while block and not self.buffers and not self.closed:
+                self.cond.wait()
+            
+            batch = list(self.buffers)
+            self.buffers.clear()
+            return batch
+    
+    def mark_sent(self, size):
+        """Учет отправленных байтов"""
+        with self.cond:
+            self.queued_bytes = max(0, self.queued_bytes - size)
+            self.sent_bytes += size
+    
+    def close(self, discard=False):
+        """Закрытие очереди. При discard=True неотправленные данные выбрасываются"""
+        with self.cond:
+            self.closed = True
+            if discard:
+                self.buffers.clear()
+                self.queued_bytes = 0
+            self.cond.notify_all()
+
+def send_buffers(sock, buffers):
+    """Отправка списка буферов одной операцией scatter/gather (sendmsg) без склейки.
+    
+    Частичные отправки дописываются. Там, где sendmsg нет (Windows),
+    буферы склеиваются и отправляются через sendall.
+    """
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(buffers))
+        return
+    
+    views = [memoryview(buffer) for buffer in buffers]
+    index = 0
+    while index < len(views):
+        sent = sock.sendmsg(views[index:index + MAX_IOVEC])
+        while sent:
+            remaining = len(views[index])
+            if sent >= remaining:
+                sent -= remaining
+                index += 1
+            else:
+                views[index] = views[index][sent:]
+                sent = 0
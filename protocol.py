@@ -0,0 +1,328 @@
+import re
+import socket
+import struct
+import threading
+import zlib
+
+# Кадровый протокол: 4 байта длины (big-endian) + полезная нагрузка в UTF-8.
+# Клиент включает его командой "/proto <версия>\n" сразу после подключения;
+# сервер отвечает HANDSHAKE_ACK обычным текстом и дальше обе стороны шлют кадры.
+# Старые клиенты ничего не отправляют и продолжают работать в текстовом режиме.
+# Версия 3 - те же кадры, но от сервера к клиенту идут типизированные сообщения
+# (первый байт кадра - тип, дальше двоичные поля), команды клиента остаются текстом.
+# Расширение "zlib" после версии ("/proto 3 zlib") включает сжатие: крупные кадры
+# сервера сжимаются общим для подключения потоком zlib и помечаются старшим битом длины.
+PROTOCOL_VERSION = 2
+BINARY_VERSION = 3
+SUPPORTED_VERSIONS = (2, 3)
+HANDSHAKE_PREFIX = b'/proto'
+LEGACY_REPLY = "Неизвестная команда".encode('utf-8')
+ACK_PATTERN = re.compile(rb'PROTO OK (\d+)([^\n]*)\n')
+EXTENSION_ZLIB = 'zlib'
+
+# Проверка живости: сервер шлет PING молчащему клиенту, клиент отвечает PONG.
+# Оба сообщения служебные и не доходят до обработчиков команд и интерфейса.
+PING_MESSAGE = '/ping'
+PONG_MESSAGE = '/pong'
+
+FRAME_HEADER = struct.Struct('!I')
+FRAME_COMPRESSED = 0x80000000
+MAX_FRAME_SIZE = 1024 * 1024
+
+# Типы сообщений версии 3
+MSG_TEXT = 0       # произвольный текст: остаток кадра в UTF-8
+MSG_CHAT = 1       # сообщение в комнате: отправитель, текст
+MSG_PRIVATE = 2    # личное: входящее (1) / исходящее (0), собеседник, текст
+MSG_ROOMS = 3      # список комнат
+MSG_USERS = 4      # список пользователей: комната ("" - все онлайн), имена
+MSG_HISTORY = 5    # история комнаты: записи (минуты от полуночи, отправитель, текст)
+MSG_SYSTEM = 6     # системное уведомление
+
+TEXT_TAG = bytes((MSG_TEXT,))
+_COUNT = struct.Struct('!H')
+_HISTORY_TIME = struct.Struct('!H')
+
+def handshake_ack(version, extensions=()):
+    """Подтверждение перехода в кадровый режим указанной версии и расширений"""
+    return f"PROTO OK {' '.join([str(version), *extensions])}\n".encode('utf-8')
+
+HANDSHAKE_ACK = handshake_ack(PROTOCOL_VERSION)
+
+class ProtocolError(Exception):
+    """Нарушение формата кадров"""
+
+def encode_frame(payload):
+    """Упаковка полезной нагрузки в кадр"""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Кадр слишком большой: {len(payload)} байт")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+def _pack_str(text):
+    data = text.encode('utf-8')
+    return _COUNT.pack(len(data)) + data
+
+def _unpack_str(payload, offset):
+    (length,) = _COUNT.unpack_from(payload, offset)
+    offset += _COUNT.size
+    return payload[offset:offset + length].decode('utf-8'), offset + length
+
+def _pack_list(names):
+    return _COUNT.pack(len(names)) + b''.join(_pack_str(name) for name in names)
+
+def _unpack_list(payload, offset):
+    (count,) = _COUNT.unpack_from(payload, offset)
+    offset += _COUNT.size
+    names = []
+    for _ in range(count):
+        name, offset = _unpack_str(payload, offset)
+        names.append(name)
+    return names, offset
+
+def encode_typed(kind, value):
+    """Двоичное представление сообщения версии 3 (вместе с байтом типа)"""
+    if kind in (MSG_TEXT, MSG_SYSTEM):
+        body = value.encode('utf-8')
+    elif kind == MSG_CHAT:
+        sender, text = value
+        body = _pack_str(sender) + text.encode('utf-8')
+    elif kind == MSG_PRIVATE:
+        incoming, peer, text = value
+        body = bytes((1 if incoming else 0,)) + _pack_str(peer) + text.encode('utf-8')
+    elif kind == MSG_ROOMS:
+        body = _pack_list(value)
+    elif kind == MSG_USERS:
+        room_name, names = value
+        body = _pack_str(room_name) + _pack_list(names)
+    elif kind == MSG_HISTORY:
+        parts = [_COUNT.pack(len(value))]
+        for minutes, sender, text in value:
+            parts.append(_HISTORY_TIME.pack(minutes) + _pack_str(sender) + _pack_str(text))
+        body = b''.join(parts)
+    else:
+        raise ProtocolError(f"Неизвестный тип сообщения: {kind}")
+    return bytes((kind,)) + body
+
+def decode_typed(payload):
+    """Разбор кадра версии 3. Текст возвращается строкой, остальное - (тип, значение)"""
+    if not payload:
+        raise ProtocolError("Пустой кадр")
+    
+    kind = payload[0]
+    try:
+        if kind == MSG_TEXT:
+            return payload[1:].decode('utf-8')
+        if kind == MSG_SYSTEM:
+            return kind, payload[1:].decode('utf-8')
+        if kind == MSG_CHAT:
+            sender, offset = _unpack_str(payload, 1)
+            return kind, (sender, payload[offset:].decode('utf-8'))
+        if kind == MSG_PRIVATE:
+            peer, offset = _unpack_str(payload, 2)
+            return kind, (payload[1] == 1, peer, payload[offset:].decode('utf-8'))
+        if kind == MSG_ROOMS:
+            names, _ = _unpack_list(payload, 1)
+            return kind, names
+        if kind == MSG_USERS:
+            room_name, offset = _unpack_str(payload, 1)
+            names, _ = _unpack_list(payload, offset)
+            return kind, (room_name, names)
+        if kind == MSG_HISTORY:
+            (count,) = _COUNT.unpack_from(payload, 1)
+            offset = 1 + _COUNT.size
+            entries = []
+            for _ in range(count):
+                (minutes,) = _HISTORY_TIME.unpack_from(payload, offset)
+                sender, offset = _unpack_str(payload, offset + _HISTORY_TIME.size)
+                text, offset = _unpack_str(payload, offset)
+                entries.append((minutes, sender, text))
+            return kind, entries
+    except (struct.error, UnicodeDecodeError, IndexError) as e:
+        raise ProtocolError(f"Поврежденное сообщение типа {kind}: {e}")
+    raise ProtocolError(f"Неизвестный тип сообщения: {kind}")
+
+class EncodedMessage:
+    """Сообщение, закодированное один раз для рассылки многим получателям.
+    
+    Байты нагрузки и заголовок кадра неизменяемы и общие для всех очередей
+    отправки: получатель ставит в очередь ссылки на них, а не копии.
+    typed - двоичное представление для клиентов версии 3; без него такие
+    клиенты получают тот же текст с байтом MSG_TEXT.
+    """
+    
+    __slots__ = ('payload', 'header', 'typed', 'typed_header')
+    
+    def __init__(self, payload, typed=None):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        if len(payload) > MAX_FRAME_SIZE:
+            raise ProtocolError(f"Кадр слишком большой: {len(payload)} байт")
+        self.payload = payload
+        self.header = FRAME_HEADER.pack(len(payload))
+        
+        self.typed = (typed,) if typed is not None else (TEXT_TAG, payload)
+        typed_size = sum(len(buffer) for buffer in self.typed)
+        if typed_size > MAX_FRAME_SIZE:
+            raise ProtocolError(f"Кадр слишком большой: {typed_size} байт")
+        self.typed_header = FRAME_HEADER.pack(typed_size)
+    
+    def buffers(self, framed, binary=False):
+        """Буферы для записи в сокет в нужном режиме протокола"""
+        if binary:
+            return (self.typed_header,) + self.typed
+        if framed:
+            return (self.header, self.payload)
+        return (self.payload,)
+    
+    def __len__(self):
+        return len(self.payload)
+
+def parse_handshake(line):
+    """Разбор строки "/proto <версия> [расширения]". Возвращает (версия или None, расширения)"""
+    parts = line.decode('utf-8', 'replace').split()
+    if len(parts) < 2 or parts[0] != HANDSHAKE_PREFIX.decode('utf-8'):
+        return None, ()
+    try:
+        return int(parts[1]), tuple(parts[2:])
+    except ValueError:
+        return None, ()
+
+class FrameDecoder:
+    """Потоковый разбор кадров: принимает куски данных, отдает целые кадры"""
+    
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+        self.decompressor = None
+    
+    def feed(self, data):
+        """Добавление данных из сокета. Возвращает список полных кадров"""
+        self.buffer += data
+        frames = []
+        offset = 0
+        header_size = FRAME_HEADER.size
+        
+        while len(self.buffer) - offset >= header_size:
+            (length,) = FRAME_HEADER.unpack_from(self.buffer, offset)
+            compressed = length & FRAME_COMPRESSED
+            length &= ~FRAME_COMPRESSED
+            if length > self.max_frame_size:
+                raise ProtocolError(f"Кадр слишком большой: {length} байт")
+            
+            end = offset + header_size + length
+            if len(self.buffer) < end:
+                break
+            
+            frame = bytes(self.buffer[offset + header_size:end])
+            frames.append(self.decompress(frame) if compressed else frame)
+            offset = end
+        
+        if offset:
+            del self.buffer[:offset]
+        return frames
+    
+    def decompress(self, frame):
+        """Распаковка сжатого кадра. Поток zlib общий для всех кадров подключения"""
+        if self.decompressor is None:
+            self.decompressor = zlib.decompressobj()
+        try:
+            payload = self.decompressor.decompress(frame, self.max_frame_size)
+        except zlib.error as e:
+            raise ProtocolError(f"Ошибка распаковки кадра: {e}")
+        if self.decompressor.unconsumed_tail:
+            raise ProtocolError("Распакованный кадр слишком большой")
+        return payload
+
+def connect_socket(host='localhost', port=5555, socket_path=None):
+    """Подключенный сокет: Unix-сокет, если задан путь (сервер на этой же машине), иначе TCP"""
+    if socket_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((host, port))
+    return sock
+
+class ClientProtocol:
+    """Клиентская сторона протокола: согласование, отправка и разбор входящего потока.
+    
+    С binary=True клиент просит версию 3 и receive() отдает типизированные
+    сообщения кортежами (тип, значение); обычный текст по-прежнему строкой.
+    С compress=True клиент просит сжатие крупных кадров (zlib).
+    """
+    
+    def __init__(self, sock, binary=False, compress=False):
+        self.sock = sock
+        self.framed = False
+        self.binary = False
+        self.compressed = False
+        self.version = BINARY_VERSION if binary else PROTOCOL_VERSION
+        self.extensions = (EXTENSION_ZLIB,) if compress else ()
+        self.decoder = FrameDecoder()
+        self.pending = []
+        self.send_lock = threading.Lock()
+    
+    def handshake(self, timeout=5.0):
+        """Попытка включить кадровый режим. При старом сервере остается текстовый"""
+        request = ' '.join([str(self.version), *self.extensions])
+        self.sock.sendall(HANDSHAKE_PREFIX + f" {request}\n".encode('utf-8'))
+        
+        buffer = b''
+        self.sock.settimeout(timeout)
+        try:
+            while not ACK_PATTERN.search(buffer) and LEGACY_REPLY not in buffer:
+                data = self.sock.recv(4096)
+                if not data:
+                    break
+                buffer += data
+        except socket.timeout:
+            pass
+        finally:
+            self.sock.settimeout(None)
+        
+        # Текст до подтверждения (меню входа) отдаем как обычное сообщение
+        ack = ACK_PATTERN.search(buffer)
+        text = buffer[:ack.start()] if ack else buffer
+        if text:
+            self.pending.append(text.decode('utf-8', 'replace'))
+        if ack:
+            self.framed = True
+            self.binary = int(ack.group(1)) >= BINARY_VERSION
+            self.compressed = EXTENSION_ZLIB in ack.group(2).decode('utf-8').split()
+            self.pending.extend(self.decode(frame) for frame in self.decoder.feed(buffer[ack.end():]))
+        return self.framed
+    
+    def send(self, text):
+        """Отправка одного сообщения"""
+        data = text.encode('utf-8')
+        if self.framed:
+            data = encode_frame(data)
+        # На PING отвечает поток чтения, поэтому отправки из разных потоков разделены
+        with self.send_lock:
+            self.sock.sendall(data)
+    
+    def receive(self, bufsize=4096):
+        """Получение сообщений. Возвращает список строк или None при закрытии соединения"""
+        if self.pending:
+            messages, self.pending = self.pending, []
+            return messages
+        
+        data = self.sock.recv(bufsize)
+        if not data:
+            return None
+        if not self.framed:
+            return [data.decode('utf-8')]
+        
+        messages = []
+        for frame in self.decoder.feed(data):
+            message = self.decode(frame)
+            if message == PING_MESSAGE:
+                self.send(PONG_MESSAGE)
+            else:
+                messages.append(message)
+        return messages
+    
+    def decode(self, frame):
+        """Кадр -> строка или (тип, значение) в двоичном режиме"""
+        if self.binary:
+            return decode_typed(frame)
+        return frame.decode('utf-8')
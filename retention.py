@@ -0,0 +1,311 @@
+import glob
+import os
+import sqlite3
+import threading
+import time
+
+from conversations import PREVIEW_LENGTH
+from search_index import ensure_search_index
+
+DEFAULT_RETENTION_INTERVAL = 600.0  # секунд между проходами архивации
+ARCHIVE_BATCH = 500  # сообщений за одну транзакцию переноса
+BATCH_PAUSE = 0.05  # пауза между пачками, чтобы писатель не был занят подолгу
+VACUUM_PAGES = 2000  # страниц, возвращаемых ОС за один проход
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Колонки, переносимые в архив (id сохраняется: по нему пагинация и поиск)
+MESSAGE_COLUMNS = ('id', 'user_id', 'room_id', 'content', 'created_at')
+PRIVATE_COLUMNS = ('id', 'from_user_id', 'to_user_id', 'content', 'is_read', 'created_at')
+
+def create_retention_table(cursor):
+    """Сроки хранения сообщений по комнатам; комнаты без строки хранятся всегда"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS room_retention (
+            room_id INTEGER PRIMARY KEY,
+            keep_days INTEGER NOT NULL,
+            FOREIGN KEY (room_id) REFERENCES rooms (id)
+        )
+    ''')
+
+def create_archived_totals(cursor):
+    """Итоги перенесенных в архив сообщений: пересчет счетчиков по основной базе их не теряет"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_user_stats (
+            user_id INTEGER PRIMARY KEY,
+            messages INTEGER NOT NULL DEFAULT 0,
+            private_sent INTEGER NOT NULL DEFAULT 0,
+            private_received INTEGER NOT NULL DEFAULT 0,
+            last_active TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_room_stats (
+            room_id INTEGER PRIMARY KEY,
+            messages INTEGER NOT NULL DEFAULT 0,
+            last_message_at TIMESTAMP
+        )
+    ''')
+    # Последнее перенесенное сообщение диалога: диалог остается в /inbox,
+    # даже если в основной базе его сообщений не осталось
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_conversations (
+            user_id INTEGER NOT NULL,
+            partner_id INTEGER NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            last_from_user_id INTEGER NOT NULL,
+            preview TEXT NOT NULL,
+            last_at TIMESTAMP,
+            PRIMARY KEY (user_id, partner_id)
+        ) WITHOUT ROWID
+    ''')
+
+# MAX() с NULL в SQLite дает NULL, поэтому пустое время берется из другой стороны
+LATEST_SQL = 'COALESCE(MAX({column}, excluded.{column}), {column}, excluded.{column})'
+
+def record_archived(conn, table, ids):
+    """Добавление пачки ids таблицы table к итогам архива (в транзакции переноса, до DELETE)"""
+    placeholders = ','.join('?' * len(ids))
+    if table == 'messages':
+        conn.execute(f'''
+            INSERT INTO archived_user_stats (user_id, messages, last_active)
+            SELECT user_id, COUNT(*), MAX(created_at) FROM main.messages
+            WHERE id IN ({placeholders}) GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE SET
+                messages = messages + excluded.messages,
+                last_active = {LATEST_SQL.format(column='last_active')}
+        ''', ids)
+        conn.execute(f'''
+            INSERT INTO archived_room_stats (room_id, messages, last_message_at)
+            SELECT room_id, COUNT(*), MAX(created_at) FROM main.messages
+            WHERE id IN ({placeholders}) GROUP BY room_id
+            ON CONFLICT (room_id) DO UPDATE SET
+                messages = messages + excluded.messages,
+                last_message_at = {LATEST_SQL.format(column='last_message_at')}
+        ''', ids)
+        return
+    
+    conn.execute(f'''
+        INSERT INTO archived_user_stats (user_id, private_sent)
+        SELECT from_user_id, COUNT(*) FROM main.private_messages
+        WHERE id IN ({placeholders}) GROUP BY from_user_id
+        ON CONFLICT (user_id) DO UPDATE SET private_sent = private_sent + excluded.private_sent
+    ''', ids)
+    conn.execute(f'''
+        INSERT INTO archived_user_stats (user_id, private_received)
+        SELECT to_user_id, COUNT(*) FROM main.private_messages
+        WHERE id IN ({placeholders}) GROUP BY to_user_id
+        ON CONFLICT (user_id) DO UPDATE SET private_received = private_received + excluded.private_received
+    ''', ids)
+    conn.execute(f'''
+        WITH sides AS (
+            SELECT from_user_id AS user_id, to_user_id AS partner_id, id
+            FROM main.private_messages WHERE id IN ({placeholders})
+            UNION ALL
+            SELECT to_user_id, from_user_id, id
+            FROM main.private_messages WHERE id IN ({placeholders})
+        ),
+        latest AS (
+            SELECT user_id, partner_id, MAX(id) AS last_message_id FROM sides GROUP BY user_id, partner_id
+        )
+        INSERT INTO archived_conversations (user_id, partner_id, last_message_id, last_from_user_id, preview, last_at)
+        SELECT latest.user_id, latest.partner_id, latest.last_message_id, pm.from_user_id,
+               substr(pm.content, 1, {PREVIEW_LENGTH}), pm.created_at
+        FROM latest
+        JOIN main.private_messages pm ON pm.id = latest.last_message_id
+        WHERE 1
+        ON CONFLICT (user_id, partner_id) DO UPDATE SET
+            last_message_id = excluded.last_message_id,
+            last_from_user_id = excluded.last_from_user_id,
+            preview = excluded.preview,
+            last_at = excluded.last_at
+        WHERE excluded.last_message_id > archived_conversations.last_message_id
+    ''', ids + ids)
+
+def add_archived_totals(cursor):
+    """Итоги архива поверх счетчиков и диалогов, пересчитанных по основной базе"""
+    cursor.execute(f'''
+        INSERT INTO user_stats (user_id, messages, private_sent, private_received, last_active)
+        SELECT user_id, messages, private_sent, private_received, last_active FROM archived_user_stats WHERE 1
+        ON CONFLICT (user_id) DO UPDATE SET
+            messages = messages + excluded.messages,
+            private_sent = private_sent + excluded.private_sent,
+            private_received = private_received + excluded.private_received,
+            last_active = {LATEST_SQL.format(column='last_active')}
+    ''')
+    cursor.execute(f'''
+        INSERT INTO room_stats (room_id, messages, last_message_at)
+        SELECT room_id, messages, last_message_at FROM archived_room_stats WHERE 1
+        ON CONFLICT (room_id) DO UPDATE SET
+            messages = messages + excluded.messages,
+            last_message_at = {LATEST_SQL.format(column='last_message_at')}
+    ''')
+    # Сообщения в основной базе новее архивных: такой диалог уже пересчитан
+    cursor.execute('''
+        INSERT INTO conversations (user_id, partner_id, last_message_id, last_from_user_id, preview, last_at)
+        SELECT user_id, partner_id, last_message_id, last_from_user_id, preview, last_at
+        FROM archived_conversations WHERE 1
+        ON CONFLICT (user_id, partner_id) DO NOTHING
+    ''')
+
+def archive_dir(db_path):
+    """Каталог архивов рядом с базой: messenger.db -> messenger_archive/"""
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), f'{stem}_archive')
+
+def archive_path(db_path, created_at):
+    """Файл архива месяца сообщения: messenger_archive/messenger-2024-05.db"""
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(archive_dir(db_path), f'{stem}-{created_at[:7]}.db')
+
+def archive_files(db_path):
+    """Файлы архивов, начиная с самого свежего месяца"""
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return sorted(glob.glob(os.path.join(archive_dir(db_path), f'{stem}-*.db')), reverse=True)
+
+def create_archive_schema(path):
+    """Таблицы архива и его полнотекстовый индекс (если SQLite собран с FTS5)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                room_id INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_room ON messages (room_id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS private_messages (
+                id INTEGER PRIMARY KEY,
+                from_user_id INTEGER NOT NULL,
+                to_user_id INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                is_read BOOLEAN,
+                created_at TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        ensure_search_index(conn)
+    finally:
+        conn.close()
+
+def cutoff(keep_days, now=None):
+    """Граница хранения в формате created_at (UTC): старше нее - в архив"""
+    if now is None:
+        now = time.time()
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now - keep_days * 86400))
+
+def archivable(rows, border):
+    """Начало пачки [(id, created_at, ...)] по возрастанию id, которое можно перенести.
+    
+    Берутся сообщения старше border и того же месяца, что первое: пачка
+    целиком уходит в один файл архива. id растут вместе со временем, поэтому
+    на первом новом сообщении перебор останавливается.
+    """
+    if not rows:
+        return []
+    month = rows[0][1][:7]
+    prefix = []
+    for row in rows:
+        if row[1] >= border or row[1][:7] != month:
+            break
+        prefix.append(row)
+    return prefix
+
+class ArchiverStats:
+    """Счетчики фоновой архивации"""
+    
+    def __init__(self):
+        self.passes = 0
+        self.batches = 0
+        self.room_messages = 0
+        self.private_messages = 0
+        self.vacuumed_pages = 0
+        self.errors = 0
+        self.last_pass_time = 0.0
+
+class Archiver:
+    """Фоновый перенос старых сообщений в архивы по месяцам и возврат места ОС.
+    
+    Раз в interval секунд для каждой комнаты со сроком хранения (и для ЛС,
+    если задан private_keep_days) старые сообщения переносятся пачками по
+    batch_size: каждая пачка - короткая транзакция писателя, между пачками
+    пауза, чтобы запись новых сообщений не ждала. Непрочитанные ЛС остаются
+    в основной базе. После прохода освобожденные страницы возвращаются
+    через PRAGMA incremental_vacuum.
+    """
+    
+    def __init__(self, db, history_cache, interval=DEFAULT_RETENTION_INTERVAL, private_keep_days=None,
+                 batch_size=ARCHIVE_BATCH):
+        self.db = db
+        self.history_cache = history_cache
+        self.interval = interval
+        self.private_keep_days = private_keep_days
+        self.batch_size = batch_size
+        self.stats = ArchiverStats()
+        self.pass_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+    
+    def start(self):
+        """Запуск фонового потока; без interval архивация только по /admin_archive"""
+        if not self.interval:
+            return
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def stop(self, timeout=5.0):
+        self.stopped.set()
+        # Поток может быть посреди пачки: база закрывается после нее
+        if self.thread is not None:
+            self.thread.join(timeout)
+    
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.run_once()
+    
+    def run_once(self):
+        """Один проход архивации; False, если проход уже идет"""
+        if not self.pass_lock.acquire(blocking=False):
+            return False
+        start = time.perf_counter()
+        try:
+            for room_id, keep_days in self.db.get_retention_policies():
+                self.archive_room(room_id, cutoff(keep_days))
+            if self.private_keep_days is not None:
+                self.archive_private(cutoff(self.private_keep_days))
+            self.stats.vacuumed_pages += self.db.incremental_vacuum(VACUUM_PAGES)
+        except Exception as e:
+            self.stats.errors += 1
+            print(f"Ошибка архивации сообщений: {e}")
+        finally:
+            self.stats.passes += 1
+            self.stats.last_pass_time = time.perf_counter() - start
+            self.pass_lock.release()
+        return True
+    
+    def archive_room(self, room_id, border):
+        while not self.stopped.is_set():
+            moved = self.db.archive_room_messages(room_id, border, self.batch_size)
+            if not moved:
+                return
+            self.stats.batches += 1
+            self.stats.room_messages += moved
+            # В кеше могли остаться перенесенные сообщения
+            self.history_cache.invalidate(room_id)
+            self.stopped.wait(BATCH_PAUSE)
+    
+    def archive_private(self, border):
+        # Каждый проход начинается сначала: непрочитанные раньше ЛС могли быть прочитаны
+        position = 0
+        while not self.stopped.is_set():
+            moved, next_position = self.db.archive_private_messages(border, position, self.batch_size)
+            if next_position == position:
+                return
+            position = next_position
+            self.stats.batches += 1
+            self.stats.private_messages += moved
+            self.stopped.wait(BATCH_PAUSE)
@@ -0,0 +1,81 @@
+import sqlite3
+
+SEARCH_PAGE = 10  # результатов на страницу /search
+SNIPPET_TOKENS = 12  # слов вокруг совпадения во фрагменте
+
+# Индексы FTS5 с внешним содержимым: текст хранится только в самих таблицах
+# сообщений, а индекс обновляется триггерами при вставке, удалении и правке.
+INDEXED_TABLES = ('messages', 'private_messages')
+
+def fts5_available(cursor):
+    """Собран ли SQLite с FTS5"""
+    try:
+        cursor.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+        cursor.execute('DROP TABLE temp.fts5_probe')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def create_search_index(cursor):
+    """Таблицы FTS5 и триггеры для messages и private_messages, заполненные текущими данными"""
+    for table in INDEXED_TABLES:
+        index = f'{table}_fts'
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(
+                content, content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {index} (rowid, content) VALUES (new.id, new.content);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {index} ({index}, rowid, content) VALUES ('delete', old.id, old.content);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {index}_update AFTER UPDATE OF content ON {table} BEGIN
+                INSERT INTO {index} ({index}, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO {index} (rowid, content) VALUES (new.id, new.content);
+            END
+        ''')
+        cursor.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+def has_search_index(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone() is not None
+
+def ensure_search_index(conn):
+    """Включен ли поиск. Индекс создается, если база была создана на SQLite без FTS5.
+    
+    Миграция 4 к этому времени уже записана в user_version и повторно не
+    выполнится, поэтому проверка идет при каждом открытии базы. Как и миграции,
+    под BEGIN IMMEDIATE: воркеры кластера не построят индекс дважды.
+    """
+    if has_search_index(conn):
+        return True
+    if not fts5_available(conn.cursor()):
+        return False
+    
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if not has_search_index(conn):
+            create_search_index(conn.cursor())
+            print("Индекс полнотекстового поиска создан")
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    return True
+
+def match_query(text):
+    """Запрос пользователя -> выражение MATCH: все слова обязательны, без операторов FTS5.
+    
+    Каждое слово берется в кавычки, поэтому AND, NEAR, * и скобки из ввода
+    ищутся как обычный текст и не ломают разбор запроса. Слова ищутся по
+    префиксу: "релиз" находит и "релиза", и "релизу".
+    """
+    words = [word.replace('"', '""') for word in text.split()]
+    return ' '.join(f'"{word}"*' for word in words if word.strip('"'))
@@ -1,20 +1,98 @@
+import argparse
+import os
 import socket
+import subprocess
+import sys
 import threading
 import time
+from admin_commands import commands as admin_commands
+from admission import (
+    DEFAULT_BACKLOG, DEFAULT_IP_BURST, DEFAULT_IP_RATE, DEFAULT_MAX_CONNECTIONS, DEFAULT_MAX_PER_IP,
+    LOCAL_PEER, REJECT_REPLIES, AdmissionController,
+)
+from auth_pool import (
+    DEFAULT_AUTH_QUEUE_LIMIT, DEFAULT_AUTH_TIMEOUT, DEFAULT_AUTH_WORKERS,
+    AuthBusyError, AuthPool, AuthTimeoutError,
+)
+from chat_commands import commands as chat_commands
+from commands import CommandRegistry
+from compression import DEFAULT_COMPRESS_THRESHOLD, CompressionSettings
+from connection import CLOSE_FLUSH_TIMEOUT, SocketConnection
 from database import Database
+from db_pool import DEFAULT_DB_READERS
+from handoff import DEFAULT_HANDOFF_PATH, HandoffClient, HandoffError, HandoffServer
+from heartbeat import (
+    DEFAULT_IDLE_TIMEOUT, DEFAULT_LOGIN_TIMEOUT, DEFAULT_PING_INTERVAL, DEFAULT_TEXT_IDLE_TIMEOUT, Reaper,
+)
+from history_cache import DEFAULT_HISTORY_CACHE_BYTES, DEFAULT_HISTORY_ROOM_SIZE, HistoryCache
+from messages import chat_message, history_message, system_message
+from outbound import DEFAULT_MAX_QUEUE_BYTES, OVERFLOW_POLICIES, POLICY_EVICT, OutboundStats
+from protocol import EncodedMessage
+from retention import DEFAULT_RETENTION_INTERVAL, Archiver
+from sessions import DEFAULT_SESSION_TTL, SessionManager
+from user_cache import DEFAULT_USER_CACHE_SIZE
 from validation import Validator
+from write_behind import DURABILITY_ASYNC, DURABILITY_MODES
+
+# Плавный перезапуск: старый процесс отключает клиентов пачками, чтобы они
+# возвращались через /resume в новый процесс постепенно, а не все разом
+RESTART_DRAIN_BATCH = 200
+RESTART_DRAIN_INTERVAL = 0.1
+
+HISTORY_ON_JOIN = 20  # сообщений истории при входе и /join
 
 class AuthChatServer:
-    def __init__(self, host='localhost', port=5555):
+    def __init__(self, host='localhost', port=5555, max_queue_bytes=DEFAULT_MAX_QUEUE_BYTES,
+                 overflow_policy=POLICY_EVICT, reuse_port=False, auth_workers=DEFAULT_AUTH_WORKERS,
+                 auth_queue_limit=DEFAULT_AUTH_QUEUE_LIMIT, auth_timeout=DEFAULT_AUTH_TIMEOUT,
+                 session_secret=None, session_ttl=DEFAULT_SESSION_TTL,
+                 compress_threshold=DEFAULT_COMPRESS_THRESHOLD, ping_interval=DEFAULT_PING_INTERVAL,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, login_timeout=DEFAULT_LOGIN_TIMEOUT,
+                 text_idle_timeout=DEFAULT_TEXT_IDLE_TIMEOUT,
+                 backlog=DEFAULT_BACKLOG, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_per_ip=DEFAULT_MAX_PER_IP, ip_rate=DEFAULT_IP_RATE, ip_burst=DEFAULT_IP_BURST,
+                 takeover=False, handoff_path=DEFAULT_HANDOFF_PATH, unix_path=None,
+                 db_readers=DEFAULT_DB_READERS, db_durability=DURABILITY_ASYNC,
+                 history_room_size=DEFAULT_HISTORY_ROOM_SIZE, history_cache_bytes=DEFAULT_HISTORY_CACHE_BYTES,
+                 user_cache_size=DEFAULT_USER_CACHE_SIZE, retention_interval=DEFAULT_RETENTION_INTERVAL,
+                 private_retention_days=None):
         self.host = host
         self.port = port
-        self.db = Database()
+        self.unix_path = unix_path
+        self.unix_socket = None
+        self.reuse_port = reuse_port
+        self.backlog = backlog
+        self.takeover = takeover
+        self.handoff_path = handoff_path
+        self.handoff = None
+        self.restart_command = None  # команда запуска нового процесса для /admin_restart
+        self.admission = AdmissionController(max_connections, max_per_ip, ip_rate, ip_burst)
+        self.max_queue_bytes = max_queue_bytes
+        self.overflow_policy = overflow_policy
+        self.outbound_stats = OutboundStats()
+        self.compression = None  # None - сервер не соглашается на сжатие
+        if compress_threshold is not None:
+            self.compression = CompressionSettings(compress_threshold)
+        self.db = Database(readers=db_readers, durability=db_durability, user_cache_size=user_cache_size)
+        self.history_cache = HistoryCache(max(history_room_size, HISTORY_ON_JOIN), history_cache_bytes)
+        self.archiver = Archiver(self.db, self.history_cache, retention_interval, private_retention_days)
+        self.auth_pool = AuthPool(auth_workers, auth_queue_limit, auth_timeout)
+        self.sessions = SessionManager(session_secret, session_ttl)
         self.validator = Validator()
+        self.reaper = Reaper(self, ping_interval, idle_timeout, login_timeout,
+                             text_idle_timeout=text_idle_timeout)
+        self.commands = CommandRegistry()
+        self.commands.include(chat_commands)
+        self.commands.include(admin_commands)
+        self.connections = set()
         self.clients = {}
         self.username_to_socket = {}
         self.rooms = {'general': 1}
+        self.room_members = {}
         self.lock = threading.Lock()
+        self.stopped = False
         self.user_message_history = {}
+        self.last_rooms = {}
         
         self.load_rooms()
     
@@ -26,434 +104,469 @@ class AuthChatServer:
     
     def start_server(self):
         """Запуск сервера"""
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
         try:
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(10)
+            if self.takeover:
+                self.take_over_listener()
+            else:
+                self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if self.reuse_port:
+                    # Несколько процессов слушают один порт, ядро распределяет подключения
+                    self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                self.server_socket.bind((self.host, self.port))
+                self.server_socket.listen(self.backlog)
+            if self.unix_path and self.unix_socket is None:
+                self.unix_socket = self.open_unix_listener()
             print(f"Сервер запущен на {self.host}:{self.port}")
+            if self.unix_socket is not None:
+                print(f"Локальные подключения: {self.unix_path}")
+                threading.Thread(target=self.accept_local_connections, daemon=True).start()
             print("Ожидание подключений...")
+            self.reaper.start()
+            self.archiver.start()
             
             while True:
                 client_socket, address = self.server_socket.accept()
-                print(f"Новое подключение: {address}")
-                
-                client_thread = threading.Thread(
-                    target=self.handle_client_auth,
-                    args=(client_socket,)
-                )
-                client_thread.daemon = True
-                client_thread.start()
+                self.accept_connection(client_socket, address)
                 
         except Exception as e:
             print(f"Ошибка сервера: {e}")
         finally:
             self.stop_server()
     
+    def open_unix_listener(self):
+        """Слушающий Unix-сокет для клиентов и ботов на той же машине"""
+        if os.path.exists(self.unix_path):
+            # Файл сокета остался от прошлого запуска
+            os.unlink(self.unix_path)
+        unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        unix_socket.bind(self.unix_path)
+        unix_socket.listen(self.backlog)
+        return unix_socket
+    
+    def accept_local_connections(self):
+        """Цикл accept Unix-сокета (в отдельном потоке)"""
+        try:
+            while True:
+                client_socket, _ = self.unix_socket.accept()
+                self.accept_connection(client_socket, (LOCAL_PEER, self.unix_path))
+        except OSError:
+            pass
+    
+    def accept_connection(self, client_socket, address):
+        """Допуск принятого подключения и запуск потока-обработчика"""
+        if self.handoff is not None and self.handoff.forward(client_socket, address):
+            return
+        
+        allowed, reason = self.admission.admit(address[0])
+        if not allowed:
+            self.reject_connection(client_socket, reason)
+            return
+        
+        print(f"Новое подключение: {address}")
+        
+        client_thread = threading.Thread(
+            target=self.handle_client_auth,
+            args=(self.create_connection(client_socket, address),)
+        )
+        client_thread.daemon = True
+        client_thread.start()
+    
+    def adopt_connection(self, client_socket, address):
+        """Подключение, принятое старым процессом уже после передачи порта"""
+        self.accept_connection(client_socket, address)
+    
+    def take_over_listener(self):
+        """Прием слушающего сокета и состояния у работающего сервера (плавный перезапуск)"""
+        client = HandoffClient(self.handoff_path)
+        sockets, state = client.take_over()
+        for listen_socket in sockets:
+            # Режим блокировки общий у всех процессов, держащих сокет: выставляем свой
+            listen_socket.setblocking(True)
+            if listen_socket.family == socket.AF_UNIX:
+                self.unix_socket = listen_socket
+            else:
+                self.server_socket = listen_socket
+        self.import_state(state)
+        client.confirm()
+        threading.Thread(target=client.receive_forwarded, args=(self.adopt_connection,), daemon=True).start()
+        print("Слушающий сокет принят у старого процесса")
+    
+    def export_state(self):
+        """Состояние для нового процесса: секрет и отзывы токенов /resume, комнаты пользователей"""
+        with self.lock:
+            last_rooms = dict(self.last_rooms)
+            for client_data in self.clients.values():
+                last_rooms[client_data['user_id']] = client_data['current_room']
+        return {
+            'session_secret': self.sessions.secret.hex(),
+            'revoked_sessions': list(self.sessions.revoked.items()),
+            'last_rooms': list(last_rooms.items()),
+        }
+    
+    def import_state(self, state):
+        """Восстановление состояния, полученного от старого процесса"""
+        self.sessions.secret = bytes.fromhex(state['session_secret'])
+        for user_id, revoked_at in state.get('revoked_sessions', []):
+            self.sessions.revoke(user_id, revoked_at)
+        with self.lock:
+            self.last_rooms.update((user_id, room_id) for user_id, room_id in state['last_rooms'])
+    
+    def restart_server(self):
+        """Плавный перезапуск: передача порта новому процессу. Возвращает (успех, сообщение).
+        
+        После успеха вызывающий запускает drain_and_exit, когда отправит свой ответ.
+        """
+        if self.restart_command is None:
+            return False, "Перезапуск доступен только серверу, запущенному из командной строки"
+        
+        with self.lock:
+            if self.handoff is not None:
+                return False, "Перезапуск уже выполняется"
+            self.handoff = HandoffServer(self.handoff_path)
+        
+        process = None
+        try:
+            process = subprocess.Popen(self.restart_command + ['--takeover'])
+            self.handoff.hand_over(self.get_listening_sockets(), self.export_state())
+        except (OSError, HandoffError) as e:
+            if process is not None:
+                process.kill()
+            self.handoff = None
+            return False, f"Перезапуск не удался: {e}"
+        
+        print(f"Порт передан новому процессу (PID {process.pid})")
+        return True, f"Новый процесс (PID {process.pid}) принимает подключения, старый завершает работу"
+    
+    def get_listening_sockets(self):
+        sockets = [self.server_socket]
+        if self.unix_socket is not None:
+            sockets.append(self.unix_socket)
+        return sockets
+    
+    def drain_and_exit(self):
+        """Завершение старого процесса: клиенты отключаются пачками и возвращаются через /resume"""
+        self.reaper.stop()
+        # Поток accept остается ждать: слушающий сокет теперь общий с новым процессом,
+        # и то, что старый успеет принять, пересылается туда (accept_connection)
+        self.broadcast_system("Сервер перезапускается, переподключение...")
+        
+        with self.lock:
+            clients = list(self.clients.keys())
+            self.clients.clear()
+            self.room_members.clear()
+            self.username_to_socket.clear()
+        
+        for start in range(0, len(clients), RESTART_DRAIN_BATCH):
+            for client in clients[start:start + RESTART_DRAIN_BATCH]:
+                try:
+                    client.close()
+                except:
+                    pass
+            time.sleep(RESTART_DRAIN_INTERVAL)
+        
+        # Не вошедшие подключения и дописывание очередей отправки
+        for connection in self.get_connections():
+            connection.close()
+        deadline = time.monotonic() + CLOSE_FLUSH_TIMEOUT
+        while self.get_connections() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        
+        self.archiver.stop()
+        self.flush_pending_writes()
+        self.auth_pool.shutdown()
+        self.db.close()
+        self.handoff.close()
+        print(f"Старый процесс завершен, переслано подключений: {self.handoff.forwarded}")
+        os._exit(0)
+    
+    def flush_pending_writes(self):
+        """Запись в базу всего, что еще не сохранено"""
+        self.db.flush()
+        self.db.checkpoint()
+    
+    def create_connection(self, client_socket, address):
+        """Обертка сокета в подключение с очередью отправки"""
+        return self.track_connection(SocketConnection(
+            client_socket, address, self.max_queue_bytes, self.overflow_policy, self.outbound_stats,
+            self.compression
+        ))
+    
+    def reject_connection(self, client_socket, reason):
+        """Дешевый отказ: короткий ответ без ожидания и закрытие, без потока-обработчика"""
+        try:
+            client_socket.setblocking(False)
+            client_socket.send(REJECT_REPLIES[reason].encode('utf-8'))
+        except OSError:
+            pass
+        client_socket.close()
+    
+    def track_connection(self, connection):
+        """Учет подключения (в том числе еще не вошедшего) для проверки живости"""
+        with self.lock:
+            self.connections.add(connection)
+        return connection
+    
+    def untrack_connection(self, connection):
+        """Снятие подключения с учета (вызывать под self.lock). True, если оно было учтено"""
+        if connection not in self.connections:
+            return False
+        self.connections.discard(connection)
+        return True
+    
+    def release_connection(self, connection):
+        """Освобождение места подключения в лимитах допуска"""
+        self.admission.release(connection.address[0])
+    
+    def get_connections(self):
+        """Снимок всех открытых подключений"""
+        with self.lock:
+            return list(self.connections)
+    
     def handle_client_auth(self, client_socket):
         """Обработка аутентификации клиента"""
         try:
-            authenticated = False
             user_id = None
             username = None
+            messages = []
             
-            while not authenticated:
-                auth_menu = (
-                    "Добро пожаловать! Выберите действие:\n"
-                    "1. /login <username> <password>\n"
-                    "2. /register <username> <password>\n"
-                    "3. /exit"
-                )
-                client_socket.send(auth_menu.encode('utf-8'))
-                
-                data = client_socket.recv(1024).decode('utf-8').strip()
-                
-                if data.startswith('/login '):
-                    parts = data.split(' ', 2)
-                    if len(parts) == 3:
-                        _, username, password = parts
-                        
-                        username = self.validator.sanitize_input(username)
-                        password = self.validator.sanitize_input(password)
-                        
-                        success, result = self.db.verify_user(username, password)
-                        if success:
-                            authenticated = True
-                            user_id = result
-                            client_socket.send("Успешный вход!".encode('utf-8'))
-                        else:
-                            client_socket.send(f"Ошибка: {result}".encode('utf-8'))
-                    else:
-                        client_socket.send("Неверный формат: /login username password".encode('utf-8'))
-                
-                elif data.startswith('/register '):
-                    parts = data.split(' ', 2)
-                    if len(parts) == 3:
-                        _, username, password = parts
-                        
-                        username = self.validator.sanitize_input(username)
-                        password = self.validator.sanitize_input(password)
-                        
-                        valid_username, msg_user = self.validator.validate_username(username)
-                        if not valid_username:
-                            client_socket.send(f"Ошибка имени пользователя: {msg_user}".encode('utf-8'))
-                            continue
-                        
-                        valid_password, msg_pass = self.validator.validate_password(password)
-                        if not valid_password:
-                            client_socket.send(f"Ошибка пароля: {msg_pass}".encode('utf-8'))
-                            continue
-                        
-                        success, message = self.db.register_user(username, password)
-                        if success:
-                            client_socket.send("Регистрация успешна! Теперь войдите.".encode('utf-8'))
-                        else:
-                            client_socket.send(f"Ошибка: {message}".encode('utf-8'))
-                    else:
-                        client_socket.send("Неверный формат: /register username password".encode('utf-8'))
-                
-                elif data == '/exit':
-                    client_socket.close()
+            self.send_auth_menu(client_socket)
+            while user_id is None:
+                messages = client_socket.receive()
+                if messages is None:
                     return
                 
-                else:
-                    client_socket.send("Неизвестная команда".encode('utf-8'))
+                while messages and user_id is None:
+                    data = messages.pop(0).strip()
+                    
+                    if data == '/exit':
+                        client_socket.close()
+                        return
+                    
+                    result = self.process_auth_command(client_socket, data)
+                    if result:
+                        user_id, username, room_id = result
+                    else:
+                        self.send_auth_menu(client_socket)
             
-            if authenticated and user_id:
-                with self.lock:
-                    self.clients[client_socket] = {
-                        'user_id': user_id,
-                        'username': username,
-                        'current_room': 1
-                    }
-                    self.username_to_socket[username] = client_socket
-                    self.user_message_history[user_id] = []
-                
-                print(f"Пользователь '{username}' аутентифицирован")
-                self.broadcast_system(f"Пользователь {username} присоединился к чату")
-                
-                self.send_message_history(client_socket, 1)
-                self.handle_client_messages(client_socket, user_id, username)
+            self.register_client(client_socket, user_id, username, room_id)
+            self.handle_client_messages(client_socket, user_id, username, messages)
                 
         except Exception as e:
             print(f"Ошибка аутентификации: {e}")
         finally:
             self.remove_client(client_socket)
     
-    def handle_client_messages(self, client_socket, user_id, username):
-        """Обработка сообщений аутентифицированного клиента"""
-        try:
-            help_text = (
-                "\nДоступные команды:\n"
-                "/rooms - список комнат\n"
-                "/join <room> - присоединиться к комнате\n"
-                "/create <room> - создать комнату\n"
-                "/users - список пользователей онлайн\n"
-                "/msg <user> <message> - приватное сообщение\n"
-                "/pm <user> <message> - приватное сообщение (алиас)\n"
-                "/inbox - входящие сообщения\n"
-                "/chat <user> - начать чат с пользователем\n"
-                "/myinfo - ваша информация\n"
-                "/help - справка по командам\n"
-                "/exit - выход\n"
-            )
-            client_socket.send(help_text.encode('utf-8'))
-            
-            while True:
-                data = client_socket.recv(1024).decode('utf-8').strip()
+    def send_auth_menu(self, client_socket):
+        """Отправка меню аутентификации"""
+        auth_menu = (
+            "Добро пожаловать! Выберите действие:\n"
+            "1. /login <username> <password>\n"
+            "2. /register <username> <password>\n"
+            "3. /resume <token> - вернуться в сессию без пароля\n"
+            "4. /exit"
+        )
+        client_socket.send(auth_menu.encode('utf-8'))
+    
+    def process_auth_command(self, client_socket, data):
+        """Обработка команды до входа. Возвращает (user_id, username, room_id) при успешном входе"""
+        if data.startswith('/login '):
+            parts = data.split(' ', 2)
+            if len(parts) == 3:
+                _, username, password = parts
                 
-                if not data:
-                    break
+                username = self.validator.sanitize_input(username)
+                password = self.validator.sanitize_input(password)
                 
-                data = self.validator.sanitize_input(data)
+                record = self.db.get_password_hash(username)
+                try:
+                    valid = record is not None and self.auth_pool.check_password(password, record[1])
+                except (AuthBusyError, AuthTimeoutError) as e:
+                    self.send_auth_retry(client_socket, e)
+                    return None
                 
-                if data.startswith('/'):
-                    self.handle_command(client_socket, user_id, username, data)
+                if valid:
+                    client_socket.send("Успешный вход!".encode('utf-8'))
+                    self.send_session_token(client_socket, record[0], username)
+                    return record[0], username, 1
                 else:
-                    self.handle_normal_message(client_socket, user_id, username, data)
-                    
-        except Exception as e:
-            print(f"Ошибка обработки сообщений: {e}")
-        finally:
-            self.remove_client(client_socket)
-    
-    def handle_command(self, client_socket, user_id, username, command):
-        """Обработка специальных команд"""
-        parts = command.split(' ')
-        cmd = parts[0]
-        
-        if cmd == '/rooms':
-            rooms_list = "Доступные комнаты:\n"
-            for room_name, room_id in self.rooms.items():
-                rooms_list += f"- {room_name}\n"
-            client_socket.send(rooms_list.encode('utf-8'))
-        
-        elif cmd == '/join' and len(parts) > 1:
-            room_name = parts[1]
-            if room_name in self.rooms:
-                with self.lock:
-                    self.clients[client_socket]['current_room'] = self.rooms[room_name]
-                client_socket.send(f"Вы присоединились к комнате {room_name}".encode('utf-8'))
-                self.send_message_history(client_socket, self.rooms[room_name])
+                    client_socket.send("Ошибка: Неверный логин или пароль".encode('utf-8'))
             else:
-                client_socket.send(f"Комната {room_name} не найдена".encode('utf-8'))
+                client_socket.send("Неверный формат: /login username password".encode('utf-8'))
         
-        elif cmd == '/create' and len(parts) > 1:
-            room_name = parts[1]
-            
-            valid_room, msg = self.validator.validate_room_name(room_name)
-            if not valid_room:
-                client_socket.send(f"Ошибка: {msg}".encode('utf-8'))
-                return
-            
-            success, message = self.db.create_room(room_name, user_id)
-            if success:
-                self.load_rooms()
-                client_socket.send(f"Комната {room_name} создана".encode('utf-8'))
-            else:
-                client_socket.send(f"Ошибка: {message}".encode('utf-8'))
-        
-        elif cmd == '/users':
-            online_users = "Пользователи онлайн:\n"
-            with self.lock:
-                for client_data in self.clients.values():
-                    online_users += f"- {client_data['username']}\n"
-            client_socket.send(online_users.encode('utf-8'))
-        
-        elif cmd == '/get_rooms':
-            # Отправляем список комнат в формате для GUI
-            rooms_list = "Доступные комнаты:\n"
-            for room_name, room_id in self.rooms.items():
-                rooms_list += f"- {room_name}\n"
-            client_socket.send(rooms_list.encode('utf-8'))    
-        
-        elif cmd in ['/msg', '/pm'] and len(parts) >= 3:
-            target_username = parts[1]
-            message = ' '.join(parts[2:])
-            
-            valid_msg, msg_text = self.validator.validate_message(message)
-            if not valid_msg:
-                client_socket.send(f"Ошибка: {msg_text}".encode('utf-8'))
-                return
-            
-            if target_username == username:
-                client_socket.send("Нельзя отправить сообщение самому себе".encode('utf-8'))
-                return
-            
-            spam_detected, spam_reason = self.validator.detect_spam_patterns(
-                message, user_id, self.user_message_history.get(user_id, [])
-            )
-            if spam_detected:
-                client_socket.send(f"Сообщение отклонено: {spam_reason}".encode('utf-8'))
-                return
-            
-            target_socket = None
-            with self.lock:
-                target_socket = self.username_to_socket.get(target_username)
-            
-            if target_socket and target_socket in self.clients:
-                target_user_id = self.clients[target_socket]['user_id']
+        elif data.startswith('/register '):
+            parts = data.split(' ', 2)
+            if len(parts) == 3:
+                _, username, password = parts
+                
+                username = self.validator.sanitize_input(username)
+                password = self.validator.sanitize_input(password)
                 
-                self.db.save_private_message(user_id, target_user_id, message)
+                valid_username, msg_user = self.validator.validate_username(username)
+                if not valid_username:
+                    client_socket.send(f"Ошибка имени пользователя: {msg_user}".encode('utf-8'))
+                    return None
                 
-                self._update_message_history(user_id, message)
+                valid_password, msg_pass = self.validator.validate_password(password)
+                if not valid_password:
+                    client_socket.send(f"Ошибка пароля: {msg_pass}".encode('utf-8'))
+                    return None
                 
-                private_msg = f"[ЛС от {username}] {message}"
-                target_socket.send(private_msg.encode('utf-8'))
+                if self.db.get_user_by_username(username):
+                    client_socket.send("Ошибка: Пользователь уже существует".encode('utf-8'))
+                    return None
                 
-                confirmation = f"[ЛС для {target_username}] {message}"
-                client_socket.send(confirmation.encode('utf-8'))
+                try:
+                    password_hash = self.auth_pool.hash_password(password)
+                except (AuthBusyError, AuthTimeoutError) as e:
+                    self.send_auth_retry(client_socket, e)
+                    return None
                 
-                self.db.mark_messages_as_read(target_user_id, user_id)
+                success, message = self.db.register_user(username, password, password_hash)
+                if success:
+                    client_socket.send("Регистрация успешна! Теперь войдите.".encode('utf-8'))
+                else:
+                    client_socket.send(f"Ошибка: {message}".encode('utf-8'))
             else:
-                client_socket.send(f"Пользователь {target_username} не в сети".encode('utf-8'))
+                client_socket.send("Неверный формат: /register username password".encode('utf-8'))
         
-        elif cmd == '/inbox':
-            messages = self.db.get_private_messages(user_id, limit=10)
-            if not messages:
-                client_socket.send("Нет входящих сообщений".encode('utf-8'))
-            else:
-                inbox = "Последние сообщения:\n"
-                for msg_id, from_user, to_user, content, timestamp, is_read in messages:
-                    status = "✓" if is_read else "✗"
-                    time_str = timestamp.split(' ')[1][:5]
-                    direction = "→" if from_user == username else "←"
-                    other_user = to_user if from_user == username else from_user
-                    inbox += f"[{time_str}] {status} {direction} {other_user}: {content}\n"
-                client_socket.send(inbox.encode('utf-8'))
-        
-        elif cmd == '/chat' and len(parts) > 1:
-            target_username = parts[1]
-            target_user = self.db.get_user_by_username(target_username)
-            if not target_user:
-                client_socket.send(f"Пользователь {target_username} не найден".encode('utf-8'))
-                return
-            
-            target_user_id, _ = target_user
-            messages = self.db.get_private_messages(user_id, target_user_id, limit=20)
-            
-            if not messages:
-                client_socket.send(f"Нет сообщений с {target_username}".encode('utf-8'))
-            else:
-                history = f"История чата с {target_username}:\n"
-                for msg_id, from_user, to_user, content, timestamp, is_read in messages:
-                    time_str = timestamp.split(' ')[1][:5]
-                    arrow = "→" if from_user == username else "←"
-                    history += f"[{time_str}] {arrow} {content}\n"
-                client_socket.send(history.encode('utf-8'))
-                self.db.mark_messages_as_read(user_id, target_user_id)
-        
-        elif cmd == '/debug_db' and username == 'admin':
-            rooms_count = len(self.rooms)
-            users_count = len(self.clients)
-            
-            cursor = self.db.conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM users")
-            total_users = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM messages")
-            total_messages = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM private_messages")
-            total_private = cursor.fetchone()[0]
+        elif data.startswith('/resume '):
+            session = self.sessions.verify(data[len('/resume '):].strip())
+            if session is None:
+                client_socket.send("Ошибка: Сессия недействительна или истекла, войдите заново".encode('utf-8'))
+                return None
             
-            info = (
-                f"Информация о базе данных:\n"
-                f"Пользователей в базе: {total_users}\n"
-                f"Пользователей онлайн: {users_count}\n"
-                f"Комнат: {rooms_count}\n"
-                f"Сообщений в чатах: {total_messages}\n"
-                f"Приватных сообщений: {total_private}\n"
-            )
-            client_socket.send(info.encode('utf-8'))
+            user_id, username = session
+            room_id = self.get_last_room(user_id, username)
+            room_name = self.get_room_name(room_id)
+            client_socket.send(f"Сессия восстановлена! Комната: {room_name}".encode('utf-8'))
+            self.send_session_token(client_socket, user_id, username)
+            return user_id, username, room_id
         
-        elif cmd == '/myinfo':
-            with self.lock:
-                current_room_id = self.clients[client_socket]['current_room']
-            
-            current_room_name = "general"
-            for room_name, room_id in self.rooms.items():
-                if room_id == current_room_id:
-                    current_room_name = room_name
-                    break
-            
-            cursor = self.db.conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_id,))
-            public_msgs = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM private_messages WHERE from_user_id = ?", (user_id,))
-            sent_private = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM private_messages WHERE to_user_id = ?", (user_id,))
-            received_private = cursor.fetchone()[0]
-            
-            info = (
-                f"Ваша информация:\n"
-                f"Имя: {username}\n"
-                f"ID: {user_id}\n"
-                f"Текущая комната: {current_room_name}\n"
-                f"Статистика:\n"
-                f"  - Сообщений в чатах: {public_msgs}\n"
-                f"  - Отправлено ЛС: {sent_private}\n"
-                f"  - Получено ЛС: {received_private}\n"
-            )
-            client_socket.send(info.encode('utf-8'))
-        
-        elif cmd == '/help':
-            help_text = (
-                "Доступные команды:\n"
-                "/rooms - список комнат\n"
-                "/join <room> - присоединиться к комнате\n"
-                "/create <room> - создать комнату\n"
-                "/users - список пользователей онлайн\n"
-                "/msg <user> <message> - приватное сообщение\n"
-                "/pm <user> <message> - приватное сообщение (алиас)\n"
-                "/inbox - входящие сообщения\n"
-                "/chat <user> - начать чат с пользователем\n"
-                "/myinfo - ваша информация\n"
-                "/help - эта справка\n"
-                "/exit - выход\n"
-            )
-            client_socket.send(help_text.encode('utf-8'))
+        else:
+            client_socket.send("Неизвестная команда".encode('utf-8'))
         
-        elif cmd == '/exit':
-            client_socket.send("До свидания!".encode('utf-8'))
-            raise Exception("Выход по команде")
-
-        elif cmd == '/admin_stats':
-            # Расширенная статистика для админа
-            if username == 'admin':
-                cursor = self.db.conn.cursor()
-                
-                # Статистика по комнатам
-                cursor.execute('''
-                    SELECT r.name, COUNT(m.id) as message_count 
-                    FROM rooms r 
-                    LEFT JOIN messages m ON r.id = m.room_id 
-                    GROUP BY r.id
-                ''')
-                room_stats = cursor.fetchall()
-                
-                # Активные пользователи
-                cursor.execute('''
-                    SELECT u.username, COUNT(m.id) as message_count,
-                        MAX(m.created_at) as last_active
-                    FROM users u 
-                    LEFT JOIN messages m ON u.id = m.user_id 
-                    GROUP BY u.id 
-                    ORDER BY message_count DESC 
-                    LIMIT 10
-                ''')
-                user_stats = cursor.fetchall()
-                
-                stats = "=== РАСШИРЕННАЯ СТАТИСТИКА ===\n\n"
-                stats += "📊 Статистика по комнатам:\n"
-                for room_name, count in room_stats:
-                    stats += f"  {room_name}: {count} сообщений\n"
-                
-                stats += "\n👥 Активные пользователи:\n"
-                for user, count, last_active in user_stats:
-                    stats += f"  {user}: {count} сообщений (активен: {last_active})\n"
-                
-                client_socket.send(stats.encode('utf-8'))
-            else:
-                client_socket.send("❌ Недостаточно прав".encode('utf-8'))
-
-        elif cmd == '/admin_broadcast' and username == 'admin':
-            # Рассылка системного сообщения всем пользователям
-            if len(parts) > 1:
-                message = ' '.join(parts[1:])
-                self.broadcast_system(f"📢 АДМИНИСТРАТОР: {message}")
-                client_socket.send("✅ Системное сообщение отправлено".encode('utf-8'))
-            else:
-                client_socket.send("❌ Использование: /admin_broadcast <сообщение>".encode('utf-8'))
-
-        elif cmd == '/admin_kick' and username == 'admin' and len(parts) > 1:
-            # Отключение пользователя
-            target_username = parts[1]
-            target_socket = None
-            
-            with self.lock:
-                for sock, data in self.clients.items():
-                    if data['username'] == target_username:
-                        target_socket = sock
-                        break
+        return None
+    
+    def send_session_token(self, client_socket, user_id, username):
+        """Выдача токена для /resume после переподключения"""
+        token = self.sessions.issue(user_id, username)
+        client_socket.send(f"Токен сессии: {token}".encode('utf-8'))
+    
+    def revoke_sessions(self, user_id):
+        """Отзыв токенов /resume пользователя: вернуться он сможет только через /login"""
+        return self.sessions.revoke(user_id)
+    
+    def get_last_room(self, user_id, username):
+        """Комната, в которой пользователь был до обрыва связи (по умолчанию general)"""
+        with self.lock:
+            # Старое подключение могло еще не закрыться
+            old_socket = self.username_to_socket.get(username)
+            if old_socket in self.clients:
+                return self.clients[old_socket]['current_room']
+            return self.last_rooms.get(user_id, 1)
+    
+    def get_room_name(self, room_id):
+        """Имя комнаты по id"""
+        for room_name, known_id in self.rooms.items():
+            if known_id == room_id:
+                return room_name
+        return "general"
+    
+    def send_auth_retry(self, client_socket, error):
+        """Ответ клиенту, когда пул проверки паролей перегружен или не успел"""
+        if isinstance(error, AuthBusyError):
+            reply = "Сервер авторизации перегружен, повторите попытку позже"
+        else:
+            reply = "Превышено время проверки пароля, повторите попытку позже"
+        client_socket.send(reply.encode('utf-8'))
+    
+    def register_client(self, client_socket, user_id, username, room_id=1):
+        """Добавление аутентифицированного клиента в список онлайн"""
+        client_socket.authenticated = True
+        with self.lock:
+            self.clients[client_socket] = {
+                'user_id': user_id,
+                'username': username,
+                'current_room': room_id
+            }
+            self.room_members.setdefault(room_id, set()).add(client_socket)
+            self.username_to_socket[username] = client_socket
+            self.user_message_history[user_id] = []
+        
+        print(f"Пользователь '{username}' аутентифицирован")
+        self.broadcast_system(f"Пользователь {username} присоединился к чату")
+        
+        self.send_message_history(client_socket, room_id)
+        self.send_unread_notice(client_socket, user_id)
+    
+    def send_unread_notice(self, client_socket, user_id):
+        """Напоминание о непрочитанных личных сообщениях после входа"""
+        unread, conversations = self.db.get_unread_count(user_id)
+        if unread:
+            client_socket.send(
+                f"Непрочитанных личных сообщений: {unread} в {conversations} диалогах (/inbox)".encode('utf-8')
+            )
+    
+    def handle_client_messages(self, client_socket, user_id, username, pending=()):
+        """Обработка сообщений аутентифицированного клиента"""
+        try:
+            self.send_command_help(client_socket)
             
-            if target_socket:
-                try:
-                    target_socket.send("🔒 Вы были отключены администратором".encode('utf-8'))
-                    self.remove_client(target_socket)
-                    client_socket.send(f"✅ Пользователь {target_username} отключен".encode('utf-8'))
-                except:
-                    client_socket.send(f"❌ Ошибка при отключении пользователя".encode('utf-8'))
-
+            messages = list(pending)
+            while messages is not None:
+                for data in messages:
+                    data = data.strip()
+                    if data:
+                        self.process_client_message(client_socket, user_id, username, data)
+                
+                messages = client_socket.receive()
+                    
+        except Exception as e:
+            # Подключение, закрытое самим сервером (отключение, перезапуск), обрывает recv - это не ошибка
+            if not client_socket.closed:
+                print(f"Ошибка обработки сообщений: {e}")
+        finally:
+            self.remove_client(client_socket)
+    
+    def send_command_help(self, client_socket):
+        """Отправка списка команд после входа"""
+        help_text = (
+            "\nДоступные команды:\n"
+            "/rooms - список комнат\n"
+            "/join <room> - присоединиться к комнате\n"
+            "/create <room> - создать комнату\n"
+            "/users - список пользователей онлайн\n"
+            "/users <room> - кто сейчас в комнате\n"
+            "/msg <user> <message> - приватное сообщение\n"
+            "/pm <user> <message> - приватное сообщение (алиас)\n"
+            "/inbox - входящие сообщения\n"
+            "/chat <user> [before_id] [n] - чат с пользователем, страницами\n"
+            "/history [room] [before_id] [n] - история комнаты, страницами\n"
+            "/search <запрос> [room] [страница] - поиск по сообщениям\n"
+            "/search_archive <запрос> [room] - поиск по архиву старых сообщений\n"
+            "/myinfo - ваша информация\n"
+            "/help - справка по командам\n"
+            "/exit - выход\n"
+        )
+        client_socket.send(help_text.encode('utf-8'))
+    
+    def process_client_message(self, client_socket, user_id, username, data):
+        """Обработка одного сообщения аутентифицированного клиента"""
+        data = self.validator.sanitize_input(data)
+        
+        if data.startswith('/'):
+            self.handle_command(client_socket, user_id, username, data)
         else:
-            client_socket.send("Неизвестная команда".encode('utf-8'))
-            # Добавьте эти команды после существующих:
-
-
-
+            self.handle_normal_message(client_socket, user_id, username, data)
+    
+    def handle_command(self, client_socket, user_id, username, command):
+        """Обработка специальных команд через таблицу команд"""
+        self.commands.dispatch(self, client_socket, user_id, username, command)
+    
+    def is_admin(self, username):
+        return username == 'admin'
+    
     def handle_normal_message(self, client_socket, user_id, username, message):
         """Обработка обычного сообщения"""
         valid_msg, msg_text = self.validator.validate_message(message)
@@ -472,13 +585,15 @@ class AuthChatServer:
             current_room = self.clients[client_socket]['current_room']
         
         message_id = self.db.save_message(user_id, current_room, message)
+        # В режиме async id приходит позже, истории при входе он не нужен
+        self.history_cache.append(current_room, message_id if isinstance(message_id, int) else None,
+                                  username, message)
         
         self._update_message_history(user_id, message)
         
-        formatted_message = f"{username}: {message}"
-        print(f"Сообщение в комнате {current_room}: {formatted_message}")
+        print(f"Сообщение в комнате {current_room}: {username}: {message}")
         
-        self.broadcast_to_room(formatted_message, current_room, client_socket)
+        self.broadcast_to_room(chat_message(username, message), current_room, client_socket)
     
     def _update_message_history(self, user_id, message):
         """Обновление истории сообщений пользователя"""
@@ -494,25 +609,85 @@ class AuthChatServer:
             self.user_message_history[user_id] = self.user_message_history[user_id][-50:]
     
     def send_message_history(self, client_socket, room_id):
-        """Отправка истории сообщений комнаты"""
-        history = self.db.get_message_history(room_id, 20)
-        if history:
-            client_socket.send("История сообщений:\n".encode('utf-8'))
-            for msg_id, msg_username, content, timestamp in history:
-                time_str = timestamp.split(' ')[1][:5]
-                client_socket.send(f"[{time_str}] {msg_username}: {content}\n".encode('utf-8'))
+        """Отправка истории сообщений комнаты (из кеша, при промахе - из базы)"""
+        hit, encoded = self.history_cache.get(room_id, HISTORY_ON_JOIN)
+        if not hit:
+            generation = self.history_cache.generation(room_id)
+            # Сообщения из очереди отложенной записи должны попасть в выборку
+            self.db.flush()
+            history = self.db.get_message_history(room_id, self.history_cache.room_size)
+            self.history_cache.fill(room_id, history, generation)
+            encoded = history_message(history[-HISTORY_ON_JOIN:]) if history else None
+        if encoded is not None:
+            client_socket.send(encoded)
+    
+    def move_to_room(self, client_socket, room_id):
+        """Перевод клиента в комнату с обновлением индекса участников"""
+        with self.lock:
+            client_data = self.clients.get(client_socket)
+            if client_data is None:
+                return
+            
+            self._discard_room_member(client_socket, client_data['current_room'])
+            client_data['current_room'] = room_id
+            self.room_members.setdefault(room_id, set()).add(client_socket)
+    
+    def _discard_room_member(self, client_socket, room_id):
+        """Удаление клиента из индекса комнаты (вызывать под self.lock)"""
+        members = self.room_members.get(room_id)
+        if members is not None:
+            members.discard(client_socket)
+            if not members:
+                del self.room_members[room_id]
+    
+    def room_created(self, room_name):
+        """Обновление списка комнат после создания новой"""
+        self.load_rooms()
+    
+    def get_online_usernames(self):
+        """Имена всех пользователей онлайн"""
+        with self.lock:
+            return [client_data['username'] for client_data in self.clients.values()]
+    
+    def find_online_user(self, username):
+        """user_id пользователя, если он онлайн, иначе None"""
+        with self.lock:
+            target_socket = self.username_to_socket.get(username)
+            client_data = self.clients.get(target_socket)
+        if client_data is None:
+            return None
+        return client_data['user_id']
+    
+    def deliver_private_message(self, username, message):
+        """Доставка личного сообщения (EncodedMessage) пользователю онлайн"""
+        with self.lock:
+            target_socket = self.username_to_socket.get(username)
+        if target_socket is not None:
+            target_socket.send(message)
+    
+    def get_room_members(self, room_id):
+        """Снимок подключений, находящихся в комнате"""
+        with self.lock:
+            return list(self.room_members.get(room_id, ()))
+    
+    def get_room_usernames(self, room_id):
+        """Имена пользователей, находящихся в комнате"""
+        with self.lock:
+            return sorted(
+                self.clients[client]['username']
+                for client in self.room_members.get(room_id, ())
+                if client in self.clients
+            )
     
     def broadcast_to_room(self, message, room_id, sender_socket=None):
-        """Рассылка сообщения всем в указанной комнате"""
+        """Рассылка сообщения (строки или EncodedMessage) всем в указанной комнате"""
         disconnected_clients = []
+        encoded = message if isinstance(message, EncodedMessage) else EncodedMessage(message)
         
-        with self.lock:
-            clients_copy = self.clients.copy()
-        
-        for client, client_data in clients_copy.items():
-            if client != sender_socket and client_data['current_room'] == room_id:
+        for client in self.get_room_members(room_id):
+            if client != sender_socket:
                 try:
-                    client.send(message.encode('utf-8'))
+                    client.send(encoded)
                 except:
                     disconnected_clients.append(client)
         
@@ -522,13 +697,14 @@ class AuthChatServer:
     def broadcast_system(self, message):
         """Системное сообщение для всех"""
         disconnected_clients = []
+        encoded = system_message(message)
         
         with self.lock:
-            clients_copy = self.clients.copy()
+            clients_copy = list(self.clients.keys())
         
-        for client in clients_copy.keys():
+        for client in clients_copy:
             try:
-                client.send(f"[СИСТЕМА] {message}".encode('utf-8'))
+                client.send(encoded)
             except:
                 disconnected_clients.append(client)
         
@@ -537,32 +713,70 @@ class AuthChatServer:
     
     def remove_client(self, client_socket):
         """Удаление клиента"""
-        username = None
-        user_id = None
-        
         with self.lock:
-            if client_socket in self.clients:
-                username = self.clients[client_socket]['username']
-                user_id = self.clients[client_socket]['user_id']
-                del self.clients[client_socket]
-                if username in self.username_to_socket:
-                    del self.username_to_socket[username]
-        
-        if user_id and user_id in self.user_message_history:
-            del self.user_message_history[user_id]
+            tracked = self.untrack_connection(client_socket)
+            client_data = self._forget_client(client_socket)
+        if tracked:
+            self.release_connection(client_socket)
         
         try:
             client_socket.close()
         except:
             pass
         
-        if username:
+        if client_data:
+            username = client_data['username']
             print(f"{username} отключился")
             self.broadcast_system(f"Пользователь {username} покинул чат")
     
+    def _forget_client(self, client_socket):
+        """Удаление клиента из всех индексов (вызывать под self.lock). Возвращает его данные"""
+        client_data = self.clients.pop(client_socket, None)
+        if client_data is None:
+            return None
+        
+        username = client_data['username']
+        user_id = client_data['user_id']
+        self.last_rooms[user_id] = client_data['current_room']
+        self._discard_room_member(client_socket, client_data['current_room'])
+        if self.username_to_socket.get(username) is client_socket:
+            del self.username_to_socket[username]
+        self.user_message_history.pop(user_id, None)
+        return client_data
+    
+    def reap_connections(self, connections):
+        """Отключение мертвых подключений разом, с одним уведомлением на всех"""
+        usernames = []
+        released = []
+        with self.lock:
+            for connection in connections:
+                if self.untrack_connection(connection):
+                    released.append(connection)
+                client_data = self._forget_client(connection)
+                if client_data:
+                    usernames.append(client_data['username'])
+        
+        for connection in released:
+            self.release_connection(connection)
+        
+        for connection in connections:
+            try:
+                connection.abort()
+            except:
+                pass
+        
+        print(f"Отключено мертвых подключений: {len(connections)}")
+        if usernames:
+            self.broadcast_system(f"Отключены по таймауту: {', '.join(usernames)}")
+    
     def stop_server(self):
-        """Остановка сервера"""
+        """Остановка сервера (повторный вызов ничего не делает)"""
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
         print("Остановка сервера...")
+        self.reaper.stop()
         self.broadcast_system("Сервер останавливается")
         
         with self.lock:
@@ -572,20 +786,189 @@ class AuthChatServer:
                 except:
                     pass
             self.clients.clear()
+            self.room_members.clear()
             self.username_to_socket.clear()
         
         self.user_message_history.clear()
+        self.auth_pool.shutdown()
+        self.archiver.stop()
+        self.flush_pending_writes()
         self.db.close()
         
         if hasattr(self, 'server_socket'):
             self.server_socket.close()
+        if self.unix_socket is not None:
+            self.unix_socket.close()
+            try:
+                os.unlink(self.unix_path)
+            except OSError:
+                pass
         print("Сервер остановлен")
 
+def add_server_arguments(parser):
+    """Параметры сервера, общие для server.py и cluster.py"""
+    parser.add_argument(
+        '--queue-limit', type=int, default=DEFAULT_MAX_QUEUE_BYTES,
+        help="лимит очереди отправки на клиента, байт"
+    )
+    parser.add_argument(
+        '--overflow-policy', choices=OVERFLOW_POLICIES, default=POLICY_EVICT,
+        help="drop - отбрасывать сообщения медленному клиенту, evict - отключать его"
+    )
+    parser.add_argument(
+        '--auth-workers', type=int, default=DEFAULT_AUTH_WORKERS,
+        help="процессов для проверки паролей (bcrypt)"
+    )
+    parser.add_argument(
+        '--auth-queue-limit', type=int, default=DEFAULT_AUTH_QUEUE_LIMIT,
+        help="сколько входов может ждать проверки, остальным - 'сервер занят'"
+    )
+    parser.add_argument(
+        '--auth-timeout', type=float, default=DEFAULT_AUTH_TIMEOUT,
+        help="предельное время проверки пароля, секунд"
+    )
+    parser.add_argument(
+        '--session-ttl', type=int, default=DEFAULT_SESSION_TTL,
+        help="срок действия токена /resume, секунд"
+    )
+    parser.add_argument(
+        '--compress-threshold', type=int, default=DEFAULT_COMPRESS_THRESHOLD,
+        help="кадры от этого размера сжимаются для клиентов, запросивших zlib, байт"
+    )
+    parser.add_argument('--no-compression', action='store_true', help="не соглашаться на сжатие")
+    parser.add_argument(
+        '--ping-interval', type=float, default=DEFAULT_PING_INTERVAL,
+        help="через сколько секунд тишины слать клиенту ping"
+    )
+    parser.add_argument(
+        '--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+        help="отключать клиента, от которого ничего не приходило столько секунд"
+    )
+    parser.add_argument(
+        '--text-idle-timeout', type=float, default=DEFAULT_TEXT_IDLE_TIMEOUT,
+        help="то же для текстовых клиентов без кадров: им ping не шлется, поэтому предел больше"
+    )
+    parser.add_argument(
+        '--login-timeout', type=float, default=DEFAULT_LOGIN_TIMEOUT,
+        help="отключать подключение, не выполнившее вход за столько секунд"
+    )
+    parser.add_argument('--backlog', type=int, default=DEFAULT_BACKLOG, help="очередь listen()")
+    parser.add_argument(
+        '--max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS,
+        help="предел одновременных подключений, остальным - короткий отказ"
+    )
+    parser.add_argument(
+        '--max-per-ip', type=int, default=DEFAULT_MAX_PER_IP,
+        help="предел одновременных подключений с одного IP"
+    )
+    parser.add_argument(
+        '--ip-rate', type=float, default=DEFAULT_IP_RATE,
+        help="новых подключений в секунду с одного IP"
+    )
+    parser.add_argument(
+        '--ip-burst', type=int, default=DEFAULT_IP_BURST,
+        help="сколько подключений с IP можно открыть разом сверх --ip-rate"
+    )
+    parser.add_argument(
+        '--db-readers', type=int, default=DEFAULT_DB_READERS,
+        help="соединений SQLite для чтения (запись всегда через одно)"
+    )
+    parser.add_argument(
+        '--history-cache-size', type=int, default=DEFAULT_HISTORY_ROOM_SIZE,
+        help="последних сообщений каждой комнаты в памяти для истории при входе"
+    )
+    parser.add_argument(
+        '--history-cache-bytes', type=int, default=DEFAULT_HISTORY_CACHE_BYTES,
+        help="предел памяти кеша истории на все комнаты"
+    )
+    parser.add_argument(
+        '--user-cache-size', type=int, default=DEFAULT_USER_CACHE_SIZE,
+        help="пользователей в кеше соответствия id и имени"
+    )
+    parser.add_argument(
+        '--db-durability', choices=DURABILITY_MODES, default=DURABILITY_ASYNC,
+        help="сохранение сообщений: direct - commit на каждое, group - пачкой с ожиданием commit, "
+             "async - пачкой без ожидания"
+    )
+    parser.add_argument(
+        '--retention-interval', type=float, default=DEFAULT_RETENTION_INTERVAL,
+        help="секунд между проходами архивации старых сообщений (0 - только по /admin_archive)"
+    )
+    parser.add_argument(
+        '--private-retention-days', type=int, default=None,
+        help="через сколько дней прочитанные личные сообщения уходят в архив (по умолчанию хранятся всегда)"
+    )
+
+def server_options(args):
+    """Именованные аргументы сервера из разобранных параметров add_server_arguments"""
+    return {
+        'max_queue_bytes': args.queue_limit,
+        'overflow_policy': args.overflow_policy,
+        'auth_workers': args.auth_workers,
+        'auth_queue_limit': args.auth_queue_limit,
+        'auth_timeout': args.auth_timeout,
+        'session_ttl': args.session_ttl,
+        'compress_threshold': None if args.no_compression else args.compress_threshold,
+        'ping_interval': args.ping_interval,
+        'idle_timeout': args.idle_timeout,
+        'text_idle_timeout': args.text_idle_timeout,
+        'login_timeout': args.login_timeout,
+        'backlog': args.backlog,
+        'max_connections': args.max_connections,
+        'max_per_ip': args.max_per_ip,
+        'ip_rate': args.ip_rate,
+        'ip_burst': args.ip_burst,
+        'db_readers': args.db_readers,
+        'db_durability': args.db_durability,
+        'history_room_size': args.history_cache_size,
+        'history_cache_bytes': args.history_cache_bytes,
+        'user_cache_size': args.user_cache_size,
+        'retention_interval': args.retention_interval,
+        'private_retention_days': args.private_retention_days,
+    }
+
 if __name__ == "__main__":
-    server = AuthChatServer()
+    parser = argparse.ArgumentParser(description="Сервер мессенджера")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument(
+        '--mode', choices=['threads', 'async'], default='threads',
+        help="threads - поток на подключение, async - цикл событий asyncio"
+    )
+    add_server_arguments(parser)
+    parser.add_argument(
+        '--takeover', action='store_true',
+        help="принять слушающий сокет у работающего сервера (плавный перезапуск)"
+    )
+    parser.add_argument(
+        '--handoff-path', default=DEFAULT_HANDOFF_PATH,
+        help="Unix-сокет для передачи слушающего сокета при перезапуске"
+    )
+    parser.add_argument(
+        '--unix-socket', metavar='PATH',
+        help="дополнительно слушать Unix-сокет для клиентов на этой же машине"
+    )
+    args = parser.parse_args()
+    
+    options = server_options(args)
+    options.update({
+        'takeover': args.takeover,
+        'handoff_path': args.handoff_path,
+        'unix_path': args.unix_socket,
+    })
+    if args.mode == 'async':
+        from async_server import AsyncChatServer
+        server = AsyncChatServer(args.host, args.port, **options)
+    else:
+        server = AuthChatServer(args.host, args.port, **options)
+    
+    # Новый процесс запускается с теми же параметрами, --takeover добавляет restart_server()
+    server.restart_command = [sys.executable, os.path.abspath(__file__)] + [
+        arg for arg in sys.argv[1:] if arg != '--takeover'
+    ]
     
     try:
         server.start_server()
     except KeyboardInterrupt:
-        print("Получен сигнал прерывания")
-        server.stop_server()
\ No newline at end of file
+        # Сервер уже остановлен в finally у start_server()
+        print("Получен сигнал прерывания")
\ No newline at end of file
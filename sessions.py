@@ -0,0 +1,74 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+DEFAULT_SESSION_TTL = 12 * 60 * 60
+SESSION_SECRET_ENV = 'MESSENGER_SESSION_SECRET'
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+class SessionManager:
+    """Подписанные токены сессии для быстрого повторного входа без bcrypt.
+    
+    Токен - это base64(JSON с user_id, именем и сроком) и HMAC-SHA256 от него.
+    Сервер хранит только время отзыва для отключенных администратором:
+    проверка токена - одна HMAC и поиск в словаре, без базы данных.
+    Секрет берется из аргумента, переменной MESSENGER_SESSION_SECRET или
+    генерируется при запуске (тогда токены не переживают перезапуск).
+    """
+    
+    def __init__(self, secret=None, ttl=DEFAULT_SESSION_TTL):
+        if secret is None:
+            secret = os.environ.get(SESSION_SECRET_ENV)
+        if secret is None:
+            secret = os.urandom(32)
+        if isinstance(secret, str):
+            secret = secret.encode('utf-8')
+        
+        self.secret = secret
+        self.ttl = ttl
+        self.revoked = {}  # user_id -> время отзыва; более ранние токены недействительны
+    
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode('ascii'), hashlib.sha256).digest())
+    
+    def issue(self, user_id, username):
+        """Новый токен для пользователя"""
+        now = time.time()
+        data = {'uid': user_id, 'name': username, 'iat': now, 'exp': int(now) + self.ttl}
+        payload = _b64encode(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        return f"{payload}.{self._sign(payload)}"
+    
+    def verify(self, token):
+        """(user_id, username) для действующего токена, иначе None"""
+        try:
+            payload, signature = token.split('.')
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                return None
+            data = json.loads(_b64decode(payload))
+        except (ValueError, TypeError):
+            return None
+        
+        if data.get('exp', 0) < time.time():
+            return None
+        if data.get('iat', 0) <= self.revoked.get(data['uid'], -1):
+            return None
+        return data['uid'], data['name']
+    
+    def revoke(self, user_id, revoked_at=None):
+        """Отзыв всех выданных пользователю токенов. Возвращает время отзыва"""
+        now = time.time()
+        if revoked_at is None:
+            revoked_at = now
+        # Токены старше ttl истекли сами, их отзыв помнить не нужно
+        for uid in [uid for uid, at in self.revoked.items() if at < now - self.ttl]:
+            del self.revoked[uid]
+        self.revoked[user_id] = max(revoked_at, self.revoked.get(user_id, revoked_at))
+        return revoked_at
@@ -0,0 +1,149 @@
+import heapq
+import threading
+import time
+
+STATS_MAX_AGE = 5.0  # секунд; потом счетчики перечитываются из таблиц (их ведут и другие процессы)
+
+# Обновление счетчиков в той же транзакции, что и вставка сообщения
+USER_MESSAGE_SQL = '''
+    INSERT INTO user_stats (user_id, messages, last_active) VALUES (?, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id) DO UPDATE SET messages = messages + 1, last_active = excluded.last_active
+'''
+ROOM_MESSAGE_SQL = '''
+    INSERT INTO room_stats (room_id, messages, last_message_at) VALUES (?, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (room_id) DO UPDATE SET messages = messages + 1, last_message_at = excluded.last_message_at
+'''
+PRIVATE_SENT_SQL = '''
+    INSERT INTO user_stats (user_id, private_sent) VALUES (?, 1)
+    ON CONFLICT (user_id) DO UPDATE SET private_sent = private_sent + 1
+'''
+PRIVATE_RECEIVED_SQL = '''
+    INSERT INTO user_stats (user_id, private_received) VALUES (?, 1)
+    ON CONFLICT (user_id) DO UPDATE SET private_received = private_received + 1
+'''
+
+def create_stats_tables(cursor):
+    """Таблицы счетчиков пользователей и комнат"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            messages INTEGER NOT NULL DEFAULT 0,
+            private_sent INTEGER NOT NULL DEFAULT 0,
+            private_received INTEGER NOT NULL DEFAULT 0,
+            last_active TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS room_stats (
+            room_id INTEGER PRIMARY KEY,
+            messages INTEGER NOT NULL DEFAULT 0,
+            last_message_at TIMESTAMP
+        )
+    ''')
+
+def rebuild_stats(cursor):
+    """Пересчет счетчиков с нуля по таблицам сообщений"""
+    cursor.execute('DELETE FROM user_stats')
+    cursor.execute('DELETE FROM room_stats')
+    cursor.execute('''
+        INSERT INTO user_stats (user_id, messages, last_active)
+        SELECT user_id, COUNT(*), MAX(created_at) FROM messages GROUP BY user_id
+    ''')
+    # WHERE 1 нужен SQLite, чтобы отличить ON CONFLICT от условия JOIN
+    cursor.execute('''
+        INSERT INTO user_stats (user_id, private_sent)
+        SELECT from_user_id, COUNT(*) FROM private_messages WHERE 1 GROUP BY from_user_id
+        ON CONFLICT (user_id) DO UPDATE SET private_sent = excluded.private_sent
+    ''')
+    cursor.execute('''
+        INSERT INTO user_stats (user_id, private_received)
+        SELECT to_user_id, COUNT(*) FROM private_messages WHERE 1 GROUP BY to_user_id
+        ON CONFLICT (user_id) DO UPDATE SET private_received = excluded.private_received
+    ''')
+    cursor.execute('''
+        INSERT INTO room_stats (room_id, messages, last_message_at)
+        SELECT room_id, COUNT(*), MAX(created_at) FROM messages GROUP BY room_id
+    ''')
+
+class StatsCounters:
+    """Копия счетчиков в памяти: /myinfo, /debug_db и /admin_stats не ходят в базу.
+    
+    Запись сообщения сразу увеличивает счетчики здесь, а в таблицах - в
+    транзакции самой вставки. Раз в max_age секунд копия перечитывается
+    из таблиц, чтобы учесть сообщения, сохраненные другими воркерами.
+    """
+    
+    def __init__(self, max_age=STATS_MAX_AGE):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.users = {}  # user_id -> [сообщений, отправлено ЛС, получено ЛС, последняя активность]
+        self.rooms = {}  # room_id -> сообщений
+        self.total_users = 0
+        self.total_messages = 0
+        self.total_private = 0
+        self.loaded_at = 0.0
+    
+    def stale(self):
+        return time.monotonic() - self.loaded_at > self.max_age
+    
+    def load(self, conn):
+        users = {}
+        for user_id, messages, sent, received, last_active in conn.execute('''
+            SELECT user_id, messages, private_sent, private_received, last_active FROM user_stats
+        '''):
+            users[user_id] = [messages, sent, received, last_active]
+        rooms = dict(conn.execute('SELECT room_id, messages FROM room_stats'))
+        total_users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        
+        with self.lock:
+            self.users = users
+            self.rooms = rooms
+            self.total_users = total_users
+            self.total_messages = sum(rooms.values())
+            self.total_private = sum(counters[1] for counters in users.values())
+            self.loaded_at = time.monotonic()
+    
+    def _user(self, user_id):
+        """Счетчики пользователя (вызывать под self.lock)"""
+        counters = self.users.get(user_id)
+        if counters is None:
+            counters = self.users[user_id] = [0, 0, 0, None]
+        return counters
+    
+    def message_saved(self, user_id, room_id):
+        with self.lock:
+            counters = self._user(user_id)
+            counters[0] += 1
+            counters[3] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+            self.rooms[room_id] = self.rooms.get(room_id, 0) + 1
+            self.total_messages += 1
+    
+    def private_saved(self, from_user_id, to_user_id):
+        with self.lock:
+            self._user(from_user_id)[1] += 1
+            self._user(to_user_id)[2] += 1
+            self.total_private += 1
+    
+    def user_registered(self):
+        with self.lock:
+            self.total_users += 1
+    
+    def user(self, user_id):
+        """(сообщений в чатах, отправлено ЛС, получено ЛС)"""
+        with self.lock:
+            counters = self.users.get(user_id, (0, 0, 0, None))
+            return counters[0], counters[1], counters[2]
+    
+    def totals(self):
+        with self.lock:
+            return self.total_users, self.total_messages, self.total_private
+    
+    def room_counts(self):
+        with self.lock:
+            return dict(self.rooms)
+    
+    def top_users(self, limit):
+        """[(user_id, сообщений, последняя активность)] по убыванию числа сообщений"""
+        with self.lock:
+            ranked = heapq.nlargest(limit, self.users.items(), key=lambda item: item[1][0])
+            return [(user_id, counters[0], counters[3]) for user_id, counters in ranked]
@@ -0,0 +1,22 @@
+import pytest
+
+from database import Database
+from explain_queries import HOT_PATHS, fill, full_scans, query_plans
+from write_behind import DURABILITY_DIRECT
+
+@pytest.fixture(scope='module')
+def db(tmp_path_factory):
+    db = Database(str(tmp_path_factory.mktemp('explain') / 'explain.db'), durability=DURABILITY_DIRECT)
+    fill(db)
+    yield db
+    db.close()
+
+@pytest.mark.parametrize('name, call', HOT_PATHS, ids=[name for name, _ in HOT_PATHS])
+def test_hot_query_uses_index(db, name, call):
+    """Горячий запрос не проходит целиком по messages и private_messages"""
+    if name.startswith("поиск") and not db.search_enabled:
+        pytest.skip("SQLite собран без FTS5")
+    plans = query_plans(db, call)
+    assert plans, f"{name}: запросы не перехвачены"
+    for sql, plan in plans:
+        assert full_scans(sql, plan) == [], f"{name}: {' '.join(sql.split())}"
@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_USER_CACHE_SIZE = 10000  # пользователей
+
+class UserCacheStats:
+    """Попадания и промахи кеша пользователей"""
+    
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class UserCache:
+    """LRU-кеш соответствия id <-> имя пользователя.
+    
+    Пара хранится одной записью, доступной по обоим ключам, поэтому
+    вытеснение и сброс всегда убирают оба направления сразу.
+    """
+    
+    def __init__(self, max_size=DEFAULT_USER_CACHE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.by_id = OrderedDict()  # id -> имя, порядок - давность обращения
+        self.by_name = {}
+        self.stats = UserCacheStats()
+    
+    def __len__(self):
+        return len(self.by_id)
+    
+    def get_id(self, username):
+        with self.lock:
+            user_id = self.by_name.get(username)
+            if user_id is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            self.by_id.move_to_end(user_id)
+            return user_id
+    
+    def get_name(self, user_id):
+        with self.lock:
+            username = self.by_id.get(user_id)
+            if username is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            self.by_id.move_to_end(user_id)
+            return username
+    
+    def get_names(self, user_ids):
+        """{id: имя} для известных кешу id и множество остальных"""
+        found = {}
+        missing = set()
+        with self.lock:
+            for user_id in set(user_ids):
+                username = self.by_id.get(user_id)
+                if username is None:
+                    missing.add(user_id)
+                else:
+                    found[user_id] = username
+                    self.by_id.move_to_end(user_id)
+            self.stats.hits += len(found)
+            self.stats.misses += len(missing)
+        return found, missing
+    
+    def put(self, user_id, username):
+        with self.lock:
+            old_name = self.by_id.pop(user_id, None)
+            if old_name is not None:
+                self.by_name.pop(old_name, None)
+            self.by_id[user_id] = username
+            self.by_name[username] = user_id
+            while len(self.by_id) > self.max_size:
+                _, evicted_name = self.by_id.popitem(last=False)
+                self.by_name.pop(evicted_name, None)
+                self.stats.evictions += 1
+    
+    def invalidate(self, user_id=None, username=None):
+        """Сброс записи по любому из ключей (после регистрации, переименования, удаления)"""
+        with self.lock:
+            if user_id is None:
+                user_id = self.by_name.get(username)
+            username = self.by_id.pop(user_id, None) if user_id is not None else username
+            if username is not None:
+                self.by_name.pop(username, None)
@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Режимы сохранения сообщений
+DURABILITY_DIRECT = 'direct'  # INSERT и commit в потоке отправителя, как раньше
+DURABILITY_GROUP = 'group'  # пачкой, отправитель ждет commit своей пачки
+DURABILITY_ASYNC = 'async'  # пачкой, отправитель не ждет; id приходит во Future
+DURABILITY_MODES = (DURABILITY_DIRECT, DURABILITY_GROUP, DURABILITY_ASYNC)
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_BATCH_DELAY = 0.005  # секунд ожидания, пока набирается пачка
+
+class WriteBehindStats:
+    """Счетчики пачек записи"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.operations = 0
+        self.failed = 0
+        self.max_batch = 0
+        self.commit_time = 0.0
+    
+    def record(self, size, elapsed, failed=0):
+        with self.lock:
+            self.batches += 1
+            self.operations += size
+            self.failed += failed
+            self.max_batch = max(self.max_batch, size)
+            self.commit_time += elapsed
+    
+    def average_batch(self):
+        with self.lock:
+            return self.operations / self.batches if self.batches else 0.0
+
+class WriteBehindQueue:
+    """Отложенная запись: операции копятся в очереди и выполняются пачкой в одной транзакции.
+    
+    Операция - функция operation(conn), ее результат (например, lastrowid)
+    передается во Future. Операции выполняются строго в порядке постановки,
+    поэтому пометка прочитанным не обгонит сохранение самого сообщения.
+    Пачка закрывается по числу операций или через batch_delay после первой.
+    """
+    
+    def __init__(self, pool, batch_size=DEFAULT_BATCH_SIZE, batch_delay=DEFAULT_BATCH_DELAY):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.stats = WriteBehindStats()
+        self.queue = queue.Queue()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self.thread.start()
+    
+    @property
+    def pending(self):
+        return self.queue.qsize()
+    
+    def submit(self, operation):
+        """Постановка операции в очередь; возвращает Future с ее результатом"""
+        if self.closed:
+            raise RuntimeError("Очередь записи закрыта")
+        future = Future()
+        self.queue.put((operation, future))
+        return future
+    
+    def flush(self, timeout=None):
+        """Ожидание записи всего, что поставлено в очередь до вызова"""
+        if self.closed:
+            return
+        self.submit(None).result(timeout)
+    
+    def close(self):
+        """Запись оставшегося и остановка потока"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+    
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.batch_delay
+            while len(batch) < self.batch_size:
+                try:
+                    # Уже накопившееся забираем без ожидания
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            
+            self._commit(batch)
+            if stop:
+                return
+    
+    def _commit(self, batch):
+        start = time.perf_counter()
+        try:
+            with self.pool.write() as conn:
+                results = [operation(conn) if operation else None for operation, _ in batch]
+        except Exception:
+            # Пачка откатилась целиком: повторяем по одной, чтобы ошибка досталась только виновной
+            self._commit_one_by_one(batch, start)
+            return
+        
+        self.stats.record(len(batch), time.perf_counter() - start)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+    
+    def _commit_one_by_one(self, batch, start):
+        failed = 0
+        for operation, future in batch:
+            try:
+                with self.pool.write() as conn:
+                    result = operation(conn) if operation else None
+            except Exception as e:
+                failed += 1
+                print(f"Ошибка отложенной записи: {e}")
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        self.stats.record(len(batch), time.perf_counter() - start, failed)